@@ -8,6 +8,8 @@ from dataclasses import dataclass, asdict, field
 import datetime
 import pytz
 
+from gmaps_scraper.fields import extract_fields
+
 asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 # Set up logging
@@ -120,74 +122,7 @@ async def scrape_business(search_term, total):
                     await page.wait_for_timeout(
                         3000)  # Adjust this timeout as needed
 
-                    name_css_selector = 'h1.DUwDvf.lfPIob'
-                    address_xpath = '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'
-                    website_xpath = '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'
-                    phone_number_xpath = '//button[contains(@data-item-id, "phone")]//div[contains(@class, "fontBodyMedium")]'
-                    review_count_xpath = '//button[@jsaction="pane.reviewChart.moreReviews"]//span'
-                    reviews_average_xpath = '//div[@jsaction="pane.reviewChart.moreReviews"]//div[@role="img"]'
-
-                    business = Business()
-
-                    if await page.locator(name_css_selector).count() > 0:
-                        business.name = await page.locator(name_css_selector
-                                                           ).inner_text()
-                    else:
-                        business.name = ""
-
-                    if await page.locator(address_xpath).count() > 0:
-                        address_elements = await page.locator(address_xpath
-                                                              ).all()
-                        if address_elements:
-                            business.address = await address_elements[
-                                0].inner_text()
-                        else:
-                            business.address = ""
-                    else:
-                        business.address = ""
-
-                    if await page.locator(website_xpath).count() > 0:
-                        website_elements = await page.locator(website_xpath
-                                                              ).all()
-                        if website_elements:
-                            business.website = await website_elements[
-                                0].inner_text()
-                        else:
-                            business.website = ""
-                    else:
-                        business.website = ""
-
-                    if await page.locator(phone_number_xpath).count() > 0:
-                        phone_elements = await page.locator(phone_number_xpath
-                                                            ).all()
-                        if phone_elements:
-                            business.phone_number = await phone_elements[
-                                0].inner_text()
-                        else:
-                            business.phone_number = ""
-                    else:
-                        business.phone_number = ""
-
-                    if await page.locator(review_count_xpath).count() > 0:
-                        review_count_text = await page.locator(
-                            review_count_xpath).inner_text()
-                        business.reviews_count = int(
-                            review_count_text.split()[0].replace(',',
-                                                                 '').strip())
-                    else:
-                        business.reviews_count = None
-
-                    if await page.locator(reviews_average_xpath).count() > 0:
-                        reviews_average_text = await page.locator(
-                            reviews_average_xpath).get_attribute('aria-label')
-                        if reviews_average_text:
-                            business.reviews_average = float(
-                                reviews_average_text.split()[0].replace(
-                                    ',', '.').strip())
-                        else:
-                            business.reviews_average = None
-                    else:
-                        business.reviews_average = None
+                    business = Business(**await extract_fields(page))
 
                     business_list.business_list.append(business)
                 except Exception as e:
@@ -0,0 +1 @@
+"""Building blocks for the Google Maps business scraper"""
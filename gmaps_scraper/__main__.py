@@ -0,0 +1,428 @@
+"""Headless command line entry point.
+
+    python -m gmaps_scraper scrape "Coffee Shops in New York" --total 50
+    python -m gmaps_scraper scrape "coffee shops" --city "Austin, TX" --total 1000
+    python -m gmaps_scraper scrape "Coffee Shops in New York" --since output/
+    python -m gmaps_scraper batch input.txt --max-queries 3
+    python -m gmaps_scraper dedup output --out output/deduplicated.csv
+    python -m gmaps_scraper submit "Coffee Shops in Austin" --total 200 --wait
+    python -m gmaps_scraper worker --concurrency 4
+    python -m gmaps_scraper bootstrap
+
+Only argparse is imported up front; each command imports what it needs, so
+the CLI never loads Streamlit and only loads pandas for Excel export.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sys
+
+
+def parse_args(argv):
+    from .cache import CACHE_MODES, REFRESH_STALE
+    from .resource_filter import RESOURCE_POLICIES
+    from .writers import STREAM_FORMATS
+
+    parser = argparse.ArgumentParser(prog="python -m gmaps_scraper")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scrape = commands.add_parser("scrape",
+                                 help="Scrape the results of one search")
+    scrape.add_argument("search_term")
+    scrape.add_argument("--total", type=int, default=30)
+    scrape.add_argument("--concurrency",
+                        type=int,
+                        default=4,
+                        help="Detail pages scraped in parallel, per shard "
+                        "with --shards")
+    scrape.add_argument("--shards",
+                        type=int,
+                        default=0,
+                        help="Scrape details in this many processes, each "
+                        "with its own browser (default: this process)")
+    scrape.add_argument("--format",
+                        choices=STREAM_FORMATS,
+                        default="csv",
+                        help="Format of the file rows are streamed to")
+    scrape.add_argument("--excel",
+                        action="store_true",
+                        help="Also save an Excel file at the end")
+    scrape.add_argument("--parquet",
+                        action="store_true",
+                        help="Also save a Parquet file at the end")
+    scrape.add_argument("--feather",
+                        action="store_true",
+                        help="Also save a Feather file at the end")
+    scrape.add_argument("--cache-mode",
+                        choices=list(CACHE_MODES),
+                        default=REFRESH_STALE)
+    scrape.add_argument("--block",
+                        choices=list(RESOURCE_POLICIES),
+                        default="default",
+                        help="Resource blocking profile")
+    scrape.add_argument("--output", default="output")
+    scrape.add_argument("--maps-url",
+                        default=None,
+                        help="Maps home to search from instead of Google "
+                        "Maps, e.g. the fixture server's")
+    scrape.add_argument("--trace",
+                        default=None,
+                        help="Save a trace of the run to this file "
+                        "(.prom for Prometheus text, JSON otherwise)")
+    scrape.add_argument("--no-rate-limit",
+                        action="store_true",
+                        help="Navigate as fast as the pages allow")
+    scrape.add_argument("--retries",
+                        type=int,
+                        default=2,
+                        help="Attempts per failed listing after the first")
+    area = scrape.add_mutually_exclusive_group()
+    area.add_argument("--bbox",
+                      default=None,
+                      help="Search this area tile by tile: "
+                      "south,west,north,east in degrees")
+    area.add_argument("--city",
+                      default=None,
+                      help="Search this city or region tile by tile; its "
+                      "bounding box is looked up with OpenStreetMap")
+    scrape.add_argument("--grid",
+                        type=int,
+                        default=2,
+                        help="Area searches start from a grid x grid split")
+    scrape.add_argument("--tile-parallel",
+                        type=int,
+                        default=2,
+                        help="Tiles searched at the same time")
+    scrape.add_argument("--split-at",
+                        type=int,
+                        default=None,
+                        help="Split tiles whose feed returns this many "
+                        "listings (default 90%% of the feed cap)")
+    scrape.add_argument("--max-depth",
+                        type=int,
+                        default=3,
+                        help="Times a full tile may be split again")
+    scrape.add_argument("--since",
+                        default=None,
+                        help="Previous results file or directory: only "
+                        "scrape listings that are new or whose name or "
+                        "rating changed, and save a diff")
+    scrape.add_argument("--memory-bounded",
+                        action="store_true",
+                        help="Recycle pages and spill rows to disk so "
+                        "memory stays flat on very large jobs")
+    scrape.add_argument("--recycle-after",
+                        type=int,
+                        default=200,
+                        help="With --memory-bounded, listings per page "
+                        "before it is replaced")
+    scrape.add_argument("--max-rss-mb",
+                        type=float,
+                        default=None,
+                        help="With --memory-bounded, RSS of this process "
+                        "and its browsers that replaces every browser "
+                        "(needs psutil)")
+    scrape.add_argument("--spill-rows",
+                        type=int,
+                        default=5000,
+                        help="With --memory-bounded, rows kept in memory "
+                        "for exports before spilling to disk")
+    scrape.add_argument("--no-fail-fast",
+                        action="store_true",
+                        help="Keep scraping when the selectors for a "
+                        "required field stop matching")
+    scrape.add_argument("--keep-duplicates",
+                        action="store_true",
+                        help="Do not skip places already seen in this run")
+
+    # Listed for --help only; main() hands batch arguments straight to
+    # gmaps_scraper.batch
+    commands.add_parser("batch", help="Scrape every query in a file")
+
+    dedup = commands.add_parser(
+        "dedup", help="Deduplicate every result saved in a directory")
+    dedup.add_argument("directory", nargs="?", default="output")
+    dedup.add_argument("--out",
+                       default=None,
+                       help="csv or jsonl file for the unique businesses")
+
+    submit = commands.add_parser(
+        "submit", help="Queue a search or place URLs for worker processes")
+    submit.add_argument("search_term", nargs="?", default=None)
+    submit.add_argument("--total", type=int, default=30)
+    submit.add_argument("--bbox",
+                        default=None,
+                        help="Search this area tile by tile: "
+                        "south,west,north,east in degrees")
+    submit.add_argument("--urls",
+                        default=None,
+                        help="File of place URLs, one per line, to scrape "
+                        "instead of a search")
+    submit.add_argument("--broker",
+                        default=None,
+                        help="Broker path or URL (default: the SQLite "
+                        "broker under output/.cache)")
+    submit.add_argument("--wait",
+                        action="store_true",
+                        help="Stream the job's results to a file until "
+                        "every task is done")
+    submit.add_argument("--format", choices=STREAM_FORMATS, default="csv")
+    submit.add_argument("--output", default="output")
+
+    worker = commands.add_parser(
+        "worker", help="Scrape queued tasks until stopped")
+    worker.add_argument("--broker",
+                        default=None,
+                        help="Broker path or URL (default: the SQLite "
+                        "broker under output/.cache)")
+    worker.add_argument("--concurrency",
+                        type=int,
+                        default=4,
+                        help="Listings scraped in parallel")
+    worker.add_argument("--lease",
+                        type=float,
+                        default=120,
+                        help="Seconds before a dead worker's tasks are "
+                        "handed out again")
+    worker.add_argument("--exit-when-idle",
+                        action="store_true",
+                        help="Stop once no task is queued or running")
+    worker.add_argument("--cache-mode",
+                        choices=list(CACHE_MODES),
+                        default=REFRESH_STALE)
+    worker.add_argument("--block",
+                        choices=list(RESOURCE_POLICIES),
+                        default="default",
+                        help="Resource blocking profile")
+    worker.add_argument("--no-rate-limit",
+                        action="store_true",
+                        help="Navigate as fast as the pages allow")
+    worker.add_argument("--retries",
+                        type=int,
+                        default=2,
+                        help="Attempts per failed listing after the first")
+    worker.add_argument("--no-fail-fast",
+                        action="store_true",
+                        help="Keep scraping when the selectors for a "
+                        "required field stop matching")
+
+    bootstrap = commands.add_parser(
+        "bootstrap",
+        help="Install system packages, Playwright and its browsers")
+    bootstrap.add_argument("--skip-system",
+                           action="store_true",
+                           help="Do not install packages with apt-get")
+    return parser.parse_args(argv)
+
+
+async def scrape(args):
+    from dataclasses import asdict
+
+    from .browser_pool import MAPS_URL
+    from .cache import PlaceCache
+    from .core import BUSINESS_FIELD_NAMES, BusinessList, scrape_business
+    from .dedup import Deduplicator
+    from .rate_limiter import shared_rate_limiter
+    from .resource_filter import RESOURCE_POLICIES
+    from .selector_registry import SelectorRegistry
+    from .tracing import Tracer
+    from .writers import open_writer
+
+    maps_url = args.maps_url or MAPS_URL
+    discoverer = None
+    if args.bbox or args.city:
+        from .tiling import TiledDiscoverer, geocode, parse_bbox
+        area = parse_bbox(args.bbox) if args.bbox else geocode(args.city)
+        discoverer = TiledDiscoverer(args.search_term,
+                                     area,
+                                     grid=args.grid,
+                                     parallel=args.tile_parallel,
+                                     max_depth=args.max_depth,
+                                     maps_url=maps_url)
+        if args.split_at is not None:
+            discoverer.split_at = args.split_at
+        print(f"Searching {area} tile by tile")
+    snapshot = None
+    if args.since:
+        from .recrawl import Snapshot
+        snapshot = Snapshot.load(args.since)
+        print(f"Comparing against {len(snapshot)} places in {args.since}")
+
+    memory = None
+    if args.memory_bounded:
+        from .memory import MemoryBudget
+        memory = MemoryBudget(recycle_after=args.recycle_after,
+                              max_rss_mb=args.max_rss_mb,
+                              spill_rows=args.spill_rows)
+    selectors = SelectorRegistry(fail_fast=not args.no_fail_fast)
+
+    current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    search_for_filename = args.search_term.replace(' ', '_')
+    business_list = BusinessList(
+        spill_rows=memory.spill_rows if memory is not None else None)
+    business_list.save_at = args.output
+    tracer = Tracer() if args.trace else None
+    business_list.tracer = tracer
+    exports = [(label, save) for label, save, wanted in (
+        ("Excel", business_list.save_to_excel, args.excel),
+        ("Parquet", business_list.save_to_parquet, args.parquet),
+        ("Feather", business_list.save_to_feather, args.feather),
+    ) if wanted]
+
+    try:
+        with PlaceCache() as cache, \
+                open_writer(args.output,
+                            f"{current_datetime}__({search_for_filename})",
+                            BUSINESS_FIELD_NAMES, args.format) as writer:
+            async for business in scrape_business(
+                    args.search_term,
+                    args.total,
+                    args.concurrency,
+                    cache=cache,
+                    cache_mode=args.cache_mode,
+                    resource_policy=RESOURCE_POLICIES[args.block],
+                    deduplicator=None
+                    if args.keep_duplicates else Deduplicator(),
+                    tracer=tracer,
+                    maps_url=maps_url,
+                    rate_limiter=None
+                    if args.no_rate_limit else shared_rate_limiter(),
+                    retries=args.retries,
+                    discoverer=discoverer,
+                    shards=args.shards,
+                    snapshot=snapshot,
+                    memory=memory,
+                    selectors=selectors):
+                writer.write(asdict(business))
+                if exports or snapshot is not None:
+                    business_list.append(business)
+    finally:
+        print(f"Selectors: {selectors.summary()}")
+    print(f"{writer.rows} rows -> {writer.path}")
+    if discoverer is not None:
+        print(f"Tiles: {discoverer.tiles_searched} searched, "
+              f"{discoverer.tiles_split} split")
+    if not args.no_rate_limit:
+        print(f"Rate limit: {shared_rate_limiter().summary()}")
+    if memory is not None:
+        print(f"Memory: {memory.summary()}")
+
+    filename = f"({business_list.get_row_size()}_Rows)__" \
+               f"{current_datetime}__({search_for_filename})"
+    for label, save in exports:
+        print(f"{label} -> {save(filename)}")
+    if tracer is not None:
+        print(f"Trace -> {tracer.save(args.trace)}")
+    if snapshot is not None:
+        from .recrawl import save_diff, summarize
+        diff = snapshot.diff(business_list)
+        path = save_diff(
+            diff, f"{args.output}/{current_datetime}__"
+            f"({search_for_filename})__diff.json")
+        print(f"{snapshot.unchanged} unchanged, {summarize(diff)} -> {path}")
+
+
+async def submit(args):
+    from .broker import collect_results, open_broker, submit_search, \
+        submit_urls
+    from .core import BUSINESS_FIELD_NAMES, business_from_record
+    from .dedup import Deduplicator
+    from .writers import open_writer
+
+    with open_broker(args.broker) as broker:
+        if args.urls:
+            with open(args.urls, encoding='utf-8') as file:
+                urls = [line.strip() for line in file if line.strip()]
+            job_id = submit_urls(broker, urls, os.path.basename(args.urls))
+            print(f"Queued {len(urls)} place URLs as job {job_id}")
+        else:
+            job_id = submit_search(broker, args.search_term, args.total,
+                                   args.bbox)
+            print(f"Queued {args.search_term!r} as job {job_id}")
+        if not args.wait:
+            return
+
+        current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        deduplicator = Deduplicator()
+        with open_writer(args.output, f"{current_datetime}__job_{job_id}",
+                         BUSINESS_FIELD_NAMES, args.format) as writer:
+            async for record in collect_results(broker, job_id):
+                if deduplicator.is_new(business_from_record(record)):
+                    writer.write(record)
+        print(f"{writer.rows} rows -> {writer.path}")
+        print(f"Tasks: {broker.counts(job_id)}")
+
+
+async def work(args):
+    from .broker import open_broker, run_worker
+    from .cache import CACHE_OFF, PlaceCache
+    from .rate_limiter import shared_rate_limiter
+    from .resource_filter import RESOURCE_POLICIES
+    from .selector_registry import SelectorRegistry
+
+    selectors = SelectorRegistry(fail_fast=not args.no_fail_fast)
+    with open_broker(args.broker) as broker, PlaceCache() as cache:
+        handled = await run_worker(
+            broker,
+            args.concurrency,
+            args.lease,
+            args.exit_when_idle,
+            cache=None if args.cache_mode == CACHE_OFF else cache,
+            cache_mode=args.cache_mode,
+            resource_policy=RESOURCE_POLICIES[args.block],
+            rate_limiter=None
+            if args.no_rate_limit else shared_rate_limiter(),
+            retries=args.retries,
+            selectors=selectors)
+    print(f"{handled['done']} tasks done, {handled['failed']} failed")
+    print(f"Selectors: {selectors.summary()}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    if argv[:1] == ["batch"]:
+        from . import batch
+        asyncio.run(batch.main(argv[1:]))
+        return 0
+
+    args = parse_args(argv)
+    from .selector_registry import SelectorHealthError
+    if args.command == "bootstrap":
+        from .bootstrap import bootstrap
+        return 0 if bootstrap(not args.skip_system) else 1
+    if args.command == "dedup":
+        from .dedup import dedup_history
+        records = dedup_history(args.directory, args.out)
+        print(f"{len(records)} unique businesses"
+              + (f" -> {args.out}" if args.out else ""))
+        return 0
+    if args.command == "submit":
+        if (args.search_term is None) == (args.urls is None):
+            print("submit needs either a search term or --urls")
+            return 2
+        asyncio.run(submit(args))
+        return 0
+    if args.command == "worker":
+        try:
+            asyncio.run(work(args))
+        except KeyboardInterrupt:
+            # Leased tasks were handed back when the worker was cancelled
+            pass
+        except SelectorHealthError as e:
+            print(f"Stopped: {e}")
+            return 1
+        return 0
+    try:
+        asyncio.run(scrape(args))
+    except SelectorHealthError as e:
+        print(f"Stopped: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Batch mode: run many search queries through one job queue.
+
+Queries are read from a text file (one per line, as in input.txt), a CSV
+file with a `query` column or a JSONL file of {"query": ..., "total": ...}
+objects. At most `max_queries` queries run at once, each scraping with up to
+`concurrency` pages; the browser pool's page limit caps the pages in use
+across all queries. Every query gets its own output file, and a combined,
+deduplicated file is written at the end.
+
+    python -m gmaps_scraper batch input.txt --total 50 --max-queries 3
+"""
+import argparse
+import asyncio
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass
+
+from .dedup import Deduplicator
+from .writers import STREAM_FORMATS, open_writer
+
+QUERY_FORMATS = ("txt", "csv", "jsonl")
+
+
+@dataclass
+class BatchQuery:
+    """One search to run in a batch"""
+    query: str
+    total: int = 30
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one query in a batch"""
+    query: BatchQuery
+    rows: int = 0
+    path: str = None
+    error: str = None
+
+
+def parse_queries(text, fmt, default_total=30):
+    """Parses queries from the text of a txt, csv or jsonl file"""
+    if fmt not in QUERY_FORMATS:
+        raise ValueError(f"Unsupported query file format: {fmt}")
+    queries = []
+    if fmt == "txt":
+        for line in text.splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                queries.append(BatchQuery(line, default_total))
+    elif fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        column = next((name for name in ("query", "search_term")
+                       if name in (reader.fieldnames or [])),
+                      (reader.fieldnames or [None])[0])
+        for row in reader:
+            if row.get(column):
+                queries.append(
+                    BatchQuery(row[column].strip(),
+                               int(row.get("total") or default_total)))
+    else:
+        for line in text.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                queries.append(
+                    BatchQuery(record["query"].strip(),
+                               int(record.get("total", default_total))))
+    return queries
+
+
+def read_queries(path, default_total=30):
+    """Reads queries from a file, picking the format from its extension"""
+    fmt = os.path.splitext(path)[1].lstrip('.').lower() or "txt"
+    with open(path, encoding='utf-8') as file:
+        return parse_queries(file.read(), fmt, default_total)
+
+
+def query_filename(index, query):
+    slug = re.sub(r'[^\w]+', '_', query.query).strip('_')[:80]
+    return f"{index:03d}_{slug}"
+
+
+async def run_batch(queries,
+                    scrape,
+                    output_dir,
+                    fieldnames,
+                    max_queries=2,
+                    stream_format="csv"):
+    """Runs every query through `scrape(query)`, which must return an async
+    iterator of Business objects. Returns the per-query results and the path
+    of the combined, deduplicated file."""
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported output format: {stream_format}")
+    queue = asyncio.Queue()
+    for index, query in enumerate(queries):
+        queue.put_nowait((index, query))
+    results = [BatchResult(query) for query in queries]
+    # Overlapping queries return the same places, often with different
+    # place URLs, so the combined file goes through entity resolution
+    deduplicator = Deduplicator()
+    combined = []
+
+    async def query_worker():
+        while not queue.empty():
+            index, query = queue.get_nowait()
+            result = results[index]
+            logging.info(f"Batch query {index + 1}/{len(queries)}: "
+                         f"{query.query}")
+            try:
+                with open_writer(output_dir, query_filename(index, query),
+                                 fieldnames, stream_format) as writer:
+                    result.path = writer.path
+                    async for business in scrape(query):
+                        record = asdict(business)
+                        writer.write(record)
+                        result.rows = writer.rows
+                        if deduplicator.is_new(business):
+                            combined.append(record)
+            except Exception as e:
+                result.error = str(e)
+                logging.error(f"Batch query '{query.query}' failed: {e}")
+
+    await asyncio.gather(*(query_worker()
+                           for _ in range(min(max_queries, len(queries)))))
+
+    combined_path = None
+    if combined:
+        with open_writer(output_dir, "combined", fieldnames,
+                         stream_format) as writer:
+            for record in combined:
+                writer.write(record)
+            combined_path = writer.path
+        logging.info(f"Batch finished: {len(combined)} unique businesses "
+                     f"in {combined_path}")
+    return results, combined_path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m gmaps_scraper batch",
+        description="Scrape every query in a txt, csv or jsonl file")
+    parser.add_argument("queries", help="Path to the query file")
+    parser.add_argument("--total",
+                        type=int,
+                        default=30,
+                        help="Results per query when the file has no total")
+    parser.add_argument("--max-queries",
+                        type=int,
+                        default=2,
+                        help="Queries scraped at the same time")
+    parser.add_argument("--concurrency",
+                        type=int,
+                        default=4,
+                        help="Detail pages per query")
+    parser.add_argument("--max-pages",
+                        type=int,
+                        default=8,
+                        help="Browser pages open across all queries")
+    parser.add_argument("--format", choices=STREAM_FORMATS, default="csv")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    # Imported here so the query parsing above stays usable without the
+    # scraper's dependencies
+    from .browser_pool import BrowserPool
+    from .cache import PlaceCache
+    from .core import BUSINESS_FIELD_NAMES, scrape_business
+    from .rate_limiter import shared_rate_limiter
+    from .selector_registry import SelectorRegistry
+
+    queries = read_queries(args.queries, args.total)
+    rate_limiter = shared_rate_limiter()
+    output_dir = args.output or (
+        "output/batch_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+    async with BrowserPool(pages_per_browser=args.max_pages,
+                           rewarm=False) as pool:
+        with PlaceCache() as cache:
+            results, combined_path = await run_batch(
+                queries,
+                lambda query: scrape_business(query.query,
+                                              query.total,
+                                              args.concurrency,
+                                              cache=cache,
+                                              pool=pool,
+                                              rate_limiter=rate_limiter,
+                                              selectors=SelectorRegistry()),
+                output_dir,
+                BUSINESS_FIELD_NAMES,
+                max_queries=args.max_queries,
+                stream_format=args.format)
+    for result in results:
+        status = result.error or f"{result.rows} rows -> {result.path}"
+        print(f"{result.query.query}: {status}")
+    print(f"Combined: {combined_path}")
+    print(f"Rate limit: {rate_limiter.summary()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,585 @@
+"""Benchmarks for the scraper's data paths.
+
+    python -m gmaps_scraper.benchmark businesslist --rows 10000 100000 1000000
+    python -m gmaps_scraper.benchmark excel --rows 10000 100000
+    python -m gmaps_scraper.benchmark scrape --results 30 120 --concurrency 1 4 8
+    python -m gmaps_scraper.benchmark resources --policies default off
+    python -m gmaps_scraper.benchmark shards --shards 1 2 4
+    python -m gmaps_scraper.benchmark memory --results 2000 --max-growth-mb 100
+
+The scrape, resources, shards and memory benchmarks run against the local
+fixture server, so they need Chromium but no network access.
+
+Each measurement runs in a fresh interpreter, so its peak RSS is not
+inflated by the measurements before it.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None where the resource
+    module is missing (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def synthetic_business(index):
+    from .core import Business
+    return Business(name=f"Business {index}",
+                    address=f"{index} Main St, Springfield",
+                    website=f"https://business{index}.example.com",
+                    phone_number=f"+1 555-{index % 10000:04d}",
+                    reviews_average=round(1 + index % 40 / 10, 1),
+                    place_url=f"https://www.google.com/maps/place/{index}")
+
+
+def build_rows(rows):
+    """The original BusinessList: a list of Business objects turned into a
+    DataFrame through one asdict() per row and pd.json_normalize"""
+    import pandas as pd
+    businesses = [synthetic_business(index) for index in range(rows)]
+    return pd.json_normalize(
+        (asdict(business) for business in businesses), sep="_")
+
+
+def build_columns(rows):
+    from .core import BusinessList
+    business_list = BusinessList()
+    for index in range(rows):
+        business_list.append(synthetic_business(index))
+    return business_list.dataframe()
+
+
+def build_arrow(rows):
+    from .core import BusinessList
+    business_list = BusinessList()
+    for index in range(rows):
+        business_list.append(synthetic_business(index))
+    return business_list.arrow_table()
+
+
+BUSINESSLIST_BACKENDS = {
+    "rows": build_rows,
+    "columns": build_columns,
+    "arrow": build_arrow,
+}
+
+
+def measure_businesslist(backend, rows):
+    """Builds `rows` businesses with one backend in this process"""
+    rows = int(rows)
+    # Import everything up front so no backend is charged for imports
+    import pandas  # noqa: F401
+    from . import core  # noqa: F401
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        if backend == "arrow":
+            return {"backend": backend, "rows": rows, "error": "no pyarrow"}
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    BUSINESSLIST_BACKENDS[backend](rows)
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    return {
+        "backend": backend,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": peak and round(peak, 1),
+        "baseline_rss_mb": baseline and round(baseline, 1),
+    }
+
+
+def export_pandas(business_list, file):
+    """The original export: a DataFrame written by pandas to_excel"""
+    business_list.dataframe().to_excel(file, index=False)
+
+
+def export_openpyxl(business_list, file):
+    business_list.write_excel(file, engine="openpyxl")
+
+
+def export_xlsxwriter(business_list, file):
+    business_list.write_excel(file, engine="xlsxwriter")
+
+
+EXCEL_BACKENDS = {
+    "pandas": export_pandas,
+    "openpyxl": export_openpyxl,
+    "xlsxwriter": export_xlsxwriter,
+}
+
+
+def measure_excel(backend, rows):
+    """Exports `rows` businesses to an in-memory xlsx file with one
+    backend in this process"""
+    import io
+
+    import pandas  # noqa: F401
+    import openpyxl  # noqa: F401
+
+    from .core import BusinessList
+    rows = int(rows)
+    business_list = BusinessList()
+    for index in range(rows):
+        business_list.append(synthetic_business(index))
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    try:
+        EXCEL_BACKENDS[backend](business_list, buffer)
+    except ImportError as e:
+        return {"backend": backend, "rows": rows, "error": str(e)}
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    return {
+        "backend": backend,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": peak and round(peak, 1),
+        "baseline_rss_mb": baseline and round(baseline, 1),
+        "size_mb": round(len(buffer.getvalue()) / (1024 * 1024), 1),
+    }
+
+
+# 5 ms latency buckets up to 10 s, for percentiles finer than the tracer's
+# defaults
+FINE_BUCKETS_MS = tuple(range(5, 10_001, 5))
+
+
+class TreeMemorySampler:
+    """Samples the summed RSS of this process's children, which are the
+    browser processes, from a background thread, keeping every sample in
+    `samples`. Needs psutil; without it the peak is None."""
+
+    def __init__(self, interval=0.2, include_self=False):
+        self.interval = interval
+        self.include_self = include_self
+        self.peak_mb = None
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            import psutil
+        except ImportError:
+            return
+        process = psutil.Process()
+        while not self._stop.wait(self.interval):
+            total = process.memory_info().rss if self.include_self else 0
+            for child in process.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.samples.append(total / (1024 * 1024))
+            self.peak_mb = max(self.peak_mb or 0, self.samples[-1])
+
+    def steady_mb(self):
+        """Median of the second half of the samples, once startup is over"""
+        tail = sorted(self.samples[len(self.samples) // 2:])
+        return tail[len(tail) // 2] if tail else None
+
+    def growth_mb(self):
+        """How much the last quarter of the run used over the second
+        quarter; near zero when memory is flat"""
+        quarter = len(self.samples) // 4
+        if not quarter:
+            return None
+        second = self.samples[quarter:2 * quarter]
+        last = self.samples[-quarter:]
+        return sum(last) / len(last) - sum(second) / len(second)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def measure_scrape(results,
+                   concurrency,
+                   policy="default",
+                   latency_ms=0,
+                   shards=0):
+    """Scrapes one search from the fixture server with a fresh browser, or
+    with `shards` browser processes"""
+    import asyncio
+
+    from .core import scrape_business
+    from .fixture_server import FixtureServer
+    from .resource_filter import RESOURCE_POLICIES, ResourceStats
+    from .tracing import Tracer
+    results, concurrency = int(results), int(concurrency)
+    shards = int(shards)
+    tracer = Tracer(histogram_bounds=FINE_BUCKETS_MS)
+    resource_stats = ResourceStats()
+
+    async def scrape(maps_url):
+        return [
+            business async for business in scrape_business(
+                "benchmark",
+                results,
+                concurrency,
+                resource_policy=RESOURCE_POLICIES[policy],
+                resource_stats=resource_stats,
+                tracer=tracer,
+                maps_url=maps_url,
+                shards=shards)
+        ]
+
+    with FixtureServer(results=results,
+                       latency_ms=int(latency_ms),
+                       feed_latency_ms=50) as server, \
+            TreeMemorySampler() as sampler:
+        start = time.perf_counter()
+        rows = asyncio.run(scrape(server.maps_url))
+        seconds = time.perf_counter() - start
+
+    listing = tracer.histograms.get("listing")
+    navigate = tracer.spans.get("navigate")
+    peak = peak_rss_mb()
+    pages = concurrency * max(shards, 1) + 1
+    return {
+        "results": results,
+        "concurrency": concurrency,
+        "shards": shards,
+        "policy": policy,
+        "rows": len(rows),
+        "seconds": round(seconds, 2),
+        "listings_per_s": round(len(rows) / seconds, 2),
+        "p50_ms": listing and listing.quantile(0.5),
+        "p95_ms": listing and listing.quantile(0.95),
+        "navigate_ms": navigate and round(navigate.mean_ms, 1),
+        "blocked": sum(resource_stats.blocked.values()),
+        # What the fixture server sent, after the browsers' HTTP cache
+        "served_mb": round(sum(server.bytes_served.values()) / 1024 / 1024,
+                           1),
+        "script_fetches": server.requests["script"],
+        "peak_rss_mb": peak and round(peak, 1),
+        "browser_peak_mb": sampler.peak_mb and round(sampler.peak_mb, 1),
+        # The search page plus one page per detail worker. The sampled
+        # processes include the Playwright driver, and the shard processes
+        # with shards, so this is an upper bound
+        "browser_mb_per_page": sampler.peak_mb
+        and round(sampler.peak_mb / pages, 1),
+        "error": None if rows else "no listings scraped, see the log",
+    }
+
+
+def measure_memory(results, concurrency, mode="bounded", latency_ms=0):
+    """Scrapes a large search from the fixture server, sampling the RSS of
+    this process and its browsers throughout. "bounded" recycles pages and
+    spills rows as --memory-bounded does; "off" keeps everything."""
+    import asyncio
+
+    from .core import BusinessList, scrape_business
+    from .fixture_server import FixtureServer
+    from .memory import MemoryBudget
+    results, concurrency = int(results), int(concurrency)
+    memory = MemoryBudget(spill_rows=500) if mode == "bounded" else None
+    business_list = BusinessList(
+        spill_rows=memory.spill_rows if memory is not None else None)
+
+    async def scrape(maps_url):
+        async for business in scrape_business("benchmark",
+                                              results,
+                                              concurrency,
+                                              cache_mode="off",
+                                              maps_url=maps_url,
+                                              memory=memory):
+            business_list.append(business)
+
+    with FixtureServer(results=results,
+                       latency_ms=int(latency_ms),
+                       feed_latency_ms=50) as server, \
+            TreeMemorySampler(interval=0.5, include_self=True) as sampler:
+        start = time.perf_counter()
+        asyncio.run(scrape(server.maps_url))
+        seconds = time.perf_counter() - start
+
+    def rounded(value):
+        return value if value is None else round(value, 1)
+
+    return {
+        "results": results,
+        "mode": mode,
+        "rows": len(business_list),
+        "seconds": round(seconds, 2),
+        "peak_mb": rounded(sampler.peak_mb),
+        "steady_mb": rounded(sampler.steady_mb()),
+        "growth_mb": rounded(sampler.growth_mb()),
+        "python_peak_mb": rounded(peak_rss_mb()),
+        "page_recycles": memory and memory.page_recycles,
+        "error": None if len(business_list) else
+        "no listings scraped, see the log",
+    }
+
+
+MEASUREMENTS = {
+    "businesslist": measure_businesslist,
+    "excel": measure_excel,
+    "scrape": measure_scrape,
+    "memory": measure_memory,
+}
+
+
+def run_isolated(name, *args):
+    """Runs one measurement in a child interpreter and returns its result"""
+    completed = subprocess.run(
+        [sys.executable, "-m", "gmaps_scraper.benchmark", "--child", name] +
+        [str(arg) for arg in args],
+        capture_output=True,
+        text=True)
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines() or ["failed"]
+        return {"args": list(args), "error": lines[-1][:120]}
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def print_table(results, columns):
+    print("  ".join(f"{column:>15}" for column in columns))
+    for result in results:
+        print("  ".join(f"{str(result.get(column, '')):>15}"
+                        for column in columns))
+
+
+def businesslist(args):
+    results = []
+    for rows in args.rows:
+        for backend in args.backends:
+            results.append(run_isolated("businesslist", backend, rows))
+    print_table(results,
+                ("rows", "backend", "seconds", "peak_rss_mb", "error"))
+    return results
+
+
+def excel(args):
+    results = []
+    for rows in args.rows:
+        for backend in args.backends:
+            results.append(run_isolated("excel", backend, rows))
+    print_table(results, ("rows", "backend", "seconds", "peak_rss_mb",
+                          "size_mb", "error"))
+    return results
+
+
+SCRAPE_COLUMNS = ("results", "concurrency", "policy", "rows", "seconds",
+                  "listings_per_s", "p50_ms", "p95_ms", "navigate_ms",
+                  "blocked", "served_mb", "script_fetches",
+                  "browser_peak_mb", "browser_mb_per_page", "error")
+
+
+def scrape(args):
+    results = []
+    for count in args.results:
+        for concurrency in args.concurrency:
+            results.append(
+                run_isolated("scrape", count, concurrency, "default",
+                             args.latency_ms))
+    print_table(results, SCRAPE_COLUMNS)
+    return results
+
+
+def resources(args):
+    results = []
+    for policy in args.policies:
+        results.append(
+            run_isolated("scrape", args.results, args.concurrency, policy,
+                         args.latency_ms))
+    print_table(results, SCRAPE_COLUMNS)
+    return results
+
+
+SHARD_COLUMNS = ("shards", "concurrency", "rows", "seconds",
+                 "listings_per_s", "speedup", "browser_peak_mb", "error")
+
+
+def shards(args):
+    """Scrapes the same search with each shard count; 0 is the single
+    process baseline that speedups are relative to"""
+    results = [
+        run_isolated("scrape", args.results, args.concurrency, "default",
+                     args.latency_ms, count) for count in args.shards
+    ]
+    baseline = results[0].get("listings_per_s")
+    for result in results:
+        if baseline and result.get("listings_per_s"):
+            result["speedup"] = round(result["listings_per_s"] / baseline, 2)
+    print_table(results, SHARD_COLUMNS)
+    return results
+
+
+MEMORY_COLUMNS = ("results", "mode", "rows", "seconds", "peak_mb",
+                  "steady_mb", "growth_mb", "python_peak_mb",
+                  "page_recycles", "error")
+# Default limits for the bounded memory run: the process tree of a
+# 4-page scrape, and RSS creep between its second and last quarter
+MAX_PEAK_MB = 1536
+MAX_GROWTH_MB = 100
+
+
+def memory(args):
+    """Measures each mode and fails when a bounded run breaks the limits"""
+    results = [
+        run_isolated("memory", args.results, args.concurrency, mode,
+                     args.latency_ms) for mode in args.modes
+    ]
+    print_table(results, MEMORY_COLUMNS)
+    failures = []
+    for result in results:
+        if result.get("mode") != "bounded":
+            continue
+        if result.get("error"):
+            failures.append(f"bounded run failed: {result['error']}")
+        for key, limit in (("peak_mb", args.max_peak_mb),
+                           ("growth_mb", args.max_growth_mb)):
+            value = result.get(key)
+            if limit and value is not None and value > limit:
+                failures.append(f"{key} {value} is over {limit}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    args.failed = bool(failures)
+    return results
+
+
+def parse_args(argv):
+    from .resource_filter import RESOURCE_POLICIES
+
+    parser = argparse.ArgumentParser(prog="python -m gmaps_scraper.benchmark")
+    parser.add_argument("--json",
+                        default=None,
+                        help="Also write the results to this file")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    business_list = benchmarks.add_parser(
+        "businesslist",
+        help="BusinessList construction time and peak RSS")
+    business_list.add_argument("--rows",
+                               type=int,
+                               nargs="+",
+                               default=[10_000, 100_000, 1_000_000])
+    business_list.add_argument("--backends",
+                               nargs="+",
+                               choices=list(BUSINESSLIST_BACKENDS),
+                               default=list(BUSINESSLIST_BACKENDS))
+    business_list.set_defaults(run=businesslist)
+
+    excel_export = benchmarks.add_parser(
+        "excel", help="xlsx export time and peak RSS")
+    excel_export.add_argument("--rows",
+                              type=int,
+                              nargs="+",
+                              default=[10_000, 100_000])
+    excel_export.add_argument("--backends",
+                              nargs="+",
+                              choices=list(EXCEL_BACKENDS),
+                              default=list(EXCEL_BACKENDS))
+    excel_export.set_defaults(run=excel)
+
+    scrape_run = benchmarks.add_parser(
+        "scrape",
+        help="Listings/sec, per-listing latency and memory against the "
+        "fixture server")
+    scrape_run.add_argument("--results",
+                            type=int,
+                            nargs="+",
+                            default=[30, 120])
+    scrape_run.add_argument("--concurrency",
+                            type=int,
+                            nargs="+",
+                            default=[1, 4, 8])
+    scrape_run.add_argument("--latency-ms",
+                            type=int,
+                            default=50,
+                            help="Delay the fixture server adds per request")
+    scrape_run.set_defaults(run=scrape)
+
+    resource_run = benchmarks.add_parser(
+        "resources",
+        help="Page-load latency, bytes served and memory per page by "
+        "blocking profile")
+    resource_run.add_argument("--results", type=int, default=30)
+    resource_run.add_argument("--concurrency", type=int, default=4)
+    resource_run.add_argument("--latency-ms", type=int, default=50)
+    resource_run.add_argument("--policies",
+                              nargs="+",
+                              choices=list(RESOURCE_POLICIES),
+                              default=list(RESOURCE_POLICIES))
+    resource_run.set_defaults(run=resources)
+
+    shard_run = benchmarks.add_parser(
+        "shards",
+        help="Listings/sec from one process up to one shard per core")
+    shard_run.add_argument("--results", type=int, default=120)
+    shard_run.add_argument("--concurrency",
+                           type=int,
+                           default=4,
+                           help="Detail pages per shard")
+    shard_run.add_argument("--latency-ms", type=int, default=50)
+    shard_run.add_argument(
+        "--shards",
+        type=int,
+        nargs="+",
+        default=[0] + sorted({2**n
+                              for n in range(8) if 2**n < os.cpu_count()}
+                             | {os.cpu_count()}),
+        help="Shard counts; 0 scrapes in the benchmark process")
+    shard_run.set_defaults(run=shards)
+
+    memory_run = benchmarks.add_parser(
+        "memory",
+        help="Peak and steady-state RSS of a large scrape, with limits "
+        "for regression checks")
+    memory_run.add_argument("--results", type=int, default=2000)
+    memory_run.add_argument("--concurrency", type=int, default=4)
+    memory_run.add_argument("--latency-ms", type=int, default=0)
+    memory_run.add_argument("--modes",
+                            nargs="+",
+                            choices=("bounded", "off"),
+                            default=["bounded", "off"])
+    memory_run.add_argument("--max-peak-mb",
+                            type=float,
+                            default=MAX_PEAK_MB,
+                            help="Fail if the bounded run's peak RSS of "
+                            "the process tree is higher (0 = no limit)")
+    memory_run.add_argument("--max-growth-mb",
+                            type=float,
+                            default=MAX_GROWTH_MB,
+                            help="Fail if the bounded run's RSS grows more "
+                            "than this between its second and last quarter "
+                            "(0 = no limit)")
+    memory_run.set_defaults(run=memory)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--child"]:
+        print(json.dumps(MEASUREMENTS[argv[1]](*argv[2:])))
+        return 0
+    args = parse_args(argv)
+    results = args.run(args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    return 1 if getattr(args, "failed", False) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
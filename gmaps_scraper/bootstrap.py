@@ -0,0 +1,57 @@
+"""One-time environment setup: the system libraries Chromium needs, the
+Playwright package and its browsers.
+
+    python -m gmaps_scraper bootstrap
+"""
+import logging
+import os
+import shutil
+import subprocess
+import sys
+
+# Same list as packages.txt, which Streamlit Cloud and the dev container
+# install on their own
+SYSTEM_PACKAGES = (
+    "libnss3", "libatk1.0-0", "libatk-bridge2.0-0", "libx11-xcb1",
+    "libxcomposite1", "libxcursor1", "libxdamage1", "libxfixes3", "libxi6",
+    "libxrandr2", "libgbm1", "libasound2", "libpangocairo-1.0-0",
+    "libpango-1.0-0", "libgdk-pixbuf2.0-0", "libgtk-3-0", "libdrm2")
+
+
+def run(command):
+    logging.info(f"Running: {' '.join(command)}")
+    return subprocess.run(command, check=False).returncode == 0
+
+
+def install_system_packages():
+    """Installs the Chromium runtime libraries with apt-get, when available"""
+    if shutil.which("apt-get") is None:
+        logging.info("apt-get not found, skipping system packages")
+        return True
+    sudo = [] if os.geteuid() == 0 else ["sudo"]
+    return (run(sudo + ["apt-get", "update"])
+            and run(sudo + ["apt-get", "install", "-y", *SYSTEM_PACKAGES]))
+
+
+def install_playwright():
+    return run([sys.executable, "-m", "pip", "install", "playwright"])
+
+
+def install_browsers():
+    """Downloads the Chromium build Playwright drives. Returns quickly when
+    it is already installed."""
+    return run([sys.executable, "-m", "playwright", "install", "chromium"])
+
+
+def bootstrap(system_packages=True):
+    ok = True
+    if system_packages:
+        ok = install_system_packages() and ok
+    ok = install_playwright() and ok
+    ok = install_browsers() and ok
+    return ok
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if bootstrap("--skip-system" not in sys.argv) else 1)
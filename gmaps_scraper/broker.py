@@ -0,0 +1,485 @@
+"""Task queue for running scrapes on headless worker processes.
+
+The app or CLI submits a search (or a list of place URLs) as a job; any
+number of workers, on this machine or others sharing the broker, lease
+tasks, scrape them and store the results, which the submitter collects.
+A search task turns into one listing task per place it finds, so listings
+are spread over every worker. Leases are renewed while a worker is busy and
+expire if it dies, after which another worker picks the task up.
+
+    python -m gmaps_scraper worker --concurrency 4
+    python -m gmaps_scraper submit "Coffee Shops in Austin" --total 200 --wait
+
+SqliteBroker is the default and serves any number of worker processes on
+one host; SQLite's write-ahead log does not work over network filesystems,
+so workers on other hosts need a backend built on a shared service, which
+only has to implement the Broker methods.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+
+from .cache import REFRESH_STALE, place_key
+from .discovery import ListingDiscovery
+
+SEARCH = "search"
+LISTING = "listing"
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Task:
+    """A leased unit of work"""
+    task_id: int
+    job_id: str
+    kind: str
+    payload: dict
+    attempts: int
+    worker: str = None
+
+
+class Broker(ABC):
+    """Interface every broker backend implements"""
+
+    @abstractmethod
+    def create_job(self, label):
+        """Registers a job and returns its id"""
+
+    @abstractmethod
+    def submit(self, job_id, kind, payload, key=None):
+        """Queues a task; returns False if the job already has a task with
+        the same key"""
+
+    @abstractmethod
+    def lease(self, worker, kinds, lease_s):
+        """Hands out the oldest queued task of one of `kinds`, or one whose
+        lease has expired, or returns None"""
+
+    @abstractmethod
+    def renew(self, worker, lease_s):
+        """Extends the leases of every task the worker holds"""
+
+    @abstractmethod
+    def complete(self, task, result=None):
+        """Marks the task done, storing its result. Returns False, dropping
+        the result, when the task's lease has passed to another worker"""
+
+    @abstractmethod
+    def fail(self, task, error):
+        """Queues the task again, or marks it failed once it has used up its
+        attempts"""
+
+    @abstractmethod
+    def release(self, worker):
+        """Queues the tasks of a worker that is shutting down again"""
+
+    @abstractmethod
+    def results(self, job_id, after=0):
+        """Returns (sequence, result) for the job's listings finished after
+        the one numbered `after`, in the order they finished"""
+
+    @abstractmethod
+    def counts(self, job_id=None):
+        """Returns {status: tasks} for a job, or for every job"""
+
+    @abstractmethod
+    def jobs(self):
+        """Returns (job_id, label, created_at) for every job, newest first"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SqliteBroker(Broker):
+    """Broker backed by one SQLite file.
+
+    Leasing runs in an immediate transaction, so two processes never lease
+    the same task. A task is retried until it has been leased
+    `max_attempts` times.
+    """
+
+    def __init__(self, path='output/.cache/broker.sqlite', max_attempts=3):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_attempts = max_attempts
+        # Transactions are managed explicitly; workers call in from the
+        # browser pool's thread
+        self.connection = sqlite3.connect(path,
+                                          timeout=30,
+                                          isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS broker_jobs (
+                job_id TEXT PRIMARY KEY,
+                label TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                key TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                -- Numbers tasks in the order they finish
+                done_seq INTEGER,
+                UNIQUE (job_id, key)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_by_status
+                ON tasks (status, kind, task_id);
+            CREATE INDEX IF NOT EXISTS tasks_by_completion
+                ON tasks (job_id, done_seq);
+            """)
+
+    def create_job(self, label):
+        job_id = uuid.uuid4().hex[:12]
+        self.connection.execute("INSERT INTO broker_jobs VALUES (?, ?, ?)",
+                                (job_id, label, time.time()))
+        return job_id
+
+    def submit(self, job_id, kind, payload, key=None):
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO tasks (job_id, kind, payload, key, status, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), key, QUEUED, time.time()))
+        return cursor.rowcount == 1
+
+    def lease(self, worker, kinds, lease_s):
+        now = time.time()
+        marks = ", ".join("?" for _ in kinds)
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that have used up their attempts give up
+            connection.execute(
+                "UPDATE tasks SET status = ?, error = 'lease expired', "
+                "updated_at = ? WHERE status = ? AND lease_until < ? "
+                "AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts))
+            row = connection.execute(
+                f"SELECT task_id, job_id, kind, payload, attempts FROM tasks "
+                f"WHERE kind IN ({marks}) AND (status = ? "
+                f"OR (status = ? AND lease_until < ?)) "
+                f"ORDER BY task_id LIMIT 1",
+                (*kinds, QUEUED, LEASED, now)).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE tasks SET status = ?, worker = ?, "
+                    "lease_until = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE task_id = ?",
+                    (LEASED, worker, now + lease_s, now, row[0]))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        task_id, job_id, kind, payload, attempts = row
+        return Task(task_id, job_id, kind, json.loads(payload), attempts + 1,
+                    worker)
+
+    def renew(self, worker, lease_s):
+        now = time.time()
+        self.connection.execute(
+            "UPDATE tasks SET lease_until = ? WHERE worker = ? AND status = ?",
+            (now + lease_s, worker, LEASED))
+
+    def complete(self, task, result=None):
+        # As in fail(), a worker whose lease expired must not overwrite the
+        # result of the worker that leased the task next
+        cursor = self.connection.execute(
+            "UPDATE tasks SET status = ?, result = ?, updated_at = ?, "
+            "done_seq = (SELECT COALESCE(MAX(done_seq), 0) + 1 FROM tasks) "
+            "WHERE task_id = ? AND worker = ? AND status = ?",
+            (DONE, None if result is None else json.dumps(result),
+             time.time(), task.task_id, task.worker, LEASED))
+        return cursor.rowcount == 1
+
+    def fail(self, task, error):
+        status = FAILED if task.attempts >= self.max_attempts else QUEUED
+        # A task whose lease expired may already belong to another worker
+        self.connection.execute(
+            "UPDATE tasks SET status = ?, error = ?, worker = NULL, "
+            "updated_at = ? WHERE task_id = ? AND worker = ? AND status = ?",
+            (status, str(error), time.time(), task.task_id, task.worker,
+             LEASED))
+
+    def release(self, worker):
+        self.connection.execute(
+            "UPDATE tasks SET status = ?, worker = NULL, "
+            "attempts = attempts - 1, updated_at = ? "
+            "WHERE worker = ? AND status = ?",
+            (QUEUED, time.time(), worker, LEASED))
+
+    def results(self, job_id, after=0):
+        rows = self.connection.execute(
+            "SELECT done_seq, result FROM tasks WHERE job_id = ? AND kind = ? "
+            "AND done_seq > ? ORDER BY done_seq",
+            (job_id, LISTING, after)).fetchall()
+        return [(sequence, json.loads(result)) for sequence, result in rows
+                if result is not None]
+
+    def counts(self, job_id=None):
+        if job_id is None:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        else:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE job_id = ? "
+                "GROUP BY status", (job_id, ))
+        return dict(rows.fetchall())
+
+    def jobs(self):
+        return self.connection.execute(
+            "SELECT job_id, label, created_at FROM broker_jobs "
+            "ORDER BY created_at DESC").fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
+def open_broker(url=None):
+    """Opens the broker at `url`; a plain path or sqlite:///path selects
+    SqliteBroker, the default"""
+    if url is None:
+        return SqliteBroker()
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    elif "://" in url:
+        raise ValueError(f"Unsupported broker: {url}")
+    return SqliteBroker(url)
+
+
+def submit_search(broker, search_term, total, area=None):
+    """Queues a search; workers queue its listings as they find them"""
+    label = search_term if area is None else f"{search_term} in {area}"
+    job_id = broker.create_job(label)
+    broker.submit(job_id, SEARCH, {
+        "search_term": search_term,
+        "total": total,
+        "area": area,
+    })
+    return job_id
+
+
+def submit_urls(broker, urls, label="place URLs"):
+    """Queues place URLs to be scraped without a search"""
+    job_id = broker.create_job(label)
+    for url in urls:
+        broker.submit(job_id, LISTING, {"url": url}, place_key(url))
+    return job_id
+
+
+def finished(broker, job_id):
+    counts = broker.counts(job_id)
+    return not counts.get(QUEUED) and not counts.get(LEASED)
+
+
+async def collect_results(broker, job_id, poll_s=1.0):
+    """Yields each result record of the job as workers finish it, until no
+    task of the job is left queued or leased"""
+    after = 0
+    while True:
+        # Check before reading, so results stored just before the job
+        # finished are still read
+        done = finished(broker, job_id)
+        for after, record in broker.results(job_id, after):
+            yield record
+        if done:
+            return
+        await asyncio.sleep(poll_s)
+
+
+class QueuedDiscovery(ListingDiscovery):
+    """Discovery for a search task that queues every place it finds as a
+    listing task of the same job"""
+
+    def __init__(self, broker, job_id, total):
+        super().__init__(total)
+        self.broker = broker
+        self.job_id = job_id
+
+    def add(self, hrefs):
+        start = len(self.urls)
+        super().add(hrefs)
+        for url in self.urls[start:]:
+            self.broker.submit(self.job_id, LISTING, {"url": url},
+                               place_key(url))
+
+
+class LeasedListings:
+    """Stands in for a ListingDiscovery in core.detail_worker: next() leases
+    listing tasks from the broker and returns (task, url) pairs.
+
+    Returns None once `stopping` is set, or with `exit_when_idle` once the
+    broker has nothing queued or leased.
+    """
+
+    def __init__(self, broker, worker, lease_s, exit_when_idle=False,
+                 poll_s=1.0):
+        self.broker = broker
+        self.worker = worker
+        self.lease_s = lease_s
+        self.exit_when_idle = exit_when_idle
+        self.poll_s = poll_s
+        self.stopping = asyncio.Event()
+
+    async def next(self):
+        while not self.stopping.is_set():
+            task = self.broker.lease(self.worker, (LISTING, ), self.lease_s)
+            if task is not None:
+                return task, task.payload["url"]
+            if self.exit_when_idle and finished(self.broker, None):
+                return None
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.poll_s)
+            except asyncio.TimeoutError:
+                pass
+        return None
+
+
+async def run_worker(broker,
+                     concurrency=4,
+                     lease_s=120,
+                     exit_when_idle=False,
+                     cache=None,
+                     cache_mode=REFRESH_STALE,
+                     resource_policy=None,
+                     rate_limiter=None,
+                     retries=2,
+                     pool=None,
+                     poll_s=1.0,
+                     selectors=None):
+    """Scrapes leased tasks until cancelled, or until the broker is idle
+    with `exit_when_idle`. One coroutine runs searches while `concurrency`
+    detail workers scrape listings, reading and writing `cache` according to
+    `cache_mode`. Returns {status: tasks handled}. Raises
+    SelectorHealthError once the selector registry has failed; the tasks
+    this worker held are released for others."""
+    # Submitting jobs does not need Playwright, only running them does
+    from .browser_pool import BrowserPool
+    from .core import ScrapeProgress, detail_worker, discover_listings
+
+    if pool is None:
+        async with BrowserPool(pages_per_browser=concurrency + 1,
+                               rewarm=False) as pool:
+            return await run_worker(broker, concurrency, lease_s,
+                                    exit_when_idle, cache, cache_mode,
+                                    resource_policy, rate_limiter, retries,
+                                    pool, poll_s, selectors)
+
+    worker = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    listings = LeasedListings(broker, worker, lease_s, exit_when_idle, poll_s)
+    handled = {DONE: 0, FAILED: 0}
+
+    async def search():
+        while not listings.stopping.is_set():
+            task = broker.lease(worker, (SEARCH, ), lease_s)
+            if task is None:
+                if exit_when_idle and finished(broker, None):
+                    return
+                await asyncio.sleep(poll_s)
+                continue
+            payload = task.payload
+            discovery = QueuedDiscovery(broker, task.job_id,
+                                        payload["total"])
+            try:
+                if payload.get("area"):
+                    from .tiling import TiledDiscoverer, parse_bbox
+                    discoverer = TiledDiscoverer(payload["search_term"],
+                                                 parse_bbox(payload["area"]),
+                                                 parallel=1)
+                    await discoverer(pool, discovery, None, resource_policy,
+                                     None, None, rate_limiter)
+                else:
+                    await discover_listings(pool, payload["search_term"],
+                                            discovery, None, resource_policy,
+                                            rate_limiter=rate_limiter)
+                if broker.complete(task):
+                    handled[DONE] += 1
+                else:
+                    logging.warning(f"Dropped search {payload['search_term']}"
+                                    f": its lease expired")
+            except Exception as e:
+                logging.error(f"Error occurred while searching "
+                              f"{payload['search_term']}: {e}")
+                broker.fail(task, e)
+                handled[FAILED] += 1
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease_s / 3)
+            broker.renew(worker, lease_s)
+
+    finished_listings = asyncio.Queue()
+    detail_workers = [
+        asyncio.create_task(
+            detail_worker(pool, listings, finished_listings,
+                          ScrapeProgress(), None, cache,
+                          cache_mode,
+                          resource_policy=resource_policy,
+                          rate_limiter=rate_limiter,
+                          retries=retries,
+                          selectors=selectors)) for _ in range(concurrency)
+    ]
+    background = [
+        asyncio.create_task(search()),
+        asyncio.create_task(heartbeat())
+    ]
+    logging.info(f"Worker {worker} started")
+    try:
+        running = len(detail_workers)
+        while running:
+            item = await finished_listings.get()
+            if item is None:
+                running -= 1
+                if selectors is not None:
+                    selectors.check()
+                continue
+            task, business = item
+            if business is None:
+                broker.fail(task, "scrape failed")
+                handled[FAILED] += 1
+            elif broker.complete(task, asdict(business)):
+                handled[DONE] += 1
+            else:
+                logging.warning(f"Dropped listing {task.payload['url']}: its "
+                                f"lease expired")
+        await background[0]
+    finally:
+        listings.stopping.set()
+        for task in detail_workers + background:
+            task.cancel()
+        await asyncio.gather(*detail_workers,
+                             *background,
+                             return_exceptions=True)
+        broker.release(worker)
+        logging.info(f"Worker {worker} stopped: {handled[DONE]} tasks done, "
+                     f"{handled[FAILED]} failed")
+    return handled
@@ -0,0 +1,305 @@
+"""Warm pool of Chromium pages that can outlive a single scrape.
+
+Streamlit reruns the script, and with it asyncio.run(), on every interaction.
+Playwright objects are bound to the event loop that created them, so a pool
+meant to survive reruns runs on its own event loop thread and scrapes are
+submitted to it with BrowserPool.run().
+"""
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from playwright.async_api import async_playwright
+
+MAPS_URL = "https://www.google.com/maps"
+
+HEAP_SIZE_JS = """
+() => performance.memory ? performance.memory.usedJSHeapSize : 0
+"""
+
+
+def is_maps_home(url, maps_url=MAPS_URL):
+    """True when the page sits on the Maps home view with no search open"""
+    parts = urlsplit(url)
+    home = urlsplit(maps_url)
+    return (parts.netloc == home.netloc
+            and (parts.path.rstrip('/') == home.path.rstrip('/')
+                 or parts.path.startswith(home.path.rstrip('/') + "/@")))
+
+
+@dataclass
+class PooledBrowser:
+    """A browser instance with its single context and usage counters"""
+    browser: object
+    context: object
+    uses: int = 0
+    leased: int = 0
+    retiring: bool = False
+    heap_bytes: dict = field(default_factory=dict)
+
+    @property
+    def heap_mb(self):
+        return sum(self.heap_bytes.values()) / (1024 * 1024)
+
+
+class BrowserPool:
+    """Hands out Chromium pages, reusing them across scrapes.
+
+    Browsers are launched lazily up to `browsers`, each serving up to
+    `pages_per_browser` pages. Idle pages are health checked before they are
+    handed out. A browser is recycled once it has served `max_uses` leases or
+    its pages' JS heaps exceed `max_memory_mb`. With `rewarm`, released pages
+    navigate back to the Maps home in the background so the next search
+    skips the navigation.
+    """
+
+    def __init__(self,
+                 browsers=1,
+                 pages_per_browser=8,
+                 max_uses=100,
+                 max_memory_mb=512,
+                 headless=True,
+                 rewarm=True,
+                 warm_url=MAPS_URL):
+        self.browsers = browsers
+        self.pages_per_browser = pages_per_browser
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.headless = headless
+        self.rewarm = rewarm
+        self.warm_url = warm_url
+        self.launches = 0
+        self.recycled = 0
+        self._playwright = None
+        self._pooled = []
+        self._idle = []
+        self._available = None
+        self._warming = set()
+        self._loop = None
+        self._thread = None
+
+    @classmethod
+    def in_background(cls, **kwargs):
+        """Creates a pool whose browsers live on a dedicated event loop
+        thread, and starts warming one page"""
+        pool = cls(**kwargs)
+        pool._loop = asyncio.new_event_loop()
+        pool._thread = threading.Thread(target=pool._loop.run_forever,
+                                        name="browser-pool",
+                                        daemon=True)
+        pool._thread.start()
+        asyncio.run_coroutine_threadsafe(pool.warm_up(), pool._loop)
+        return pool
+
+    async def run(self, coroutine):
+        """Awaits a coroutine that uses this pool on the pool's own loop"""
+        if self._thread is None:
+            return await coroutine
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(coroutine, self._loop))
+
+    async def stream(self, generator):
+        """Iterates an async generator that uses this pool on the pool's own
+        loop, forwarding each item to the caller's loop as it is produced.
+
+        As with a local generator, the generator only resumes once the caller
+        asks for the next item, so any bookkeeping it does after a yield
+        happens after the caller has handled that item."""
+        if self._thread is None:
+            async for item in generator:
+                yield item
+            return
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        async def forward():
+            try:
+                async for item in generator:
+                    resumed = asyncio.Event()
+                    loop.call_soon_threadsafe(queue.put_nowait,
+                                              (item, resumed))
+                    await resumed.wait()
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        future = asyncio.run_coroutine_threadsafe(forward(), self._loop)
+        try:
+            while (entry := await queue.get()) is not done:
+                item, resumed = entry
+                yield item
+                self._loop.call_soon_threadsafe(resumed.set)
+            future.result()
+        finally:
+            future.cancel()
+
+    def stats(self):
+        """Returns counters describing the pool's current state"""
+        return {
+            "browsers": len(self._pooled),
+            "idle_pages": len(self._idle),
+            "leased_pages": sum(pooled.leased for pooled in self._pooled),
+            "launches": self.launches,
+            "recycled": self.recycled,
+        }
+
+    def recycle_browsers(self):
+        """Retires every open browser. Leased pages keep working and are
+        closed when released; new leases get a fresh browser once the old
+        ones have closed."""
+        for pooled in self._pooled:
+            pooled.retiring = True
+        self._idle = []
+
+    async def start(self):
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+            self._available = asyncio.Condition()
+        return self
+
+    async def warm_up(self, pages=1):
+        """Opens pages on the warm URL ahead of the first scrape"""
+        await self.start()
+        for _ in range(pages):
+            async with self._available:
+                pooled = await self._browser_with_capacity()
+                if pooled is None:
+                    return
+                page = await pooled.context.new_page()
+            await self._rewarm(pooled, page)
+
+    async def close(self):
+        for pooled in list(self._pooled):
+            await self._close_browser(pooled)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @asynccontextmanager
+    async def page(self):
+        """Leases a page for the duration of the block"""
+        await self.start()
+        pooled, page = await self._acquire()
+        try:
+            yield page
+        finally:
+            await self._release(pooled, page)
+
+    async def _acquire(self):
+        async with self._available:
+            while True:
+                while self._idle:
+                    pooled, page = self._idle.pop()
+                    if await self._healthy(pooled, page):
+                        break
+                    await self._discard(pooled, page, notify=False)
+                else:
+                    pooled = await self._browser_with_capacity()
+                    if pooled is None:
+                        await self._available.wait()
+                        continue
+                    page = await pooled.context.new_page()
+                pooled.uses += 1
+                pooled.leased += 1
+                return pooled, page
+
+    async def _release(self, pooled, page):
+        pooled.leased -= 1
+        try:
+            pooled.heap_bytes[page] = await asyncio.wait_for(
+                page.evaluate(HEAP_SIZE_JS), 5)
+        except Exception:
+            pooled.heap_bytes.pop(page, None)
+
+        if (pooled.uses >= self.max_uses
+                or pooled.heap_mb > self.max_memory_mb):
+            if not pooled.retiring:
+                logging.info(f"Recycling browser after {pooled.uses} uses "
+                             f"({pooled.heap_mb:.0f} MB JS heap)")
+            pooled.retiring = True
+
+        if pooled.retiring or page.is_closed():
+            await self._discard(pooled, page)
+        elif self.rewarm:
+            task = asyncio.get_running_loop().create_task(
+                self._rewarm(pooled, page))
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+        else:
+            await self._make_idle(pooled, page)
+
+    async def _rewarm(self, pooled, page):
+        try:
+            await page.goto(self.warm_url, timeout=60000)
+            await page.wait_for_selector('#searchboxinput', timeout=15000)
+        except Exception as e:
+            logging.warning(f"Failed to warm pooled page: {e}")
+        await self._make_idle(pooled, page)
+
+    async def _make_idle(self, pooled, page):
+        async with self._available:
+            self._idle.append((pooled, page))
+            self._available.notify()
+
+    async def _healthy(self, pooled, page):
+        if pooled.retiring or page.is_closed():
+            return False
+        if not pooled.browser.is_connected():
+            return False
+        try:
+            await asyncio.wait_for(page.evaluate("1"), 5)
+            return True
+        except Exception:
+            return False
+
+    async def _discard(self, pooled, page, notify=True):
+        pooled.heap_bytes.pop(page, None)
+        try:
+            await page.close()
+        except Exception:
+            pass
+        if pooled.retiring and pooled.leased == 0:
+            await self._close_browser(pooled)
+        if notify:
+            # A page slot or a browser slot has been freed
+            async with self._available:
+                self._available.notify()
+
+    async def _browser_with_capacity(self):
+        for pooled in list(self._pooled):
+            if not pooled.browser.is_connected():
+                pooled.retiring = True
+            if pooled.retiring and pooled.leased == 0:
+                await self._close_browser(pooled)
+        for pooled in self._pooled:
+            if (not pooled.retiring and
+                    len(pooled.context.pages) < self.pages_per_browser):
+                return pooled
+        if len(self._pooled) >= self.browsers:
+            return None
+        browser = await self._playwright.chromium.launch(
+            headless=self.headless)
+        pooled = PooledBrowser(browser, await browser.new_context())
+        self._pooled.append(pooled)
+        self.launches += 1
+        return pooled
+
+    async def _close_browser(self, pooled):
+        if pooled in self._pooled:
+            self._pooled.remove(pooled)
+            self.recycled += 1
+        self._idle = [entry for entry in self._idle if entry[0] is not pooled]
+        try:
+            await pooled.browser.close()
+        except Exception:
+            pass
@@ -0,0 +1,126 @@
+"""Persistent SQLite cache of scraped places keyed by their /maps/place URL.
+
+Entries expire after a TTL and the table is kept under a size bound by
+evicting the least recently used places.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import unquote, urlsplit
+
+# Reuse fresh entries and only scrape listings that are new or expired
+REFRESH_STALE = "stale"
+# Scrape every listing again and overwrite its entry
+REFRESH_ALL = "all"
+# Neither read nor write the cache
+CACHE_OFF = "off"
+
+CACHE_MODES = {
+    REFRESH_STALE: "Refresh stale only",
+    REFRESH_ALL: "Refresh all",
+    CACHE_OFF: "Off",
+}
+
+PLACE_ID_PATTERN = re.compile(r'!1s(0x[0-9a-f]+:0x[0-9a-f]+)')
+
+
+def place_key(url):
+    """Returns a stable key for a place URL. The feature id embedded in the
+    data segment is preferred, since the rest of the URL varies with the
+    search that found the place."""
+    url = unquote(url)
+    match = PLACE_ID_PATTERN.search(url)
+    if match:
+        return match.group(1)
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}".rstrip('/')
+
+
+class PlaceCache:
+    """Stores Business records as JSON, keyed by place URL"""
+
+    def __init__(self,
+                 path='output/.cache/places.sqlite',
+                 ttl=24 * 60 * 60,
+                 max_entries=50000):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # The connection may be handed to the browser pool's thread; it is
+        # only ever used by one thread at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS places (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                record TEXT NOT NULL,
+                scraped_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS places_accessed_at "
+            "ON places (accessed_at)")
+        self.connection.commit()
+
+    def get(self, url):
+        """Returns the cached record for the URL, or None if it is missing
+        or older than the TTL"""
+        key = place_key(url)
+        row = self.connection.execute(
+            "SELECT record, scraped_at FROM places WHERE key = ?",
+            (key, )).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute(
+            "UPDATE places SET accessed_at = ? WHERE key = ?", (now, key))
+        self.connection.commit()
+        return json.loads(row[0])
+
+    def put(self, url, record):
+        """Stores a record (a dict of Business fields) for the URL"""
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?)",
+            (place_key(url), url, json.dumps(record), now, now))
+        self.connection.commit()
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones beyond
+        max_entries. Returns the number of entries removed."""
+        cursor = self.connection.execute(
+            "DELETE FROM places WHERE scraped_at < ?",
+            (time.time() - self.ttl, ))
+        removed = cursor.rowcount
+        cursor = self.connection.execute(
+            """DELETE FROM places WHERE key IN (
+                   SELECT key FROM places ORDER BY accessed_at DESC
+                   LIMIT -1 OFFSET ?)""", (self.max_entries, ))
+        removed += cursor.rowcount
+        self.connection.commit()
+        if removed:
+            logging.info(f"Evicted {removed} entries from the place cache")
+        return removed
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM places").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
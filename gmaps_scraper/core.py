@@ -0,0 +1,692 @@
+"""Scraper core: the Business model, its exports and scrape_business.
+
+Importing this module has no side effects and does not import Streamlit or
+pandas, so command line runs start quickly. The Streamlit app in
+main_setVal.py and the CLI in gmaps_scraper.__main__ are both built on it.
+"""
+import asyncio
+import io
+import itertools
+import logging
+import os
+import pickle
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from dataclasses import asdict, dataclass, field, fields
+
+from .browser_pool import MAPS_URL, BrowserPool, is_maps_home
+from .cache import CACHE_OFF, REFRESH_STALE
+from .discovery import ListingDiscovery
+from .fields import extract_fields, specs_for
+from .rate_limiter import BlockedError, backoff_delay, detect_block
+from .resource_filter import RESOURCE_POLICIES, filter_resources
+from .selector_registry import SelectorHealthError
+from .tracing import trace
+from .waits import (wait_for_place, wait_for_results, wait_for_search_box,
+                    wait_for_search_term)
+
+
+@dataclass(slots=True)
+class Business:
+    """Holds business data"""
+    name: str = None
+    address: str = None
+    website: str = None
+    phone_number: str = None
+    # reviews_count: int = None
+    reviews_average: float = None
+    place_url: str = None
+
+    def __eq__(self, other):
+        if not isinstance(other, Business):
+            return NotImplemented
+        return (self.name, self.address, self.website, self.phone_number,
+                self.reviews_average) == \
+               (other.name, other.address, other.website, other.phone_number,
+                 other.reviews_average)
+
+    def __hash__(self):
+        return hash((self.name, self.address, self.website, self.phone_number,
+                     self.reviews_average))
+
+
+@dataclass
+class ScrapeProgress:
+    """Live counters that can be read while scrape_business is running"""
+    found: int = 0
+    done: int = 0
+    cached: int = 0
+
+    @property
+    def fraction(self):
+        return self.done / self.found if self.found else 0.0
+
+
+BUSINESS_FIELD_NAMES = tuple(business_field.name
+                             for business_field in fields(Business))
+
+
+def _empty_columns():
+    return {name: [] for name in BUSINESS_FIELD_NAMES}
+
+
+@dataclass
+class BusinessList:
+    """Holds Business data column by column, and saves to Excel, CSV,
+    Parquet and Feather.
+
+    With `spill_rows`, every `spill_rows` rows are moved from memory to a
+    chunk file in a temporary directory. Iteration and Excel export read the
+    chunks back one at a time; DataFrames and Arrow tables load them all.
+    """
+    # One list per Business field; DataFrames and Arrow tables are built
+    # straight from these instead of from a dict per row
+    columns: dict[str, list] = field(default_factory=_empty_columns)
+    spill_rows: int = None
+    # Chunk files of spilled rows, oldest first
+    chunks: list[str] = field(default_factory=list)
+    spilled: int = 0
+    save_at = 'output'
+    # Set to a Tracer to time the exports
+    tracer = None
+    # Temporary directory of the chunk files, removed with the list
+    _spill_dir = None
+
+    def append(self, business):
+        for name in BUSINESS_FIELD_NAMES:
+            self.columns[name].append(getattr(business, name))
+        if (self.spill_rows is not None
+                and len(self.columns[BUSINESS_FIELD_NAMES[0]])
+                >= self.spill_rows):
+            self.spill()
+
+    def extend(self, businesses):
+        for business in businesses:
+            self.append(business)
+
+    def spill(self):
+        """Moves the rows held in memory to a new chunk file"""
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.TemporaryDirectory(
+                prefix="gmaps_spill_")
+        path = os.path.join(self._spill_dir.name,
+                            f"chunk_{len(self.chunks):05d}.pickle")
+        with trace(self.tracer, "spill"), open(path, 'wb') as file:
+            pickle.dump(self.columns, file, pickle.HIGHEST_PROTOCOL)
+        self.chunks.append(path)
+        self.spilled += len(self.columns[BUSINESS_FIELD_NAMES[0]])
+        self.columns = _empty_columns()
+
+    def iter_columns(self):
+        """Yields the spilled chunks and then the rows in memory, each as a
+        dict of columns"""
+        for path in self.chunks:
+            with open(path, 'rb') as file:
+                yield pickle.load(file)
+        yield self.columns
+
+    def all_columns(self):
+        """Returns every row as one dict of columns, loading all chunks"""
+        if not self.chunks:
+            return self.columns
+        return {
+            name: list(
+                itertools.chain.from_iterable(
+                    columns[name] for columns in self.iter_columns()))
+            for name in BUSINESS_FIELD_NAMES
+        }
+
+    def __len__(self):
+        return self.spilled + len(self.columns[BUSINESS_FIELD_NAMES[0]])
+
+    def __iter__(self):
+        """Yields the rows as Business objects"""
+        for columns in self.iter_columns():
+            for values in zip(*(columns[name]
+                                for name in BUSINESS_FIELD_NAMES)):
+                yield Business(*values)
+
+    @property
+    def business_list(self):
+        return list(self)
+
+    def dataframe(self, last=None):
+        """Transform the columns to a pandas DataFrame. With `last`, only
+        the last rows still in memory are included."""
+        # pandas takes longer to import than the rest of the scraper, so it
+        # is only loaded once a DataFrame is needed
+        import pandas as pd
+        with trace(self.tracer, "dataframe"):
+            if last is not None:
+                columns = {
+                    name: values[-last:]
+                    for name, values in self.columns.items()
+                }
+            else:
+                columns = self.all_columns()
+            return pd.DataFrame(columns, columns=BUSINESS_FIELD_NAMES)
+
+    def arrow_table(self):
+        """Transform the columns to a pyarrow Table"""
+        import pyarrow as pa
+        columns = self.all_columns()
+        return pa.table(
+            {name: columns[name]
+             for name in BUSINESS_FIELD_NAMES})
+
+    def _file_path(self, filename, extension):
+        if not os.path.exists(self.save_at):
+            os.makedirs(self.save_at)
+        return f"{self.save_at}/{filename}.{extension}"
+
+    def write_excel(self, file, engine=None):
+        """Streams the rows to an xlsx path or binary file object through a
+        write-only workbook, so memory use does not grow with the row count.
+        `engine` is "xlsxwriter" or "openpyxl"; by default xlsxwriter is
+        used when it is installed."""
+        if engine is None:
+            try:
+                import xlsxwriter  # noqa: F401
+                engine = "xlsxwriter"
+            except ImportError:
+                engine = "openpyxl"
+        rows = itertools.chain.from_iterable(
+            zip(*(columns[name] for name in BUSINESS_FIELD_NAMES))
+            for columns in self.iter_columns())
+        if engine == "xlsxwriter":
+            import xlsxwriter
+            workbook = xlsxwriter.Workbook(file, {"constant_memory": True})
+            sheet = workbook.add_worksheet("Sheet1")
+            sheet.write_row(0, 0, BUSINESS_FIELD_NAMES)
+            for index, row in enumerate(rows, 1):
+                sheet.write_row(index, 0, row)
+            workbook.close()
+        else:
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet("Sheet1")
+            sheet.append(BUSINESS_FIELD_NAMES)
+            for row in rows:
+                sheet.append(row)
+            workbook.save(file)
+
+    def excel_bytes(self):
+        """Returns the xlsx file as bytes, built in memory"""
+        buffer = io.BytesIO()
+        self.write_excel(buffer)
+        return buffer.getvalue()
+
+    def save_to_excel(self, filename):
+        """Saves the rows to Excel (xlsx) file and returns file path"""
+        file_path = self._file_path(filename, "xlsx")
+        try:
+            with trace(self.tracer, "export_excel"):
+                self.write_excel(file_path)
+            logging.info(f"Saved data to {file_path}")
+            return file_path  # Return the file path after saving
+        except Exception as e:
+            logging.error(f"Failed to save data to Excel: {e}")
+            return None
+
+    def export_excel(self, filename):
+        """Builds the xlsx file in memory and saves it, returning the file
+        path and the bytes, so callers serving a download do not read the
+        file back. The file path is None if building or saving failed."""
+        try:
+            with trace(self.tracer, "export_excel"):
+                data = self.excel_bytes()
+        except Exception as e:
+            logging.error(f"Failed to save data to Excel: {e}")
+            return None, None
+        file_path = self._file_path(filename, "xlsx")
+        try:
+            with open(file_path, 'wb') as file:
+                file.write(data)
+            logging.info(f"Saved data to {file_path}")
+        except Exception as e:
+            logging.error(f"Failed to save data to Excel: {e}")
+            file_path = None
+        return file_path, data
+
+    def save_to_csv(self, filename):
+        """Saves pandas DataFrame to CSV file"""
+        file_path = self._file_path(filename, "csv")
+        try:
+            with trace(self.tracer, "export_csv"):
+                self.dataframe().to_csv(file_path, index=False)
+            logging.info(f"Saved data to {file_path}")
+        except Exception as e:
+            logging.error(f"Failed to save data to CSV: {e}")
+
+    def save_to_parquet(self, filename):
+        """Saves the columns to a Parquet file and returns file path.
+        Needs pyarrow."""
+        file_path = self._file_path(filename, "parquet")
+        try:
+            import pyarrow.parquet as pq
+            with trace(self.tracer, "export_parquet"):
+                pq.write_table(self.arrow_table(), file_path)
+            logging.info(f"Saved data to {file_path}")
+            return file_path
+        except Exception as e:
+            logging.error(f"Failed to save data to Parquet: {e}")
+            return None
+
+    def save_to_feather(self, filename):
+        """Saves the columns to a Feather file and returns file path.
+        Needs pyarrow."""
+        file_path = self._file_path(filename, "feather")
+        try:
+            import pyarrow.feather as feather
+            with trace(self.tracer, "export_feather"):
+                feather.write_feather(self.arrow_table(), file_path)
+            logging.info(f"Saved data to {file_path}")
+            return file_path
+        except Exception as e:
+            logging.error(f"Failed to save data to Feather: {e}")
+            return None
+
+    def get_row_size(self):
+        """Returns the number of rows in the DataFrame"""
+        return len(self)
+
+
+BUSINESS_FIELD_SPECS = specs_for(BUSINESS_FIELD_NAMES)
+
+
+async def extract_business(page,
+                           url,
+                           wait_stats=None,
+                           tracer=None,
+                           rate_limiter=None,
+                           selectors=None):
+    """Opens a place URL on the given page and extracts its business data.
+    Raises BlockedError when Google answers with a block page instead, and
+    SelectorHealthError once the selector registry has failed."""
+    if rate_limiter is not None:
+        with trace(tracer, "throttle"):
+            await rate_limiter.acquire()
+    with trace(tracer, "navigate"):
+        await page.goto(url, timeout=60000)
+    with trace(tracer, "wait_place"):
+        loaded = await wait_for_place(page, wait_stats)
+    if not loaded and (reason := await detect_block(page)):
+        raise BlockedError(reason)
+
+    with trace(tracer, "extract"):
+        values = await extract_fields(page, BUSINESS_FIELD_SPECS, tracer,
+                                      selectors)
+    if not values.get("name"):
+        # Report it so the listing is retried instead of saved empty
+        raise RuntimeError("the place pane has no name")
+    return Business(**values, place_url=url)
+
+
+def business_from_record(record):
+    """Builds a Business from a stored dict, ignoring unknown keys"""
+    return Business(
+        **{name: record.get(name)
+           for name in BUSINESS_FIELD_NAMES})
+
+
+async def detail_worker(pool,
+                        discovery,
+                        finished,
+                        progress,
+                        wait_stats=None,
+                        cache=None,
+                        cache_mode=REFRESH_STALE,
+                        resource_policy=None,
+                        resource_stats=None,
+                        tracer=None,
+                        rate_limiter=None,
+                        retries=2,
+                        snapshot=None,
+                        memory=None,
+                        selectors=None):
+    """Takes (index, url) pairs from the discovery until it ends, putting
+    (index, Business) on the finished queue. Listings a re-crawl snapshot
+    finds unchanged and fresh cache entries are served without a page; a
+    page is leased on the first listing that needs its detail pane. A failed
+    listing is retried up to `retries` times after a jittered exponential
+    backoff, and errors and blocks are reported to the rate limiter.
+    Listings that still fail are reported as (index, None) so ordering can
+    move past them, and None is put once the worker exits. With a
+    memory.MemoryBudget, the page is handed back and a fresh one leased
+    whenever the budget asks for it. The worker stops once the
+    selector_registry.SelectorRegistry `selectors` has failed."""
+    try:
+        async with AsyncExitStack() as stack:
+            page = None
+            page_listings = 0
+            while (item := await discovery.next()) is not None:
+                index, url = item
+                started = time.perf_counter()
+                if snapshot is not None:
+                    business = snapshot.business_for(
+                        url, discovery.signals.get(url))
+                    if business is not None:
+                        if tracer is not None:
+                            tracer.count("listings", outcome="unchanged")
+                        finished.put_nowait((index, business))
+                        continue
+                if cache is not None and cache_mode == REFRESH_STALE:
+                    record = cache.get(url)
+                    if record is not None:
+                        progress.cached += 1
+                        business = business_from_record(record)
+                        # Entries cached before place_url existed lack it
+                        business.place_url = business.place_url or url
+                        if tracer is not None:
+                            tracer.count("listings", outcome="cached")
+                        finished.put_nowait((index, business))
+                        continue
+
+                if page is None:
+                    # Each lease gets its own stack so the page can be handed
+                    # back before the worker ends
+                    lease = await stack.enter_async_context(AsyncExitStack())
+                    # Includes launching a browser when the pool has none
+                    with trace(tracer, "acquire_page"):
+                        page = await lease.enter_async_context(pool.page())
+                    await lease.enter_async_context(
+                        filter_resources(page, resource_policy,
+                                         resource_stats))
+                    page_listings = 0
+                    generation = memory and memory.generation
+                business = None
+                for attempt in range(retries + 1):
+                    try:
+                        business = await extract_business(
+                            page, url, wait_stats, tracer, rate_limiter,
+                            selectors)
+                        if rate_limiter is not None:
+                            rate_limiter.success()
+                        break
+                    except SelectorHealthError:
+                        # Retrying cannot help; stop the whole scrape
+                        raise
+                    except Exception as e:
+                        blocked = isinstance(e, BlockedError)
+                        if rate_limiter is not None:
+                            if blocked:
+                                rate_limiter.block()
+                            else:
+                                rate_limiter.error()
+                        if attempt == retries:
+                            logging.error(f'Error occurred while scraping '
+                                          f'listing {url}: {e}')
+                            break
+                        if tracer is not None:
+                            tracer.count(
+                                "listing_retries",
+                                reason="blocked" if blocked else "error")
+                        logging.warning(f'Retrying listing {url}: {e}')
+                        await asyncio.sleep(backoff_delay(attempt))
+                if business is not None and cache is not None:
+                    cache.put(url, asdict(business))
+                if tracer is not None:
+                    tracer.observe("listing",
+                                   (time.perf_counter() - started) * 1000)
+                    tracer.count("listings",
+                                 outcome="scraped" if business else "failed")
+                finished.put_nowait((index, business))
+                page_listings += 1
+                if memory is not None and memory.check(pool, page_listings,
+                                                       generation):
+                    with trace(tracer, "recycle_page"):
+                        await lease.aclose()
+                    page = None
+    except Exception as e:
+        logging.error(f'Detail worker stopped: {e}')
+    finally:
+        finished.put_nowait(None)
+
+
+async def discover_listings(pool,
+                            search_term,
+                            discovery,
+                            wait_stats=None,
+                            resource_policy=None,
+                            resource_stats=None,
+                            tracer=None,
+                            maps_url=MAPS_URL,
+                            rate_limiter=None,
+                            page=None):
+    """Runs the search and streams place URLs into the discovery while the
+    feed is scrolled. Raises BlockedError if the search is answered with a
+    block page. A page is leased from the pool unless one is passed, whose
+    resources the caller filters."""
+    async with AsyncExitStack() as stack:
+        if page is None:
+            with trace(tracer, "acquire_page"):
+                page = await stack.enter_async_context(pool.page())
+            await stack.enter_async_context(
+                filter_resources(page, resource_policy, resource_stats))
+        with trace(tracer, "open_maps"):
+            # Pooled pages are parked on the Maps home, so a warm page can
+            # search straight away
+            if not is_maps_home(page.url, maps_url):
+                if rate_limiter is not None:
+                    await rate_limiter.acquire()
+                await page.goto(maps_url, timeout=60000)
+            await wait_for_search_box(page, wait_stats)
+
+        with trace(tracer, "search"):
+            await page.fill('//input[@id="searchboxinput"]', search_term)
+            await wait_for_search_term(page, search_term, wait_stats)
+
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            await page.keyboard.press("Enter")
+            if (not await wait_for_results(page, wait_stats)
+                    and (reason := await detect_block(page))):
+                if rate_limiter is not None:
+                    rate_limiter.block()
+                raise BlockedError(reason)
+
+        with trace(tracer, "scroll"):
+            await discovery.observe(page, wait_stats)
+
+
+async def scrape_business(search_term,
+                          total,
+                          concurrency=4,
+                          wait_stats=None,
+                          cache=None,
+                          cache_mode=REFRESH_STALE,
+                          pool=None,
+                          progress=None,
+                          job=None,
+                          job_store=None,
+                          checkpoint_every=10,
+                          resource_policy=RESOURCE_POLICIES["default"],
+                          resource_stats=None,
+                          deduplicator=None,
+                          tracer=None,
+                          maps_url=MAPS_URL,
+                          rate_limiter=None,
+                          retries=2,
+                          discoverer=None,
+                          shards=0,
+                          snapshot=None,
+                          memory=None,
+                          selectors=None):
+    """Yields each Business as soon as it is scraped, in feed order.
+
+    Detail pages are scraped while the feed is still being scrolled. With a
+    job, the cursor is checkpointed every `checkpoint_every` listings, along
+    with the URLs found so far until discovery completes; a job whose search
+    finished continues from its cursor without searching again, and one
+    interrupted mid-search keeps its saved URLs in order and searches again
+    for the rest. With a
+    deduplicator, businesses it has already seen are skipped. With a tracer,
+    every phase is timed and per-listing latency is recorded. `maps_url`
+    points the search at another Maps home, such as the local fixture
+    server. With a rate limiter, every navigation waits for a token; failed
+    listings are retried up to `retries` times either way. A `discoverer`,
+    such as a tiling.TiledDiscoverer, replaces the single search; it is
+    called with the pool and discovery and fills the discovery itself. With
+    `shards`, details are scraped by that many processes with `concurrency`
+    pages each, sharing the rate limiter's rate, instead of on `pool`; see
+    gmaps_scraper.shards. With a recrawl.Snapshot, listings whose result
+    card matches the previous dataset are taken from it without a detail
+    page. A memory.MemoryBudget bounds how long pages and browsers live.
+    With a selector_registry.SelectorRegistry, selector hits are tracked and
+    SelectorHealthError is raised once a required field stops being found;
+    the job's cursor stays at the last listing handled."""
+    search_pages = getattr(discoverer, "pages", 1)
+    if pool is None:
+        # Without a long-lived pool, launch a browser for this run only
+        detail_pages = 0 if shards else concurrency
+        async with BrowserPool(pages_per_browser=detail_pages + search_pages,
+                               rewarm=False,
+                               warm_url=maps_url) as pool:
+            businesses = scrape_business(
+                search_term, total, concurrency, wait_stats, cache,
+                cache_mode, pool, progress, job, job_store, checkpoint_every,
+                resource_policy, resource_stats, deduplicator, tracer,
+                maps_url, rate_limiter, retries, discoverer, shards,
+                snapshot, memory, selectors)
+            try:
+                async for business in businesses:
+                    yield business
+            finally:
+                # Checkpoints the job before the pool closes, also when the
+                # caller stops early
+                await businesses.aclose()
+        return
+
+    if cache_mode == CACHE_OFF:
+        cache = None
+    if progress is None:
+        progress = ScrapeProgress()
+
+    start = job.cursor if job is not None else 0
+    progress.done = start
+    discovery = ListingDiscovery(total, skip=start)
+
+    async def discover():
+        try:
+            if discoverer is not None:
+                await discoverer(pool, discovery, wait_stats, resource_policy,
+                                 resource_stats, tracer, rate_limiter)
+            else:
+                await discover_listings(pool, search_term, discovery,
+                                        wait_stats, resource_policy,
+                                        resource_stats, tracer, maps_url,
+                                        rate_limiter)
+            if job is not None:
+                job.urls = discovery.urls
+                job.searched = True
+                job_store.save(job)
+        except Exception as e:
+            logging.error(f'Error occurred during scraping: {e}')
+        finally:
+            discovery.close()
+
+    def checkpoint():
+        if job.searched:
+            job_store.checkpoint(job)
+        else:
+            # Until the search finishes, its URLs are saved too, so a
+            # resumed job hands out listings in the same order
+            job.urls = list(discovery.urls)
+            job_store.save(job)
+
+    if job is not None and job.searched:
+        logging.info(f"Resuming job {job.job_id} at listing {job.cursor} "
+                     f"of {len(job.urls)}")
+        discovery.preload(job.urls)
+        searcher = None
+    else:
+        if job is not None and job.urls:
+            # The search was interrupted: keep the URLs found before, in
+            # their order, and search again for the rest
+            logging.info(f"Resuming job {job.job_id} at listing "
+                         f"{job.cursor}, searching again after "
+                         f"{len(job.urls)} saved listings")
+            discovery.add(job.urls)
+        searcher = asyncio.create_task(discover())
+
+    # Detail workers start right away and take URLs as they are discovered
+    finished = asyncio.Queue()
+    if shards:
+        from .shards import shard_worker
+        rate = None if rate_limiter is None else rate_limiter.rate / shards
+        workers = [
+            asyncio.create_task(
+                shard_worker(discovery, finished, progress, concurrency,
+                             CACHE_OFF if cache is None else cache_mode,
+                             resource_policy, rate, retries, maps_url,
+                             snapshot, memory, selectors, cache, wait_stats,
+                             resource_stats, tracer))
+            for _ in range(shards)
+        ]
+    else:
+        # Detail workers keep their page until discovery ends, so leave the
+        # search pages it needs free
+        pages = pool.browsers * pool.pages_per_browser
+        if searcher is not None and concurrency + search_pages > pages:
+            concurrency = max(pages - search_pages, 1)
+            logging.warning(f"Scraping {concurrency} listings at once, so "
+                            f"the pool keeps {search_pages} pages for the "
+                            f"search")
+        workers = [
+            asyncio.create_task(
+                detail_worker(pool, discovery, finished, progress,
+                              wait_stats, cache, cache_mode, resource_policy,
+                              resource_stats, tracer, rate_limiter, retries,
+                              snapshot, memory, selectors))
+            for _ in range(concurrency)
+        ]
+
+    # Yield in feed order, holding back listings that finish early
+    ready = {}
+    next_index = start
+    running = len(workers)
+    try:
+        while running or ready:
+            if running:
+                item = await finished.get()
+                if item is None:
+                    running -= 1
+                    if selectors is not None:
+                        selectors.check()
+                else:
+                    ready[item[0]] = item[1]
+            elif next_index not in ready:
+                # Every worker is done; anything still missing was lost with
+                # its worker
+                ready[next_index] = None
+            while next_index in ready:
+                progress.found = len(discovery.urls)
+                business = ready.pop(next_index)
+                if (business is not None and deduplicator is not None
+                        and not deduplicator.is_new(business)):
+                    business = None
+                if business is not None:
+                    yield business
+                # The caller has handled the listing once the generator
+                # resumes, so it is safe to move the cursor past it
+                next_index += 1
+                progress.done += 1
+                if job is not None:
+                    job.cursor = next_index
+                    job.rows += business is not None
+                    if progress.done % checkpoint_every == 0:
+                        checkpoint()
+        progress.found = len(discovery.urls)
+    finally:
+        if job is not None:
+            checkpoint()
+        for task in workers + ([searcher] if searcher else []):
+            task.cancel()
+        await asyncio.gather(*workers,
+                             *([searcher] if searcher else []),
+                             return_exceptions=True)
+        if cache is not None:
+            cache.evict()
+        if wait_stats is not None:
+            logging.info(wait_stats.summary())
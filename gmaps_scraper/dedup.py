@@ -0,0 +1,283 @@
+"""Deduplication and entity resolution for scraped businesses.
+
+Records are matched by place first: the feature id in the /maps/place URL,
+or the URL path when there is none. Records without a place URL, like the
+older files in output/, fall back to normalised phone numbers, website
+domains, addresses and names. Every rule looks records up in a hash-keyed
+block, and fuzzy name comparisons only run inside small blocks that share a
+phone number or an address, so a run never does O(n^2) comparisons.
+
+    python -m gmaps_scraper dedup output/ --out output/deduplicated.csv
+"""
+import glob
+import logging
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+from .cache import place_key
+from .writers import read_rows, writer_for_path
+
+# Domains that many unrelated businesses share, so they identify nothing
+SHARED_DOMAINS = {
+    "facebook.com", "instagram.com", "linktr.ee", "sites.google.com",
+    "business.site", "wixsite.com", "square.site", "yelp.com",
+    "tripadvisor.com", "ubereats.com", "doordash.com", "toasttab.com"
+}
+
+ADDRESS_ABBREVIATIONS = {
+    "street": "st",
+    "avenue": "ave",
+    "road": "rd",
+    "boulevard": "blvd",
+    "drive": "dr",
+    "lane": "ln",
+    "place": "pl",
+    "square": "sq",
+    "suite": "ste",
+    "floor": "fl",
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+}
+
+NAME_STOPWORDS = {
+    "the", "and", "llc", "inc", "ltd", "co", "corp", "company", "limited"
+}
+
+# Largest number of records kept per fuzzy block; busy addresses such as
+# malls stop growing their block past this
+MAX_BLOCK_SIZE = 64
+
+
+NON_WORD = re.compile(r"[^\w]+")
+NON_DIGIT = re.compile(r"\D")
+URL_SCHEME = re.compile(r"^[a-z]+://")
+WWW_PREFIX = re.compile(r"^www\d*\.")
+
+
+def _fold(text):
+    """Lowercases and strips accents and punctuation"""
+    text = text or ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in text
+                       if not unicodedata.combining(char))
+    return NON_WORD.sub(" ", text.lower()).strip()
+
+
+def normalize_phone(phone):
+    """Keeps the last ten digits, enough to ignore country code formatting.
+    Returns None for values too short to be a phone number."""
+    digits = NON_DIGIT.sub("", phone or "")
+    return digits[-10:] if len(digits) >= 7 else None
+
+
+def normalize_domain(website):
+    """'https://www.Example.com/menu' -> 'example.com'. Returns None for
+    empty values and for domains shared by unrelated businesses."""
+    website = (website or "").strip().lower()
+    if not website:
+        return None
+    website = URL_SCHEME.sub("", website)
+    domain = website.split("/")[0].split("?")[0].split(":")[0]
+    domain = WWW_PREFIX.sub("", domain)
+    labels = domain.split(".")
+    # Checks "a.wixsite.com", "wixsite.com" and "com" against the shared set
+    if not domain or any(".".join(labels[start:]) in SHARED_DOMAINS
+                         for start in range(len(labels))):
+        return None
+    return domain
+
+
+def normalize_address(address):
+    words = _fold(address).split()
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word)
+                    for word in words) or None
+
+
+def normalize_name(name):
+    words = _fold(name).split()
+    return " ".join(word for word in words
+                    if word not in NAME_STOPWORDS) or None
+
+
+def name_similarity(first, second):
+    if not first or not second:
+        return 0.0
+    if first == second:
+        return 1.0
+    # Token order often differs ("Cafe Blue" / "Blue Cafe")
+    return SequenceMatcher(None, " ".join(sorted(first.split())),
+                           " ".join(sorted(second.split()))).ratio()
+
+
+def _get(record, name):
+    if isinstance(record, dict):
+        return record.get(name)
+    return getattr(record, name, None)
+
+
+class Deduplicator:
+    """Incrementally clusters records that describe the same business.
+
+    add() returns None for a record that starts a new cluster, or the id of
+    the cluster it joined. Clusters are merged with union-find when a record
+    links two of them. Website, phone and address rules never link a record
+    to a cluster with a different place key, a shared phone only counts when
+    the addresses agree or one is missing, and only the first record of a
+    cluster is kept in the fuzzy blocks.
+    """
+
+    def __init__(self, name_threshold=0.85, phone_name_threshold=0.6):
+        self.name_threshold = name_threshold
+        self.phone_name_threshold = phone_name_threshold
+        self.records = 0
+        self.duplicates = 0
+        self._parent = []
+        # Place key of each cluster, None until a record with one joins
+        self._keys = []
+        # Exact keys are stored as hashes of their normalised values
+        self._exact = {}
+        self._blocks = {}
+
+    def _find(self, cluster):
+        while self._parent[cluster] != cluster:
+            self._parent[cluster] = self._parent[self._parent[cluster]]
+            cluster = self._parent[cluster]
+        return cluster
+
+    def _union(self, first, second):
+        first, second = self._find(first), self._find(second)
+        if first != second:
+            root, child = min(first, second), max(first, second)
+            self._parent[child] = root
+            self._keys[root] = self._keys[root] or self._keys[child]
+        return min(first, second)
+
+    def _compatible(self, key, cluster):
+        """Whether a fallback rule may link a record to the cluster: places
+        with different keys are different places"""
+        other = self._keys[self._find(cluster)]
+        return key is None or other is None or key == other
+
+    def add(self, record):
+        self.records += 1
+        name = normalize_name(_get(record, "name"))
+        address = normalize_address(_get(record, "address"))
+        phone = normalize_phone(_get(record, "phone_number"))
+        domain = normalize_domain(_get(record, "website"))
+        url = _get(record, "place_url")
+        key = place_key(url) if url else None
+
+        exact_keys = []
+        if key:
+            exact_keys.append(hash(("place", key)))
+        fallback_keys = []
+        if domain and address:
+            fallback_keys.append(hash(("site", domain, address)))
+        fuzzy_blocks = []
+        if phone:
+            fuzzy_blocks.append((hash(("phone", phone)),
+                                 self.phone_name_threshold))
+        if address:
+            fuzzy_blocks.append((hash(("address", address)),
+                                 self.name_threshold))
+
+        matches = {
+            self._exact[exact] for exact in exact_keys if exact in self._exact
+        }
+        matches.update(
+            self._exact[fallback] for fallback in fallback_keys
+            if fallback in self._exact
+            and self._compatible(key, self._exact[fallback]))
+        for block, threshold in fuzzy_blocks:
+            for other_name, other_address, cluster in self._blocks.get(
+                    block, ()):
+                # Chains share a head office phone across their branches
+                if (cluster not in matches and self._compatible(key, cluster)
+                        and (not address or not other_address
+                             or address == other_address)
+                        and name_similarity(name, other_name) >= threshold):
+                    matches.add(cluster)
+
+        if matches:
+            self.duplicates += 1
+            cluster = None
+            for match in matches:
+                cluster = match if cluster is None else self._union(
+                    cluster, match)
+            cluster = self._find(cluster)
+            self._keys[cluster] = self._keys[cluster] or key
+            new = False
+        else:
+            cluster = len(self._parent)
+            self._parent.append(cluster)
+            self._keys.append(key)
+            new = True
+
+        for exact in exact_keys + fallback_keys:
+            self._exact.setdefault(exact, cluster)
+        if new:
+            # Later members of the cluster would only repeat its comparisons
+            for block, _ in fuzzy_blocks:
+                entries = self._blocks.setdefault(block, [])
+                if len(entries) < MAX_BLOCK_SIZE:
+                    entries.append((name, address, cluster))
+        return None if new else cluster
+
+    def is_new(self, record):
+        """Adds the record and returns True if it matched no earlier one"""
+        return self.add(record) is None
+
+    def unique(self, records):
+        """Yields the first record of every cluster, in input order"""
+        for record in records:
+            if self.is_new(record):
+                yield record
+
+
+def load_history(directory="output"):
+    """Yields every record saved under `directory`: Excel exports, streamed
+    CSV/JSONL files and batch outputs. Files whose names start with a dot,
+    like the cache folder, are skipped."""
+    paths = sorted(
+        path
+        for pattern in ("*.xlsx", "*.csv", "*.jsonl")
+        for path in glob.glob(os.path.join(directory, "**", pattern),
+                              recursive=True))
+    for path in paths:
+        try:
+            yield from read_records(path)
+        except Exception as e:
+            logging.warning(f"Skipping {path}: {e}")
+
+
+def read_records(path):
+    """Reads the records of one Excel export or CSV/JSONL stream file"""
+    if path.endswith(".xlsx"):
+        import pandas as pd
+        frame = pd.read_excel(path)
+        return frame.astype(object).where(frame.notna(),
+                                          None).to_dict("records")
+    return read_rows(path)
+
+
+def dedup_history(directory="output", out_path=None, fieldnames=None):
+    """Deduplicates everything saved under `directory`. Writes the unique
+    records to `out_path` when given and returns them."""
+    deduplicator = Deduplicator()
+    records = list(deduplicator.unique(load_history(directory)))
+    logging.info(f"{deduplicator.records} records, "
+                 f"{len(records)} unique businesses")
+    if out_path:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        fieldnames = fieldnames or list(
+            dict.fromkeys(name for record in records for name in record))
+        with writer_for_path(out_path, fieldnames) as writer:
+            for record in records:
+                writer.write(record)
+    return records
@@ -0,0 +1,187 @@
+"""Incremental listing discovery for the results feed.
+
+A MutationObserver inside the page reports only the place links added since
+its last report, through a binding exposed to Python. Each new URL is queued
+for the detail workers straight away, so details are scraped while the feed
+is still being scrolled. Scrolling stops at the feed's explicit end-of-list
+marker, once `total` URLs are known, or after several consecutive wheel
+events that load nothing.
+
+Along with each URL, the observer reports the name and rating shown on the
+result card. Incremental re-crawls compare these against the previous
+dataset to skip listings that have not changed.
+"""
+import asyncio
+import logging
+import time
+import uuid
+
+from .waits import PLACE_LINK_SELECTOR
+
+FEED_SELECTOR = 'div[role="feed"]'
+# "You've reached the end of the list."
+END_OF_LIST_SELECTOR = 'span.HlvSq'
+CARD_SELECTOR = 'div.Nv2PK'
+CARD_NAME_SELECTOR = 'div.qBF1Pd'
+CARD_RATING_SELECTOR = 'span.MW4etd'
+
+OBSERVE_FEED_JS = """
+([binding, link, feed, end, card, cardName, cardRating]) => {
+    const seen = new Set();
+    const text = (root, selector) => {
+        const element = root.querySelector(selector);
+        return element ? element.textContent.trim() : null;
+    };
+    let signals = {};
+    const collect = (root, found) => {
+        if (root.nodeType !== Node.ELEMENT_NODE) {
+            return;
+        }
+        const anchors = root.matches(link) ? [root]
+            : root.querySelectorAll(link);
+        for (const anchor of anchors) {
+            if (!seen.has(anchor.href)) {
+                seen.add(anchor.href);
+                found.push(anchor.href);
+                const container = anchor.closest(card) || anchor.parentElement;
+                if (container) {
+                    signals[anchor.href] = {
+                        name: text(container, cardName),
+                        rating: text(container, cardRating),
+                    };
+                }
+            }
+        }
+    };
+    let ended = false;
+    const report = found => {
+        const reachedEnd = !ended && !!document.querySelector(end);
+        ended = ended || reachedEnd;
+        if (found.length || reachedEnd) {
+            window[binding](found, reachedEnd, signals);
+            signals = {};
+        }
+    };
+    const initial = [];
+    collect(document.body, initial);
+    report(initial);
+    new MutationObserver(records => {
+        const found = [];
+        for (const record of records) {
+            for (const node of record.addedNodes) {
+                collect(node, found);
+            }
+        }
+        report(found);
+    }).observe(document.querySelector(feed) || document.body,
+               {childList: true, subtree: true});
+}
+"""
+
+
+class ListingDiscovery:
+    """Collects place URLs in feed order and hands them to consumers.
+
+    `urls` holds every URL found, in feed order, and `signals` the name and
+    rating on each URL's result card. Consumers call next() to receive
+    (index, url) pairs for indexes from `skip` onwards, and None once
+    discovery has ended.
+    """
+
+    def __init__(self, total, skip=0):
+        self.total = total
+        self.skip = skip
+        self.urls = []
+        self.signals = {}
+        self.seen = set()
+        self.ended = False
+        self.complete = False
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Event()
+
+    def add(self, hrefs):
+        """Records new URLs, ignoring repeats and anything past `total`"""
+        for href in hrefs:
+            if len(self.urls) >= self.total:
+                break
+            if href in self.seen:
+                continue
+            self.seen.add(href)
+            if len(self.urls) >= self.skip:
+                self._queue.put_nowait((len(self.urls), href))
+            self.urls.append(href)
+        self._changed.set()
+
+    def preload(self, urls):
+        """Queues a known URL list, e.g. from a checkpoint, and ends"""
+        self.add(urls)
+        self.complete = True
+        self.close()
+
+    def close(self):
+        if not self.ended:
+            self.ended = True
+            self._queue.put_nowait(None)
+            self._changed.set()
+
+    async def next(self):
+        """Returns the next (index, url) pair, or None when discovery has
+        ended and every URL has been handed out"""
+        item = await self._queue.get()
+        if item is None:
+            # Put the end marker back for the other consumers
+            self._queue.put_nowait(None)
+        return item
+
+    async def observe(self,
+                      page,
+                      wait_stats=None,
+                      scroll_timeout_ms=2000,
+                      max_stalls=3):
+        """Scrolls the feed on `page` until the end-of-list marker shows,
+        `total` URLs are known or `max_stalls` wheel events in a row load
+        nothing. Marks the discovery complete on success."""
+        reached_end = False
+
+        def on_found(source, hrefs, end, signals):
+            nonlocal reached_end
+            reached_end = reached_end or end
+            # Signals go first, so they are there when a URL is handed out
+            self.signals.update(signals)
+            self.add(hrefs)
+
+        binding = f"__gmapsFound_{uuid.uuid4().hex}"
+        await page.expose_binding(binding, on_found)
+        await page.evaluate(OBSERVE_FEED_JS, [
+            binding, PLACE_LINK_SELECTOR, FEED_SELECTOR, END_OF_LIST_SELECTOR,
+            CARD_SELECTOR, CARD_NAME_SELECTOR, CARD_RATING_SELECTOR
+        ])
+
+        if not self.urls:
+            # The search went straight to a single place
+            if "/maps/place" in page.url:
+                self.add([page.url])
+            self.complete = True
+            return
+
+        await page.hover(PLACE_LINK_SELECTOR)
+        stalls = 0
+        while (not reached_end and len(self.urls) < self.total
+               and stalls < max_stalls):
+            self._changed.clear()
+            start = time.perf_counter()
+            await page.mouse.wheel(0, 10000)
+            try:
+                await asyncio.wait_for(self._changed.wait(),
+                                       scroll_timeout_ms / 1000)
+                stalls = 0
+            except asyncio.TimeoutError:
+                stalls += 1
+            if wait_stats is not None:
+                wait_stats.record("scroll",
+                                  (time.perf_counter() - start) * 1000,
+                                  2000, stalls > 0)
+
+        logging.info(f"Discovered {len(self.urls)} listings "
+                     f"({'end of list' if reached_end else 'stopped'})")
+        self.complete = True
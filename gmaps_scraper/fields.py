@@ -0,0 +1,176 @@
+"""Declarative field specs for the place pane.
+
+Every field is described by a selector, fallbacks to try when Google renames
+its classes, how to read it and how to parse it. extract_fields() evaluates
+every selector of every field in a single page.evaluate round trip instead of
+a count()/all()/inner_text() sequence per field; a
+selector_registry.SelectorRegistry tracks how often each one hits.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Tuple
+
+
+def parse_text(value):
+    return value.strip()
+
+
+def parse_rating(value):
+    """'4.5 stars' / '4,5 étoiles' -> 4.5"""
+    return float(value.split()[0].replace(',', '.').strip())
+
+
+def parse_count(value):
+    """'(1,234)' / '1,234 reviews' -> 1234"""
+    return int(value.split()[0].strip('()').replace(',', '').replace('.', ''))
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """Describes how to extract one Business field from the place pane"""
+    name: str
+    # CSS selector, or XPath when it starts with '/' or '('
+    selector: str
+    # "text" reads innerText, "attribute" reads the named attribute
+    kind: str = "text"
+    attribute: str = None
+    parser: Callable[[str], Any] = parse_text
+    default: Any = ""
+    # Selectors read the same way, tried in order when `selector` misses
+    fallbacks: Tuple[str, ...] = ()
+    # Share of listings that should have the field; a lower share over a
+    # registry window means the selectors broke. None for optional fields.
+    min_hit_rate: float = None
+
+    @property
+    def selectors(self):
+        return (self.selector, ) + self.fallbacks
+
+    def to_js(self, selectors=None):
+        return {
+            "name": self.name,
+            "selectors": list(selectors or self.selectors),
+            "attribute": self.attribute if self.kind == "attribute" else None,
+        }
+
+
+FIELD_SPECS = (
+    FieldSpec("name",
+              'h1.DUwDvf.lfPIob',
+              fallbacks=('h1.DUwDvf', 'div[role="main"] h1'),
+              min_hit_rate=0.8),
+    FieldSpec(
+        "address",
+        '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]',
+        fallbacks=('[data-item-id="address"] .Io6YTe', )),
+    FieldSpec(
+        "website",
+        '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]',
+        fallbacks=('a[data-item-id="authority"] .Io6YTe', )),
+    FieldSpec(
+        "phone_number",
+        '//button[contains(@data-item-id, "phone")]//div[contains(@class, "fontBodyMedium")]',
+        fallbacks=('[data-item-id^="phone"] .Io6YTe', )),
+    FieldSpec(
+        "reviews_count",
+        '//button[@jsaction="pane.reviewChart.moreReviews"]//span',
+        parser=parse_count,
+        default=None,
+        fallbacks=(
+            '//div[contains(@class, "F7nice")]//span[@aria-label][starts-with(., "(")]',
+        )),
+    FieldSpec(
+        "reviews_average",
+        '//div[@jsaction="pane.reviewChart.moreReviews"]//div[@role="img"]',
+        kind="attribute",
+        attribute="aria-label",
+        parser=parse_rating,
+        default=None,
+        fallbacks=('div.F7nice span[role="img"]', )),
+)
+
+EXTRACT_FIELDS_JS = """
+specs => {
+    const first = selector => {
+        try {
+            return selector.startsWith('/') || selector.startsWith('(')
+                ? document.evaluate(selector, document, null,
+                      XPathResult.FIRST_ORDERED_NODE_TYPE, null)
+                      .singleNodeValue
+                : document.querySelector(selector);
+        } catch (e) {
+            // An invalid selector is a miss, not a failed listing
+            return null;
+        }
+    };
+    const values = {};
+    const hits = {};
+    for (const spec of specs) {
+        values[spec.name] = null;
+        // Every selector is checked, so fallbacks are measured even while
+        // the primary still works
+        hits[spec.name] = spec.selectors.map(selector => {
+            const element = first(selector);
+            const value = !element ? null
+                : spec.attribute ? element.getAttribute(spec.attribute)
+                : element.innerText;
+            if (!value || !value.trim()) {
+                return false;
+            }
+            if (values[spec.name] === null) {
+                values[spec.name] = value;
+            }
+            return true;
+        });
+    }
+    return {values, hits};
+}
+"""
+
+
+def specs_for(names, specs=FIELD_SPECS):
+    """Returns the specs for the given field names, keeping table order"""
+    names = set(names)
+    return tuple(spec for spec in specs if spec.name in names)
+
+
+def parse_fields(raw, specs=FIELD_SPECS, tracer=None):
+    """Applies each spec's parser to the raw values read from the page,
+    falling back to the spec default for missing or unparsable values.
+    With a tracer, lookups, misses and parse errors are counted per field."""
+    values = {}
+    for spec in specs:
+        value = raw.get(spec.name)
+        if tracer is not None:
+            tracer.count("field_lookups", field=spec.name)
+            if not value:
+                tracer.count("field_misses", field=spec.name)
+        if value:
+            try:
+                values[spec.name] = spec.parser(value)
+                continue
+            except (ValueError, IndexError) as e:
+                logging.warning(
+                    f"Could not parse {spec.name} from {value!r}: {e}")
+                if tracer is not None:
+                    tracer.count("field_parse_errors", field=spec.name)
+        values[spec.name] = spec.default
+    return values
+
+
+async def extract_fields(page, specs=FIELD_SPECS, tracer=None, registry=None):
+    """Reads every field of the place pane in one round trip. With a
+    registry, its current selector order is used and the hits are recorded;
+    this raises SelectorHealthError once the registry has failed."""
+    if registry is not None:
+        registry.check()
+    chains = [
+        registry.chain(spec) if registry is not None else spec.selectors
+        for spec in specs
+    ]
+    raw = await page.evaluate(
+        EXTRACT_FIELDS_JS,
+        [spec.to_js(chain) for spec, chain in zip(specs, chains)])
+    if registry is not None:
+        registry.record(specs, chains, raw["hits"], tracer)
+    return parse_fields(raw["values"], specs, tracer)
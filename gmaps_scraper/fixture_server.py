@@ -0,0 +1,398 @@
+"""Local stand-in for Google Maps, for benchmarks and offline checks.
+
+Serves a Maps home with `#searchboxinput`, a results feed of `/maps/place`
+anchors that loads more listings on every wheel event until it shows the
+end-of-list marker, and place panes with the `DUwDvf` heading and the
+`data-item-id` buttons the field specs read. Responses can be delayed, and
+pages pull in map tiles, photos and a font so resource blocking has
+something to block, and a cacheable script bundle, as Maps does, so the
+cost of turning the HTTP cache off shows too. Results come from recorded fixtures, a JSON file of
+{query: [business, ...]}, or are generated deterministically per query.
+
+    python -m gmaps_scraper.fixture_server --port 8765 --latency-ms 50
+    python -m gmaps_scraper scrape "pizza" --maps-url http://127.0.0.1:8765/maps
+"""
+import argparse
+import html
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote_plus, urlsplit
+
+STREETS = ("Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Cedar Ln",
+           "Elm St", "Park Blvd", "Lake Rd")
+KINDS = ("Cafe", "Bakery", "Diner", "Bistro", "Kitchen", "Grill", "Market",
+         "Deli")
+
+HOME_HTML = """<!doctype html>
+<html>
+<head>
+<title>Maps fixture</title>
+<script src="/fixture/app.js"></script>
+<style>
+@font-face {{ font-family: Fixture; src: url(/fixture/font.woff2); }}
+body {{ font-family: Fixture, sans-serif; margin: 0; }}
+div[role="feed"] {{ height: 600px; width: 400px; overflow-y: auto; }}
+.Nv2PK {{ height: 120px; border-bottom: 1px solid #ccc; }}
+#map img {{ width: 64px; height: 64px; }}
+</style>
+</head>
+<body>
+<input id="searchboxinput" autocomplete="off">
+<div id="results"></div>
+<div id="map">{tiles}</div>
+<script>
+const box = document.getElementById('searchboxinput');
+box.addEventListener('keydown', async event => {{
+    if (event.key !== 'Enter') {{
+        return;
+    }}
+    const query = box.value;
+    history.pushState(null, '', '/maps/search/' + encodeURIComponent(query));
+    const results = document.getElementById('results');
+    results.innerHTML = '<div role="feed"></div>';
+    const feed = results.firstChild;
+    let offset = 0, loading = false, ended = false;
+    const more = async () => {{
+        if (loading || ended) {{
+            return;
+        }}
+        loading = true;
+        const response = await fetch('/fixture/feed?q='
+            + encodeURIComponent(query) + '&offset=' + offset);
+        const page = await response.json();
+        feed.insertAdjacentHTML('beforeend', page.html);
+        offset = page.next;
+        if (page.end) {{
+            ended = true;
+            feed.insertAdjacentHTML('beforeend',
+                '<span class="HlvSq">You\\'ve reached the end of the list.'
+                + '</span>');
+        }}
+        loading = false;
+    }};
+    feed.addEventListener('wheel', more);
+    feed.addEventListener('scroll', () => {{
+        if (feed.scrollTop + feed.clientHeight >= feed.scrollHeight - 50) {{
+            more();
+        }}
+    }});
+    await more();
+}});
+</script>
+</body>
+</html>
+"""
+
+CARD_HTML = """<div class="Nv2PK">
+<a class="hfpxzc" aria-label="{name}" href="{href}"></a>
+<div class="qBF1Pd fontHeadlineSmall">{name}</div>
+<span class="MW4etd">{rating}</span><span class="UY7F9">({reviews})</span>
+<img src="/fixture/photo/{id}-0.jpg">
+</div>
+"""
+
+PLACE_HTML = """<!doctype html>
+<html>
+<head><title>{name}</title><script src="/fixture/app.js"></script></head>
+<body>
+<h1 class="DUwDvf lfPIob">{name}</h1>
+<div jsaction="pane.reviewChart.moreReviews">
+<div role="img" aria-label="{rating} stars"></div>
+</div>
+<button jsaction="pane.reviewChart.moreReviews"><span>({reviews})</span>
+</button>
+<button data-item-id="address">
+<div class="fontBodyMedium">{address}</div>
+</button>
+{website}{phone}{photos}
+<div id="map">{tiles}</div>
+</body>
+</html>
+"""
+
+WEBSITE_HTML = """<a data-item-id="authority" href="https://{website}">
+<div class="fontBodyMedium">{website}</div>
+</a>
+"""
+
+PHONE_HTML = """<button data-item-id="phone:tel:{digits}">
+<div class="fontBodyMedium">{phone}</div>
+</button>
+"""
+
+
+def generate_businesses(query, count):
+    """Deterministic businesses for a query, as fixture records"""
+    rng = random.Random(zlib.crc32(query.encode("utf-8")))
+    businesses = []
+    for index in range(count):
+        number = rng.randint(1, 9999)
+        name = f"{rng.choice(KINDS)} {query.title()} {index + 1}"
+        businesses.append({
+            "name": name,
+            "address": f"{number} {rng.choice(STREETS)}, Springfield",
+            "website": None if index % 5 == 4 else
+            f"{name.lower().replace(' ', '')}.example.com",
+            "phone_number": None if index % 7 == 6 else
+            f"+1 555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+            "reviews_average": round(rng.uniform(3.0, 5.0), 1),
+            "reviews_count": rng.randint(1, 5000),
+        })
+    return businesses
+
+
+def load_fixtures(path):
+    """Reads recorded fixtures: a JSON object of {query: [business, ...]}"""
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+class FixtureServer:
+    """Serves the fixture site from a background thread.
+
+    Every response is delayed by `latency_ms`, and each feed page by a
+    further `feed_latency_ms`. A search returns `results` listings,
+    `page_size` at a time, unless `fixtures` has a recording for it.
+    """
+
+    def __init__(self,
+                 results=120,
+                 page_size=20,
+                 latency_ms=0,
+                 feed_latency_ms=100,
+                 fixtures=None,
+                 tiles=16,
+                 photos=3,
+                 host="127.0.0.1",
+                 port=0):
+        self.results = results
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.feed_latency_ms = feed_latency_ms
+        self.fixtures = fixtures or {}
+        self.tiles = tiles
+        self.photos = photos
+        self.host = host
+        self.port = port
+        self.requests = Counter()
+        self.bytes_served = Counter()
+        self._places = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def maps_url(self):
+        return f"{self.base_url}/maps"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port),
+                                          FixtureHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fixture = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name="fixture-server",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def listings(self, query):
+        """Returns the (place id, business) pairs of a query, registering
+        them so their place panes can be served"""
+        businesses = self.fixtures.get(query)
+        if businesses is None:
+            businesses = self.fixtures[query] = generate_businesses(
+                query, self.results)
+        base = zlib.crc32(query.encode("utf-8")) << 20
+        listings = [(base + index, business)
+                    for index, business in enumerate(businesses)]
+        with self._lock:
+            self._places.update(listings)
+        return listings
+
+    def place(self, place_id):
+        with self._lock:
+            return self._places.get(place_id)
+
+    def tiles_html(self):
+        return "".join(f'<img src="/maps/vt?x={index}&y=0">'
+                       for index in range(self.tiles))
+
+
+def place_href(place_id, business):
+    slug = quote_plus(business["name"])
+    return f"/maps/place/{slug}/data=!4m7!3m6!1s0x0:{place_id:#x}!8m2"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # Blobs standing in for tiles, photos, fonts and the Maps script
+    # bundle, sized like the real thing
+    BLOBS = {
+        "tile": (b"\0" * 20_000, "image/png"),
+        "photo": (b"\0" * 40_000, "image/jpeg"),
+        "font": (b"\0" * 30_000, "font/woff2"),
+        "script": (b"/*" + b" " * 500_000 + b"*/", "text/javascript"),
+    }
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fixture = self.server.fixture
+        url = urlsplit(self.path)
+        path = url.path
+        if fixture.latency_ms:
+            time.sleep(fixture.latency_ms / 1000)
+
+        if path.rstrip("/") == "/maps" or path.startswith("/maps/@"):
+            kind = "home"
+            self.send(HOME_HTML.format(tiles=fixture.tiles_html()))
+        elif path == "/fixture/feed":
+            kind = "feed"
+            params = parse_qs(url.query)
+            self.send_feed(fixture, params.get("q", [""])[0],
+                           int(params.get("offset", ["0"])[0]))
+        elif path.startswith("/maps/place/"):
+            kind = "place"
+            self.send_place(fixture, path)
+        elif path.startswith("/maps/vt"):
+            kind = "tile"
+            self.send(*self.BLOBS["tile"])
+        elif path.startswith("/fixture/photo/"):
+            kind = "photo"
+            self.send(*self.BLOBS["photo"])
+        elif path == "/fixture/font.woff2":
+            kind = "font"
+            self.send(*self.BLOBS["font"])
+        elif path == "/fixture/app.js":
+            kind = "script"
+            self.send(*self.BLOBS["script"], cache_s=86400)
+        else:
+            kind = "missing"
+            self.send("Not found", status=404)
+        with fixture._lock:
+            fixture.requests[kind] += 1
+            fixture.bytes_served[kind] += self.sent_bytes
+
+    def send(self, body, content_type="text/html", status=200, cache_s=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+            content_type += "; charset=utf-8"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if cache_s is not None:
+            self.send_header("Cache-Control", f"public, max-age={cache_s}")
+        self.end_headers()
+        self.wfile.write(body)
+        self.sent_bytes = len(body)
+
+    def send_feed(self, fixture, query, offset):
+        if fixture.feed_latency_ms:
+            time.sleep(fixture.feed_latency_ms / 1000)
+        listings = fixture.listings(query)
+        page = listings[offset:offset + fixture.page_size]
+        cards = "".join(
+            CARD_HTML.format(name=html.escape(business["name"]),
+                             href=place_href(place_id, business),
+                             rating=business.get("reviews_average") or "",
+                             reviews=business.get("reviews_count") or 0,
+                             id=place_id) for place_id, business in page)
+        next_offset = offset + len(page)
+        self.send(json.dumps({
+            "html": cards,
+            "next": next_offset,
+            "end": next_offset >= len(listings),
+        }), "application/json")
+
+    def send_place(self, fixture, path):
+        place_id = None
+        marker = path.find("!1s0x0:")
+        if marker >= 0:
+            try:
+                place_id = int(path[marker + 7:].split("!")[0], 16)
+            except ValueError:
+                pass
+        business = fixture.place(place_id)
+        if business is None:
+            self.send("Unknown place", status=404)
+            return
+        website = business.get("website")
+        phone = business.get("phone_number")
+        self.send(
+            PLACE_HTML.format(
+                name=html.escape(business["name"]),
+                rating=business.get("reviews_average") or "",
+                reviews=business.get("reviews_count") or 0,
+                address=html.escape(business.get("address") or ""),
+                website=WEBSITE_HTML.format(
+                    website=html.escape(website)) if website else "",
+                phone=PHONE_HTML.format(
+                    digits="".join(filter(str.isdigit, phone)),
+                    phone=html.escape(phone)) if phone else "",
+                photos="".join(
+                    f'<img src="/fixture/photo/{place_id}-{index}.jpg">'
+                    for index in range(fixture.photos)),
+                tiles=fixture.tiles_html()))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m gmaps_scraper.fixture_server",
+        description="Serve a local stand-in for Google Maps")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--results",
+                        type=int,
+                        default=120,
+                        help="Listings per generated search")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--feed-latency-ms", type=int, default=100)
+    parser.add_argument("--fixtures",
+                        default=None,
+                        help="JSON file of recorded {query: [business]}")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = FixtureServer(
+        results=args.results,
+        page_size=args.page_size,
+        latency_ms=args.latency_ms,
+        feed_latency_ms=args.feed_latency_ms,
+        fixtures=load_fixtures(args.fixtures) if args.fixtures else None,
+        port=args.port)
+    with server:
+        print(f"Serving {server.maps_url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
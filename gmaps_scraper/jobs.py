@@ -0,0 +1,145 @@
+"""Resumable scrape jobs checkpointed to SQLite.
+
+A job remembers its query, the place URLs found by the search and a cursor:
+every listing before the cursor has been scraped, and the first `rows` rows
+of the job's results file belong to those listings. URLs are saved with
+every checkpoint while the search runs. Resuming a job drops any rows
+written after the last checkpoint and carries on from the cursor; the
+search is skipped if it had finished, and otherwise runs again, appending
+only URLs it had not found before.
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+
+RUNNING = "running"
+FAILED = "failed"
+DONE = "done"
+
+
+@dataclass
+class ScrapeJob:
+    """Holds the state needed to continue an interrupted scrape"""
+    job_id: str
+    search_term: str
+    total: int
+    results_path: str
+    # URLs found so far in feed order; None until the first checkpoint
+    urls: list[str] = None
+    cursor: int = 0
+    # Rows written for the listings before the cursor; failed listings
+    # write none
+    rows: int = 0
+    status: str = RUNNING
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    # Bounding box "south,west,north,east" for an area search, searched
+    # tile by tile
+    area: str = None
+    # Whether the search finished, so `urls` holds every listing
+    searched: bool = False
+
+    @property
+    def finished(self):
+        return self.searched and self.cursor >= len(self.urls)
+
+    def describe(self):
+        found = "?" if self.urls is None else len(self.urls)
+        started = time.strftime("%Y-%m-%d %H:%M",
+                                time.localtime(self.created_at))
+        where = "" if self.area is None else f" in {self.area}"
+        return (f"{self.search_term}{where} ({self.cursor}/{found} listings, "
+                f"{self.status}, started {started})")
+
+
+class JobStore:
+    """Saves and loads ScrapeJob checkpoints"""
+
+    def __init__(self, path='output/.cache/jobs.sqlite'):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Checkpoints are written from the browser pool's thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                search_term TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                results_path TEXT NOT NULL,
+                urls TEXT,
+                cursor INTEGER NOT NULL,
+                rows INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                area TEXT,
+                searched INTEGER NOT NULL DEFAULT 0
+            )""")
+        self.connection.commit()
+
+    def create(self, search_term, total, results_path, area=None):
+        job = ScrapeJob(uuid.uuid4().hex[:12],
+                        search_term,
+                        total,
+                        results_path,
+                        area=area)
+        self.save(job)
+        return job
+
+    def save(self, job):
+        """Writes the whole job, including its URL list"""
+        job.updated_at = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, search_term, total, "
+            "results_path, urls, cursor, rows, status, created_at, "
+            "updated_at, area, searched) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.job_id, job.search_term, job.total, job.results_path,
+             None if job.urls is None else json.dumps(job.urls), job.cursor,
+             job.rows, job.status, job.created_at, job.updated_at, job.area,
+             int(job.searched)))
+        self.connection.commit()
+
+    def checkpoint(self, job):
+        """Writes only the cursor, row count and status, which change on
+        every listing"""
+        job.updated_at = time.time()
+        self.connection.execute(
+            "UPDATE jobs SET cursor = ?, rows = ?, status = ?, updated_at = ? "
+            "WHERE job_id = ?",
+            (job.cursor, job.rows, job.status, job.updated_at, job.job_id))
+        self.connection.commit()
+
+    def get(self, job_id):
+        row = self.connection.execute("SELECT * FROM jobs WHERE job_id = ?",
+                                      (job_id, )).fetchone()
+        return None if row is None else self._job_from_row(row)
+
+    def unfinished(self):
+        """Returns jobs that did not complete, newest first"""
+        rows = self.connection.execute(
+            "SELECT * FROM jobs WHERE status != ? ORDER BY updated_at DESC",
+            (DONE, )).fetchall()
+        return [self._job_from_row(row) for row in rows]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _job_from_row(row):
+        (job_id, search_term, total, results_path, urls, cursor, rows,
+         status, created_at, updated_at, area, searched) = row
+        return ScrapeJob(job_id, search_term, total, results_path,
+                         None if urls is None else json.loads(urls), cursor,
+                         rows, status, created_at, updated_at, area,
+                         bool(searched))
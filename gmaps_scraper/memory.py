@@ -0,0 +1,122 @@
+"""Memory bounds for long scrapes.
+
+A detail page that has opened thousands of places keeps growing: Chromium
+holds on to caches, compiled scripts and detached DOM from every pane. With
+a MemoryBudget, each detail worker hands its page back to the pool after
+`recycle_after` listings and leases a fresh one, and once the RSS of this
+process and its browsers crosses `max_rss_mb` every page is replaced and the
+pool's browsers are retired. Scraped rows can be spilled to disk with
+BusinessList(spill_rows=...).
+
+The process tree RSS is sampled every `check_every` listings, with or
+without a limit, for the peak and steady-state figures in summary(). RSS is
+read with psutil when it is installed; without it only the per-page limit
+applies and no RSS is reported.
+"""
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+
+# RSS samples the steady-state figure is the median of
+STEADY_SAMPLES = 50
+
+
+def tree_rss_mb():
+    """RSS of this process and all of its children, which include the
+    Playwright driver and the browsers, in MB. None without psutil."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process()
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / (1024 * 1024)
+
+
+@dataclass
+class MemoryBudget:
+    """Limits shared by the detail workers of a scrape"""
+    # Listings a page scrapes before it is replaced
+    recycle_after: int = 200
+    # Process tree RSS that replaces every page and browser
+    max_rss_mb: float = None
+    # Listings between RSS checks
+    check_every: int = 20
+    # Rows a BusinessList keeps in memory before spilling them to disk
+    spill_rows: int = 5000
+    listings: int = 0
+    page_recycles: int = 0
+    rss_recycles: int = 0
+    peak_rss_mb: float = None
+    # RSS of the latest checks, for the steady-state figure
+    rss_samples: deque = field(
+        default_factory=lambda: deque(maxlen=STEADY_SAMPLES))
+    # Steady-state RSS of the shards merged into this budget
+    shards_steady_mb: float = None
+    # Bumped on every RSS recycle; pages leased before it are replaced
+    generation: int = 0
+    # Listing count at the last RSS recycle; RSS takes a while to drop, so
+    # the next one waits for `recycle_after` more listings
+    last_rss_recycle: int = None
+
+    def check(self, pool, page_listings, generation):
+        """Records a scraped listing and returns True when the worker should
+        hand its page back: it has served `recycle_after` listings, or the
+        RSS limit was crossed since the page was leased"""
+        self.listings += 1
+        if self.listings % self.check_every == 0:
+            rss = tree_rss_mb()
+            if rss is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, rss)
+                self.rss_samples.append(rss)
+                if self.max_rss_mb is not None and rss > self.max_rss_mb and (
+                        self.last_rss_recycle is None
+                        or self.listings - self.last_rss_recycle
+                        >= self.recycle_after):
+                    logging.info(f"RSS {rss:.0f} MB is over "
+                                 f"{self.max_rss_mb:.0f} MB, recycling "
+                                 f"pages and browsers")
+                    self.generation += 1
+                    self.rss_recycles += 1
+                    self.last_rss_recycle = self.listings
+                    pool.recycle_browsers()
+        if (page_listings >= self.recycle_after
+                or generation != self.generation):
+            self.page_recycles += 1
+            return True
+        return False
+
+    def steady_rss_mb(self):
+        """Median RSS of the latest `STEADY_SAMPLES` checks, plus that of
+        any merged shards. None before the first check."""
+        samples = sorted(self.rss_samples)
+        steady = samples[len(samples) // 2] if samples else None
+        if self.shards_steady_mb is not None:
+            steady = (steady or 0) + self.shards_steady_mb
+        return steady
+
+    def merge(self, other):
+        """Adds the counters of a budget used in a shard. Shards run side by
+        side, so their peak and steady-state RSS add up."""
+        self.listings += other.listings
+        self.page_recycles += other.page_recycles
+        self.rss_recycles += other.rss_recycles
+        if other.peak_rss_mb is not None:
+            self.peak_rss_mb = (self.peak_rss_mb or 0) + other.peak_rss_mb
+        steady = other.steady_rss_mb()
+        if steady is not None:
+            self.shards_steady_mb = (self.shards_steady_mb or 0) + steady
+
+    def summary(self):
+
+        def megabytes(value):
+            return "n/a" if value is None else f"{value:.0f} MB"
+
+        return (f"{self.page_recycles} page recycles, {self.rss_recycles} "
+                f"RSS recycles, peak RSS {megabytes(self.peak_rss_mb)}, "
+                f"steady RSS {megabytes(self.steady_rss_mb())}")
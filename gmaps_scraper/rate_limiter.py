@@ -0,0 +1,170 @@
+"""Adaptive rate limiting for page navigations.
+
+Google answers aggressive scraping with consent walls, /sorry/ pages and
+"unusual traffic" notices. A single token bucket per process paces every
+navigation, whichever page or scrape it comes from. Its rate grows by a
+fixed step after each success and is cut by a factor on errors and blocks
+(AIMD), so it settles just below the rate that triggers blocks. A block also
+pauses every page for a jittered, exponentially growing cooldown.
+"""
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+BLOCK_URL_PATTERNS = ("/sorry/", "consent.google.com")
+
+BLOCK_TEXT_JS = """
+() => {
+    const text = document.body ? document.body.innerText.slice(0, 5000) : '';
+    return /unusual traffic|not a robot/i.test(text);
+}
+"""
+
+
+class BlockedError(Exception):
+    """The page was answered with a consent, captcha or block page"""
+
+
+async def detect_block(page):
+    """Returns why the page looks blocked, or None"""
+    for pattern in BLOCK_URL_PATTERNS:
+        if pattern in page.url:
+            return f"redirected to {pattern}"
+    try:
+        if await page.evaluate(BLOCK_TEXT_JS):
+            return "unusual traffic notice"
+    except Exception:
+        # A page that cannot be read is an error, not a block
+        pass
+    return None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff: a random delay of up to
+    base * 2**attempt seconds, capped at `cap`"""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+@dataclass
+class RateLimiterStats:
+    """Throttle counters of a RateLimiter"""
+    acquired: int = 0
+    throttled: int = 0
+    throttled_s: float = 0
+    successes: int = 0
+    errors: int = 0
+    blocks: int = 0
+    cooldowns: int = 0
+    cooldown_s: float = 0
+
+
+class RateLimiter:
+    """Token bucket with an AIMD-adjusted refill rate.
+
+    `rate` is in navigations per second and stays between `min_rate` and
+    `max_rate`. Successes add `increase`; errors multiply the rate by
+    `error_factor` and blocks by `block_factor`. A block also starts a
+    cooldown of backoff_delay(consecutive blocks) during which no tokens are
+    handed out. Safe to share between threads and event loops.
+    """
+
+    def __init__(self,
+                 rate=2.0,
+                 min_rate=0.2,
+                 max_rate=20.0,
+                 burst=4,
+                 increase=0.05,
+                 error_factor=0.9,
+                 block_factor=0.5,
+                 cooldown_base=5.0,
+                 cooldown_max=300.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.error_factor = error_factor
+        self.block_factor = block_factor
+        self.cooldown_base = cooldown_base
+        self.cooldown_max = cooldown_max
+        self.stats = RateLimiterStats()
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._consecutive_blocks = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Takes a token, returning how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = max(0.0, -self._tokens / self.rate)
+            # Tokens are not handed out during a cooldown
+            wait = max(wait, self._resume_at - now)
+            self.stats.acquired += 1
+            if wait > 0:
+                self.stats.throttled += 1
+                self.stats.throttled_s += wait
+            return wait
+
+    async def acquire(self):
+        """Waits until the next navigation may start"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def success(self):
+        with self._lock:
+            self.stats.successes += 1
+            self._consecutive_blocks = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def error(self):
+        with self._lock:
+            self.stats.errors += 1
+            self.rate = max(self.min_rate, self.rate * self.error_factor)
+
+    def block(self):
+        """Records a block page, cutting the rate and starting a cooldown.
+        Returns the cooldown in seconds."""
+        with self._lock:
+            self.stats.blocks += 1
+            self.rate = max(self.min_rate, self.rate * self.block_factor)
+            cooldown = backoff_delay(self._consecutive_blocks,
+                                     self.cooldown_base, self.cooldown_max)
+            self._consecutive_blocks += 1
+            resume_at = time.monotonic() + cooldown
+            if resume_at > self._resume_at:
+                self._resume_at = resume_at
+                self.stats.cooldowns += 1
+                self.stats.cooldown_s += cooldown
+            # Drop the burst so pages resume one at a time
+            self._tokens = min(self._tokens, 0)
+            return cooldown
+
+    def summary(self):
+        stats = self.stats
+        return (f"{self.rate:.2f} navigations/s, "
+                f"throttled {stats.throttled}x ({stats.throttled_s:.1f}s), "
+                f"{stats.blocks} blocks, {stats.errors} errors, "
+                f"{stats.cooldowns} cooldowns ({stats.cooldown_s:.1f}s)")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_rate_limiter():
+    """Returns the rate limiter shared by every scrape in this process"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimiter()
+        return _shared
@@ -0,0 +1,142 @@
+"""Incremental re-crawls against a previous dataset.
+
+Result cards in the feed already show each place's name and rating. A
+listing that was in the previous dataset and whose card still shows the
+same name and rating is taken from that dataset without opening its detail
+pane; new listings and listings whose card changed are scraped again.
+After the run, diff() lists what was added, removed and changed.
+
+    python -m gmaps_scraper scrape "Coffee Shops in Austin" --total 120 --since output/
+"""
+import json
+import logging
+import os
+
+from .cache import place_key
+from .core import BUSINESS_FIELD_NAMES, business_from_record
+from .dedup import load_history, read_records
+
+
+def parse_rating(value):
+    """'4,5', '4.5' or 4.5 -> 4.5; None when there is no rating"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def same_value(old, new):
+    """Compares a stored value with a scraped one, treating empty strings
+    as None and numbers read back from CSV as numbers"""
+    old = None if old == '' else old
+    new = None if new == '' else new
+    if old is None or new is None:
+        return old is new
+    if isinstance(old, (int, float)) or isinstance(new, (int, float)):
+        return parse_rating(old) == parse_rating(new)
+    return str(old).strip() == str(new).strip()
+
+
+class Snapshot:
+    """A previous dataset keyed by place, checked listing by listing.
+
+    Pass it to scrape_business as `snapshot`. Records without a place URL
+    cannot be matched to a listing and are left out.
+    """
+
+    def __init__(self, records):
+        self.records = {}
+        skipped = 0
+        for record in records:
+            url = record.get("place_url")
+            if not url:
+                skipped += 1
+                continue
+            self.records[place_key(url)] = record
+        if skipped:
+            logging.info(f"Snapshot: {skipped} records without a place URL "
+                         f"left out")
+        # Places listed in this run, unchanged or not
+        self.seen = set()
+        self.unchanged = 0
+
+    @classmethod
+    def load(cls, path):
+        """Loads a results file, or every result saved under a directory"""
+        records = (load_history(path)
+                   if os.path.isdir(path) else read_records(path))
+        return cls(records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def listed(self, url):
+        """Records that this run listed the place, so it is not reported as
+        removed. Returns its key."""
+        key = place_key(url)
+        self.seen.add(key)
+        return key
+
+    def business_for(self, url, signals):
+        """Returns the stored Business for a listing whose card signals
+        match the previous dataset, or None if it has to be scraped"""
+        record = self.records.get(self.listed(url))
+        if record is None or not signals:
+            return None
+        if not (same_value(record.get("name"), signals.get("name"))
+                and parse_rating(record.get("reviews_average"))
+                == parse_rating(signals.get("rating"))):
+            return None
+        self.unchanged += 1
+        business = business_from_record(record)
+        business.reviews_average = parse_rating(business.reviews_average)
+        business.place_url = url
+        return business
+
+    def diff(self, businesses):
+        """Compares this run's businesses with the snapshot. Removed places
+        are those the run did not list, so a run stopped early by `total`
+        reports the places past it as removed."""
+        added, changed = [], []
+        for business in businesses:
+            key = place_key(business.place_url) if business.place_url \
+                else None
+            record = self.records.get(key)
+            if record is None:
+                added.append(
+                    {name: getattr(business, name)
+                     for name in BUSINESS_FIELD_NAMES})
+                continue
+            fields = {
+                name: [record.get(name), getattr(business, name)]
+                for name in BUSINESS_FIELD_NAMES if name != "place_url"
+                and not same_value(record.get(name), getattr(business, name))
+            }
+            if fields:
+                changed.append({
+                    "place_url": business.place_url,
+                    "name": business.name,
+                    "fields": fields,
+                })
+        removed = [
+            record for key, record in self.records.items()
+            if key not in self.seen
+        ]
+        return {"added": added, "removed": removed, "changed": changed}
+
+
+def summarize(diff):
+    return (f"{len(diff['added'])} added, {len(diff['removed'])} removed, "
+            f"{len(diff['changed'])} changed")
+
+
+def diff_json(diff):
+    return json.dumps(diff, indent=2, ensure_ascii=False, default=str)
+
+
+def save_diff(diff, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(diff_json(diff))
+    return path
@@ -0,0 +1,260 @@
+"""Request blocking that keeps pages from downloading what the scraper
+never reads: map tiles, photos, media, fonts and analytics beacons.
+
+Only text is extracted, so none of these change the results. On Chromium
+the blocked URL patterns are handed to the browser (CDP
+Network.setBlockedURLs), so nothing else is intercepted and the scripts and
+styles every place page loads again are served from the HTTP cache.
+Playwright turns that cache off for a page once any route is set, so
+routing every request through Python is only the fallback, for other
+browsers and for policies with allow patterns.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+# URL patterns, where `*` matches any run of characters, as in CDP
+MAP_TILE_PATTERNS = (
+    "*/maps/vt*",
+    "*/kh/v=*",
+    "*://khms*.google*",
+    "*streetviewpixels*",
+    "*/maps/photometa/*",
+)
+
+ANALYTICS_PATTERNS = (
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*/gen_204*",
+    "*/log?*",
+)
+
+
+def _extensions(*extensions):
+    return tuple(pattern for extension in extensions
+                 for pattern in (f"*.{extension}", f"*.{extension}?*"))
+
+
+# Blocking by URL cannot see resource types, so each blocked type stands for
+# these patterns there. Extensions only match at the end of the path, so a
+# place named "Studio.Gifts" is not blocked.
+TYPE_URL_PATTERNS = {
+    "image":
+    _extensions("png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico") +
+    ("*.googleusercontent.com/*", ),
+    "media": _extensions("mp4", "webm", "m3u8", "mp3", "ogg"),
+    "font": _extensions("woff2", "woff", "ttf", "otf") +
+    ("*://fonts.gstatic.com/*", ),
+    "stylesheet": _extensions("css") + ("*://fonts.googleapis.com/css*", ),
+    "websocket": ("ws://*", "wss://*"),
+    "manifest": _extensions("webmanifest"),
+}
+
+# Rough transfer sizes used to estimate savings for resource types that were
+# never allowed through during the run
+TYPICAL_BYTES = {
+    "image": 25_000,
+    "media": 250_000,
+    "font": 40_000,
+    "stylesheet": 15_000,
+    "script": 60_000,
+    "fetch": 10_000,
+    "xhr": 10_000,
+}
+
+
+def _wildcard(pattern):
+    return re.compile(".*".join(map(re.escape, pattern.split("*"))))
+
+
+@dataclass(frozen=True)
+class ResourcePolicy:
+    """Allow/deny rules by resource type and URL pattern. Allow patterns win
+    over every deny rule."""
+    block_types: frozenset = frozenset()
+    block_patterns: tuple = ()
+    allow_patterns: tuple = ()
+
+    def __post_init__(self):
+        object.__setattr__(self, "_block",
+                           [_wildcard(p) for p in self.block_patterns])
+        object.__setattr__(self, "_allow",
+                           [_wildcard(p) for p in self.allow_patterns])
+
+    @property
+    def enabled(self):
+        return bool(self.block_types or self.block_patterns)
+
+    @property
+    def blocked_urls(self):
+        """The policy as URL patterns for Network.setBlockedURLs"""
+        return sorted({
+            pattern
+            for resource_type in self.block_types
+            for pattern in TYPE_URL_PATTERNS.get(resource_type, ())
+        } | set(self.block_patterns))
+
+    def blocks(self, resource_type, url):
+        if any(pattern.fullmatch(url) for pattern in self._allow):
+            return False
+        return (resource_type in self.block_types
+                or any(pattern.fullmatch(url) for pattern in self._block))
+
+
+RESOURCE_POLICIES = {
+    "default":
+    ResourcePolicy(block_types=frozenset({"image", "media", "font"}),
+                   block_patterns=MAP_TILE_PATTERNS),
+    "strict":
+    ResourcePolicy(block_types=frozenset(
+        {"image", "media", "font", "stylesheet", "websocket", "manifest"}),
+                   block_patterns=MAP_TILE_PATTERNS + ANALYTICS_PATTERNS),
+    "off":
+    ResourcePolicy(),
+}
+
+
+class ResourceStats:
+    """Counts allowed and blocked requests per resource type for one run"""
+
+    def __init__(self):
+        self.allowed = Counter()
+        self.blocked = Counter()
+        self.allowed_bytes = Counter()
+
+    def record_allowed(self, resource_type):
+        self.allowed[resource_type] += 1
+
+    def record_blocked(self, resource_type):
+        self.blocked[resource_type] += 1
+
+    def record_response(self, response):
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            self.allowed_bytes[response.request.resource_type] += int(length)
+
+    def merge(self, other):
+        """Adds the requests counted by another run, such as a shard's"""
+        self.allowed.update(other.allowed)
+        self.blocked.update(other.blocked)
+        self.allowed_bytes.update(other.allowed_bytes)
+
+    def mean_bytes(self, resource_type):
+        if self.allowed[resource_type] and self.allowed_bytes[resource_type]:
+            return (self.allowed_bytes[resource_type] /
+                    self.allowed[resource_type])
+        return TYPICAL_BYTES.get(resource_type, 10_000)
+
+    @property
+    def requests_saved(self):
+        return sum(self.blocked.values())
+
+    @property
+    def bytes_saved(self):
+        """Estimated from the mean size of allowed requests of the same
+        type, or a typical size when none were allowed"""
+        return sum(count * self.mean_bytes(resource_type)
+                   for resource_type, count in self.blocked.items())
+
+    @property
+    def bytes_downloaded(self):
+        return sum(self.allowed_bytes.values())
+
+    def summary(self):
+        return (f"Blocked {self.requests_saved} of "
+                f"{self.requests_saved + sum(self.allowed.values())} requests "
+                f"(~{self.bytes_saved / 1024 / 1024:.1f} MB saved, "
+                f"{self.bytes_downloaded / 1024 / 1024:.1f} MB downloaded)")
+
+
+@asynccontextmanager
+async def filter_resources(page, policy=None, stats=None):
+    """Applies the policy to every request the page makes while the block
+    runs, by URL through CDP where the browser allows it and by routing
+    every request otherwise"""
+    if policy is None or not policy.enabled:
+        yield page
+        return
+
+    session = None
+    if not policy.allow_patterns:
+        try:
+            session = await page.context.new_cdp_session(page)
+        except Exception:
+            # Not Chromium
+            pass
+    if session is not None:
+        async with block_urls(page, session, policy, stats):
+            yield page
+    else:
+        async with route_requests(page, policy, stats):
+            yield page
+
+
+@asynccontextmanager
+async def block_urls(page, session, policy, stats):
+    """Has Chromium block the policy's URLs, keeping its HTTP cache on"""
+    types = {}
+
+    def on_response(params):
+        types[params["requestId"]] = params["type"].lower()
+
+    def on_finished(params):
+        resource_type = types.pop(params["requestId"], "other")
+        stats.record_allowed(resource_type)
+        # Bytes that came over the network, so about none for cache hits
+        stats.allowed_bytes[resource_type] += int(
+            params.get("encodedDataLength", 0))
+
+    def on_failed(params):
+        types.pop(params["requestId"], None)
+        if params.get("blockedReason"):
+            stats.record_blocked(params.get("type", "other").lower())
+
+    try:
+        if stats is not None:
+            session.on("Network.responseReceived", on_response)
+            session.on("Network.loadingFinished", on_finished)
+            session.on("Network.loadingFailed", on_failed)
+        await session.send("Network.enable")
+        await session.send("Network.setBlockedURLs",
+                           {"urls": policy.blocked_urls})
+        yield
+    finally:
+        if not page.is_closed():
+            try:
+                await session.send("Network.setBlockedURLs", {"urls": []})
+                await session.detach()
+            except Exception as e:
+                logging.warning(f"Failed to stop blocking URLs: {e}")
+
+
+@asynccontextmanager
+async def route_requests(page, policy, stats):
+    """Routes every request through the policy. Playwright bypasses the HTTP
+    cache for routed pages."""
+
+    async def handle(route):
+        request = route.request
+        if policy.blocks(request.resource_type, request.url):
+            if stats is not None:
+                stats.record_blocked(request.resource_type)
+            await route.abort("blockedbyclient")
+        else:
+            if stats is not None:
+                stats.record_allowed(request.resource_type)
+            await route.fallback()
+
+    await page.route("**/*", handle)
+    if stats is not None:
+        page.on("response", stats.record_response)
+    try:
+        yield
+    finally:
+        if stats is not None:
+            page.remove_listener("response", stats.record_response)
+        if not page.is_closed():
+            await page.unroute("**/*", handle)
@@ -0,0 +1,199 @@
+"""Hit rates, promotion and health checks for the place pane selectors.
+
+Google renames its obfuscated classes every few weeks. Without checks, a
+scrape keeps going after that and saves empty columns for hours. A
+SelectorRegistry watches every selector of every field over a sliding
+window of listings, using the hits that fields.extract_fields() reports:
+
+- When a fallback hits clearly more often than the selector in front of
+  it, it is promoted, so its value is the one used from then on.
+- When a field with a `min_hit_rate` falls below it whatever the selector,
+  the registry fails. Every later extraction raises SelectorHealthError
+  and the scrape stops; without `fail_fast` it only logs an error.
+- A field that stays empty for a whole window is logged once.
+
+    registry = SelectorRegistry()
+    async for business in scrape_business(..., selectors=registry):
+        ...
+    print(registry.summary())
+"""
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+
+from .fields import FIELD_SPECS
+
+
+class SelectorHealthError(Exception):
+    """The selectors for a required field stopped matching the place pane"""
+
+
+@dataclass
+class SelectorStats:
+    """Hits of one selector over the whole run and the latest window"""
+    lookups: int = 0
+    hits: int = 0
+    recent: deque = field(default_factory=deque)
+
+    def add(self, hit, window):
+        self.lookups += 1
+        self.hits += hit
+        self.recent.append(hit)
+        if len(self.recent) > window:
+            self.recent.popleft()
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else None
+
+    def recent_rate(self):
+        return sum(self.recent) / len(self.recent) if self.recent else None
+
+
+class SelectorRegistry:
+    """Selector order and hit rates per field, shared by the detail workers
+    of one process"""
+
+    def __init__(self,
+                 specs=FIELD_SPECS,
+                 window=50,
+                 promote_margin=0.25,
+                 fail_fast=True):
+        self.window = window
+        self.promote_margin = promote_margin
+        self.fail_fast = fail_fast
+        # Current selector order per field, promoted fallbacks first
+        self.chains = {spec.name: list(spec.selectors) for spec in specs}
+        self.min_hit_rates = {spec.name: spec.min_hit_rate for spec in specs}
+        # {field: {selector: SelectorStats}}
+        self.stats = {
+            spec.name:
+            {selector: SelectorStats()
+             for selector in spec.selectors}
+            for spec in specs
+        }
+        # Whether each field was found at all, whatever the selector
+        self.fields = {spec.name: SelectorStats() for spec in specs}
+        self.promotions = []
+        self.failure = None
+        # Fields already reported as empty or below their minimum
+        self.empty = set()
+        self.unhealthy = set()
+
+    def chain(self, spec):
+        return tuple(self.chains.get(spec.name, spec.selectors))
+
+    def check(self):
+        """Raises the registry's failure, if it has one"""
+        if self.failure is not None:
+            raise SelectorHealthError(self.failure)
+
+    def record(self, specs, chains, hits, tracer=None):
+        """Records which selectors of each field hit on one listing, then
+        promotes fallbacks and checks field health"""
+        for spec, chain in zip(specs, chains):
+            matches = hits.get(spec.name) or [False] * len(chain)
+            stats = self.stats.setdefault(spec.name, {})
+            for selector, hit in zip(chain, matches):
+                stats.setdefault(selector, SelectorStats()).add(
+                    bool(hit), self.window)
+                if tracer is not None:
+                    tracer.count("selector_hits" if hit else "selector_misses",
+                                 field=spec.name,
+                                 selector=selector)
+            self.fields.setdefault(spec.name, SelectorStats()).add(
+                any(matches), self.window)
+            self._promote(spec.name, tracer)
+            self._check_health(spec.name, tracer)
+        self.check()
+
+    def _promote(self, name, tracer):
+        chain = self.chains.get(name)
+        stats = self.stats[name]
+        if not chain or len(stats[chain[0]].recent) < self.window:
+            return
+        for position in range(1, len(chain)):
+            ahead, selector = chain[position - 1], chain[position]
+            if (stats[selector].recent_rate() - stats[ahead].recent_rate()
+                    >= self.promote_margin):
+                chain[position - 1], chain[position] = selector, ahead
+                logging.warning(
+                    f"Selector for {name} promoted: {selector!r} hits "
+                    f"{stats[selector].recent_rate():.0%} of the last "
+                    f"{self.window} listings, {ahead!r} "
+                    f"{stats[ahead].recent_rate():.0%}")
+                self.promotions.append((name, selector, ahead))
+                if tracer is not None:
+                    tracer.count("selector_promotions", field=name)
+
+    def _check_health(self, name, tracer):
+        stats = self.fields[name]
+        if len(stats.recent) < self.window:
+            return
+        rate = stats.recent_rate()
+        if rate == 0 and name not in self.empty:
+            self.empty.add(name)
+            logging.warning(f"No selector for {name} matched in the last "
+                            f"{self.window} listings")
+        min_hit_rate = self.min_hit_rates.get(name)
+        if (min_hit_rate is None or rate >= min_hit_rate
+                or name in self.unhealthy):
+            return
+        self.unhealthy.add(name)
+        message = (f"{name} was found on {rate:.0%} of the last "
+                   f"{self.window} listings, below {min_hit_rate:.0%}; "
+                   f"the place pane selectors probably changed")
+        if tracer is not None:
+            tracer.count("selector_failures", field=name)
+        if self.fail_fast:
+            self.failure = self.failure or message
+        else:
+            logging.error(message)
+
+    def merge(self, other):
+        """Adds the counters of a registry used in another process, such as
+        a shard, and takes over its failure"""
+        for name, selectors in other.stats.items():
+            for selector, stats in selectors.items():
+                mine = self.stats.setdefault(name, {}).setdefault(
+                    selector, SelectorStats())
+                mine.lookups += stats.lookups
+                mine.hits += stats.hits
+        for name, stats in other.fields.items():
+            mine = self.fields.setdefault(name, SelectorStats())
+            mine.lookups += stats.lookups
+            mine.hits += stats.hits
+        self.promotions.extend(other.promotions)
+        self.failure = self.failure or other.failure
+
+    def rows(self):
+        """One dict per selector looked up, in each field's current order"""
+        rows = []
+        for name, selectors in self.stats.items():
+            order = self.chains.get(name, [])
+            for selector in sorted(selectors,
+                                   key=lambda s: order.index(s)
+                                   if s in order else len(order)):
+                stats = selectors[selector]
+                if not stats.lookups:
+                    continue
+                rows.append({
+                    "field": name,
+                    "selector": selector,
+                    "primary": bool(order) and selector == order[0],
+                    "lookups": stats.lookups,
+                    "hits": stats.hits,
+                    "hit_rate": stats.hit_rate(),
+                })
+        return rows
+
+    def summary(self):
+        parts = []
+        for name, stats in self.fields.items():
+            if stats.lookups:
+                parts.append(f"{name} {stats.hit_rate():.0%}")
+        text = "found " + ", ".join(parts) if parts else "no listings"
+        if self.promotions:
+            text += f", {len(self.promotions)} fallbacks promoted"
+        if self.failure is not None:
+            text += f"; failed: {self.failure}"
+        return text
@@ -0,0 +1,219 @@
+"""Detail scraping spread over several processes.
+
+A single process runs the Playwright driver, page parsing and exports on one
+event loop and one Python core. With shards, each of K child processes runs
+its own event loop and Chromium and the detail workers for a share of the
+listings. The search still runs in the parent, which hands listing URLs to
+whichever shard has room, so a slow shard gets fewer of them.
+
+Listings go to a shard as (index, url) pairs and come back in batches of
+(index, field values) tuples, which pickle to a fraction of the size of
+Business objects. A shard's selector registry, memory budget, tracer and
+wait and resource stats come back with its last message and are merged
+into the parent's. Used through scrape_business(..., shards=K).
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+
+# Listings handed to a shard per detail worker before any come back
+IN_FLIGHT_PER_WORKER = 2
+
+
+class InboxListings:
+    """Stands in for a ListingDiscovery in core.detail_worker inside a
+    shard: next() reads (index, url) pairs from the parent"""
+
+    def __init__(self, inbox):
+        self.inbox = inbox
+
+    async def next(self):
+        item = await asyncio.get_running_loop().run_in_executor(
+            None, self.inbox.get)
+        if item is None:
+            # Put the end marker back for the other detail workers
+            self.inbox.put(None)
+        return item
+
+
+async def serve_shard(inbox, outbox, concurrency, cache_mode, cache_path,
+                      cache_ttl, resource_policy, rate, retries, warm_url,
+                      memory, selectors, collect_stats):
+    """Scrapes the listings the parent sends until it sends None, returning
+    ([(index, values or None)], listings served from the cache, None)
+    batches. The last message carries {name: object} for the shard's
+    selector registry and memory budget and, with `collect_stats`, its
+    tracer and wait and resource stats."""
+    from .browser_pool import BrowserPool
+    from .cache import CACHE_OFF, PlaceCache
+    from .core import BUSINESS_FIELD_NAMES, ScrapeProgress, detail_worker
+    from .rate_limiter import RateLimiter
+    from .resource_filter import ResourceStats
+    from .tracing import Tracer
+    from .waits import WaitStats
+
+    cache = (None if cache_mode == CACHE_OFF else PlaceCache(
+        cache_path, cache_ttl))
+    report = {"selectors": selectors, "memory": memory}
+    if collect_stats:
+        report.update(tracer=Tracer(),
+                      wait_stats=WaitStats(),
+                      resource_stats=ResourceStats())
+    rate_limiter = None
+    if rate is not None:
+        rate_limiter = RateLimiter(rate=rate,
+                                   min_rate=rate / 10,
+                                   max_rate=rate * 10)
+    progress = ScrapeProgress()
+    finished = asyncio.Queue()
+    try:
+        async with BrowserPool(pages_per_browser=concurrency,
+                               rewarm=False,
+                               warm_url=warm_url) as pool:
+            listings = InboxListings(inbox)
+            workers = [
+                asyncio.create_task(
+                    detail_worker(pool, listings, finished, progress,
+                                  report.get("wait_stats"), cache, cache_mode,
+                                  resource_policy,
+                                  report.get("resource_stats"),
+                                  report.get("tracer"), rate_limiter, retries,
+                                  None, memory, selectors))
+                for _ in range(concurrency)
+            ]
+            running = len(workers)
+            cached = 0
+            while running:
+                batch = []
+                item = await finished.get()
+                while True:
+                    if item is None:
+                        running -= 1
+                    else:
+                        index, business = item
+                        batch.append((index, None if business is None else
+                                      tuple(
+                                          getattr(business, name)
+                                          for name in BUSINESS_FIELD_NAMES)))
+                    if finished.empty():
+                        break
+                    item = finished.get_nowait()
+                if batch:
+                    outbox.put((batch, progress.cached - cached, None))
+                    cached = progress.cached
+            await asyncio.gather(*workers)
+    finally:
+        if cache is not None:
+            cache.close()
+        outbox.put(([], 0, {
+            name: value
+            for name, value in report.items() if value is not None
+        }))
+        outbox.put(None)
+
+
+def run_shard(*args):
+    """Entry point of a shard process"""
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(serve_shard(*args))
+
+
+async def shard_worker(discovery,
+                       finished,
+                       progress,
+                       concurrency=4,
+                       cache_mode=None,
+                       resource_policy=None,
+                       rate=None,
+                       retries=2,
+                       warm_url=None,
+                       snapshot=None,
+                       memory=None,
+                       selectors=None,
+                       cache=None,
+                       wait_stats=None,
+                       resource_stats=None,
+                       tracer=None):
+    """Runs one shard process. Has the same contract as core.detail_worker:
+    takes (index, url) pairs from the discovery, puts (index, Business) on
+    the finished queue, and None once the shard has stopped. Listings a
+    re-crawl snapshot finds unchanged are not sent to the shard. The shard
+    opens `cache`'s file with the same TTL and works with its own copies of
+    the memory budget and selector registry; these, the tracer and the stats
+    are merged back into the given ones when the shard stops."""
+    from .core import Business
+
+    collected = {
+        "selectors": selectors,
+        "memory": memory,
+        "tracer": tracer,
+        "wait_stats": wait_stats,
+        "resource_stats": resource_stats,
+    }
+    context = multiprocessing.get_context("spawn")
+    inbox, outbox = context.Queue(), context.Queue()
+    process = context.Process(target=run_shard,
+                              args=(inbox, outbox, concurrency, cache_mode,
+                                    getattr(cache, "path", None),
+                                    getattr(cache, "ttl", None),
+                                    resource_policy, rate, retries, warm_url,
+                                    memory, selectors,
+                                    any(stats is not None
+                                        for stats in (tracer, wait_stats,
+                                                      resource_stats))),
+                              daemon=True)
+    process.start()
+    loop = asyncio.get_running_loop()
+    room = asyncio.Semaphore(concurrency * IN_FLIGHT_PER_WORKER)
+
+    async def feed():
+        while True:
+            await room.acquire()
+            item = await discovery.next()
+            if item is None:
+                break
+            index, url = item
+            if snapshot is not None:
+                business = snapshot.business_for(url,
+                                                 discovery.signals.get(url))
+                if business is not None:
+                    room.release()
+                    finished.put_nowait((index, business))
+                    continue
+            inbox.put(item)
+        inbox.put(None)
+
+    def receive():
+        # Wakes up every second to notice a shard that died
+        while True:
+            try:
+                return outbox.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    return None
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while (message := await loop.run_in_executor(None, receive)) \
+                is not None:
+            batch, cached, report = message
+            progress.cached += cached
+            for name, theirs in (report or {}).items():
+                if collected[name] is not None:
+                    collected[name].merge(theirs)
+            for index, values in batch:
+                room.release()
+                finished.put_nowait(
+                    (index, None if values is None else Business(*values)))
+        if process.exitcode not in (None, 0):
+            logging.error(f"Shard process exited with code "
+                          f"{process.exitcode}")
+    finally:
+        feeder.cancel()
+        inbox.put(None)
+        await loop.run_in_executor(None, process.join, 10)
+        if process.is_alive():
+            process.terminate()
+        finished.put_nowait(None)
@@ -0,0 +1,255 @@
+"""Area search: split a bounding box into map tiles and search each one.
+
+One Maps feed stops at roughly 120 listings, so a single query cannot reach
+every business of a dense category in a city. The area is split into a grid
+of viewport tiles, each opened with an `@lat,lng,zoom` URL and searched in
+parallel. A tile whose feed fills up is split into four and searched again.
+Listings from every tile go through one discovery, deduplicated by place,
+so detail scraping starts while tiles are still being searched.
+
+    python -m gmaps_scraper scrape "coffee shops" --city "Austin, TX" --total 1000
+"""
+import asyncio
+import json
+import logging
+import math
+import urllib.request
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+from .browser_pool import MAPS_URL
+from .cache import place_key
+from .core import discover_listings
+from .discovery import ListingDiscovery
+from .resource_filter import filter_resources
+from .tracing import trace
+
+# Listings a single Maps feed shows before it ends
+FEED_CAP = 120
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+
+# Playwright's default viewport
+VIEWPORT = (1280, 720)
+
+
+@dataclass(frozen=True)
+class BoundingBox:
+    """An area in degrees"""
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @property
+    def center(self):
+        return ((self.south + self.north) / 2, (self.west + self.east) / 2)
+
+    def split(self, rows=2, columns=2):
+        """Splits the box into a rows x columns grid, row by row"""
+        height = (self.north - self.south) / rows
+        width = (self.east - self.west) / columns
+        return [
+            BoundingBox(self.south + row * height,
+                        self.west + column * width,
+                        self.south + (row + 1) * height,
+                        self.west + (column + 1) * width)
+            for row in range(rows) for column in range(columns)
+        ]
+
+    def zoom(self, viewport=VIEWPORT):
+        """Largest Maps zoom level whose viewport still covers the box"""
+        latitude = math.radians(self.center[0])
+        width_zoom = math.log2(viewport[0] * 360 /
+                               (256 * max(self.east - self.west, 1e-6)))
+        height_zoom = math.log2(viewport[1] * 360 * math.cos(latitude) /
+                                (256 * max(self.north - self.south, 1e-6)))
+        return max(3, min(21, math.floor(min(width_zoom, height_zoom))))
+
+    def maps_url(self, maps_url=MAPS_URL):
+        """Maps home centred on the box, e.g. .../maps/@30.27,-97.74,13z"""
+        latitude, longitude = self.center
+        return (f"{maps_url.rstrip('/')}/@{latitude:.6f},{longitude:.6f},"
+                f"{self.zoom()}z")
+
+    def __str__(self):
+        return f"{self.south},{self.west},{self.north},{self.east}"
+
+
+def parse_bbox(text):
+    """'south,west,north,east' -> BoundingBox"""
+    try:
+        south, west, north, east = (float(part) for part in text.split(','))
+    except ValueError:
+        raise ValueError(f"Expected 'south,west,north,east', got {text!r}")
+    if south >= north or west >= east:
+        raise ValueError(f"Empty bounding box: {text!r}")
+    return BoundingBox(south, west, north, east)
+
+
+def geocode(place, timeout=10):
+    """Looks up the bounding box of a city or region with OpenStreetMap's
+    Nominatim service. Needs network access."""
+    url = f"{NOMINATIM_URL}?{urlencode({'q': place, 'format': 'json', 'limit': 1})}"
+    request = urllib.request.Request(
+        url, headers={"User-Agent": "gmaps-scraper area search"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        results = json.load(response)
+    if not results:
+        raise ValueError(f"Could not find {place!r}")
+    south, north, west, east = (float(value)
+                                for value in results[0]["boundingbox"])
+    return BoundingBox(south, west, north, east)
+
+
+def resolve_area(text):
+    """Parses a bounding box, or geocodes anything else as a place name"""
+    try:
+        return parse_bbox(text)
+    except ValueError:
+        return geocode(text)
+
+
+class TileDiscovery(ListingDiscovery):
+    """Discovery for one tile that forwards listings it has not seen in any
+    other tile to the merged discovery"""
+
+    def __init__(self, merged, claimed, total=FEED_CAP):
+        super().__init__(total)
+        self.merged = merged
+        self.claimed = claimed
+        # Card signals are looked up on the merged discovery
+        self.signals = merged.signals
+
+    def add(self, hrefs):
+        start = len(self.urls)
+        super().add(hrefs)
+        fresh = []
+        for url in self.urls[start:]:
+            key = place_key(url)
+            if key not in self.claimed:
+                self.claimed.add(key)
+                fresh.append(url)
+        if fresh:
+            self.merged.add(fresh)
+
+
+class TiledDiscoverer:
+    """Fills a scrape's discovery by searching an area tile by tile.
+
+    Starts from a `grid` x `grid` split of the area and searches `parallel`
+    tiles at once. A tile that yields `split_at` listings or more is split
+    into four, down to `max_depth` splits. Pass it to scrape_business as
+    `discoverer`.
+    """
+
+    def __init__(self,
+                 search_term,
+                 area,
+                 grid=2,
+                 parallel=2,
+                 split_at=int(FEED_CAP * 0.9),
+                 max_depth=3,
+                 maps_url=MAPS_URL):
+        self.search_term = search_term
+        self.area = area
+        self.grid = grid
+        self.parallel = parallel
+        self.split_at = split_at
+        self.max_depth = max_depth
+        self.maps_url = maps_url
+        self.tiles_searched = 0
+        self.tiles_split = 0
+
+    @property
+    def pages(self):
+        """Pages this discoverer keeps busy at once"""
+        return self.parallel
+
+    async def __call__(self,
+                       pool,
+                       discovery,
+                       wait_stats=None,
+                       resource_policy=None,
+                       resource_stats=None,
+                       tracer=None,
+                       rate_limiter=None):
+        tiles = asyncio.Queue()
+        for tile in self.area.split(self.grid, self.grid):
+            tiles.put_nowait((tile, 0))
+        claimed = set()
+
+        async def tile_worker():
+            # Each worker searches all its tiles on one page, so the pool is
+            # not re-leased, nor the page re-warmed, once per tile
+            async with AsyncExitStack() as stack:
+                lease = page = None
+                while True:
+                    tile, depth = await tiles.get()
+                    try:
+                        if page is not None and page.is_closed():
+                            # The page crashed; hand it back for a new one
+                            await lease.aclose()
+                            page = None
+                        if page is None:
+                            lease = await stack.enter_async_context(
+                                AsyncExitStack())
+                            with trace(tracer, "acquire_page"):
+                                leased = await lease.enter_async_context(
+                                    pool.page())
+                            await lease.enter_async_context(
+                                filter_resources(leased, resource_policy,
+                                                 resource_stats))
+                            page = leased
+                        await self.search_tile(page, discovery, claimed,
+                                               tile, depth, tiles,
+                                               wait_stats, tracer,
+                                               rate_limiter)
+                    except Exception as e:
+                        logging.error(f"Error occurred while searching tile "
+                                      f"{tile}: {e}")
+                        if page is None and lease is not None:
+                            await lease.aclose()
+                    finally:
+                        tiles.task_done()
+
+        workers = [
+            asyncio.create_task(tile_worker()) for _ in range(self.parallel)
+        ]
+        try:
+            await tiles.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        logging.info(f"Searched {self.tiles_searched} tiles "
+                     f"({self.tiles_split} split), found "
+                     f"{len(discovery.urls)} unique listings")
+
+    async def search_tile(self, page, discovery, claimed, tile, depth, tiles,
+                          wait_stats, tracer, rate_limiter):
+        """Searches one tile on `page`, queueing its quarters if its feed
+        was full"""
+        if len(discovery.urls) >= discovery.total:
+            return
+        found = TileDiscovery(discovery, claimed)
+        try:
+            await discover_listings(None,
+                                    self.search_term,
+                                    found,
+                                    wait_stats,
+                                    tracer=tracer,
+                                    maps_url=tile.maps_url(self.maps_url),
+                                    rate_limiter=rate_limiter,
+                                    page=page)
+        except Exception as e:
+            logging.error(f"Error occurred while searching tile {tile}: {e}")
+        self.tiles_searched += 1
+        if tracer is not None:
+            tracer.count("tiles", depth=depth)
+        if (len(found.urls) >= self.split_at and depth < self.max_depth
+                and len(discovery.urls) < discovery.total):
+            self.tiles_split += 1
+            for quarter in tile.split():
+                tiles.put_nowait((quarter, depth + 1))
@@ -0,0 +1,230 @@
+"""Lightweight tracing: phase spans, latency histograms and counters.
+
+A Tracer aggregates as it goes instead of keeping every event, so a long
+run costs a few dicts. Functions take an optional `tracer` and use
+trace(tracer, name), which does nothing when no tracer is given. Results
+can be exported as JSON or in the Prometheus text format.
+"""
+import bisect
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000,
+                      60000)
+
+
+@dataclass
+class SpanStats:
+    """Totals for one kind of span"""
+    count: int = 0
+    errors: int = 0
+    total_ms: float = 0
+    max_ms: float = 0
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+
+@dataclass
+class Histogram:
+    """Fixed-bucket histogram; counts[i] holds values up to bounds[i] and
+    the last count holds everything above the largest bound"""
+    bounds: tuple = LATENCY_BUCKETS_MS
+    counts: list = None
+    count: int = 0
+    total: float = 0
+
+    def __post_init__(self):
+        if self.counts is None:
+            self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile, or None when
+        it is empty or the quantile lies past the largest bound"""
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if self.count and seen >= q * self.count:
+                return bound
+        return None
+
+
+@dataclass
+class Tracer:
+    """Collects the spans, histograms and counters of one run"""
+    spans: dict[str, SpanStats] = field(default_factory=dict)
+    histograms: dict[str, Histogram] = field(default_factory=dict)
+    # {counter name: {sorted label items: value}}
+    counters: dict[str, dict] = field(default_factory=dict)
+    histogram_bounds: tuple = LATENCY_BUCKETS_MS
+
+    @contextmanager
+    def span(self, name):
+        """Times the block under `name`, counting it as an error if it
+        raises"""
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record_span(name, (time.perf_counter() - start) * 1000,
+                             failed)
+
+    def record_span(self, name, elapsed_ms, failed=False):
+        stats = self.spans.setdefault(name, SpanStats())
+        stats.count += 1
+        stats.errors += int(failed)
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+
+    def observe(self, name, value_ms):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(
+                self.histogram_bounds)
+        histogram.observe(value_ms)
+
+    def count(self, name, value=1, **labels):
+        values = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        values[key] = values.get(key, 0) + value
+
+    def merge(self, other):
+        """Adds the spans, histograms and counters of another tracer, such
+        as one used in a shard process"""
+        for name, theirs in other.spans.items():
+            stats = self.spans.setdefault(name, SpanStats())
+            stats.count += theirs.count
+            stats.errors += theirs.errors
+            stats.total_ms += theirs.total_ms
+            stats.max_ms = max(stats.max_ms, theirs.max_ms)
+        for name, theirs in other.histograms.items():
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(theirs.bounds)
+            histogram.counts = [
+                mine + count
+                for mine, count in zip(histogram.counts, theirs.counts)
+            ]
+            histogram.count += theirs.count
+            histogram.total += theirs.total
+        for name, values in other.counters.items():
+            mine = self.counters.setdefault(name, {})
+            for key, value in values.items():
+                mine[key] = mine.get(key, 0) + value
+
+    def span_rows(self):
+        """One dict per span, slowest total first, for display"""
+        return [{
+            "span": name,
+            "count": stats.count,
+            "errors": stats.errors,
+            "total_s": round(stats.total_ms / 1000, 3),
+            "mean_ms": round(stats.mean_ms, 1),
+            "max_ms": round(stats.max_ms, 1),
+        } for name, stats in sorted(self.spans.items(),
+                                    key=lambda item: -item[1].total_ms)]
+
+    def counter_rows(self, name):
+        return [{
+            **dict(labels), "count": value
+        } for labels, value in sorted(self.counters.get(name, {}).items())]
+
+    def to_dict(self):
+        return {
+            "spans": {
+                name: asdict(stats)
+                for name, stats in self.spans.items()
+            },
+            "histograms": {
+                name: {
+                    "bounds_ms": list(histogram.bounds),
+                    "counts": histogram.counts,
+                    "count": histogram.count,
+                    "sum_ms": histogram.total,
+                    "p50_ms": histogram.quantile(0.5),
+                    "p95_ms": histogram.quantile(0.95),
+                }
+                for name, histogram in self.histograms.items()
+            },
+            "counters": {
+                name: self.counter_rows(name)
+                for name in self.counters
+            },
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, prefix="gmaps_scraper"):
+        """Renders everything in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {prefix}_span_seconds Time spent in each phase",
+            f"# TYPE {prefix}_span_seconds summary",
+        ]
+        for name, stats in sorted(self.spans.items()):
+            label = _labels(span=name)
+            lines.append(f"{prefix}_span_seconds_sum{label} "
+                         f"{stats.total_ms / 1000:.6f}")
+            lines.append(f"{prefix}_span_seconds_count{label} {stats.count}")
+        lines.append(f"# TYPE {prefix}_span_errors_total counter")
+        for name, stats in sorted(self.spans.items()):
+            lines.append(f"{prefix}_span_errors_total{_labels(span=name)} "
+                         f"{stats.errors}")
+
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound / 1000:g}"}} '
+                             f'{cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.total / 1000:.6f}")
+            lines.append(f"{metric}_count {histogram.count}")
+
+        for name, values in sorted(self.counters.items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{metric}{_labels(**dict(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """Writes the trace as Prometheus text for .prom/.txt paths and as
+        JSON otherwise"""
+        text = (self.to_prometheus() if path.endswith((".prom", ".txt"))
+                else self.to_json())
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"'
+                          for name, value in labels.items()) + "}"
+
+
+def trace(tracer, name):
+    """tracer.span(name), or a no-op when tracing is off"""
+    return tracer.span(name) if tracer is not None else nullcontext()
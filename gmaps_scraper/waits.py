@@ -0,0 +1,140 @@
+"""Event-driven waits that replace the fixed wait_for_timeout sleeps.
+
+Each wait resolves as soon as its DOM condition holds, is capped by a timeout
+ceiling, and is recorded against the fixed sleep it replaces so a run can
+report how much time it saved.
+"""
+import logging
+import time
+from dataclasses import dataclass, field
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+PLACE_LINK_SELECTOR = 'a[href*="/maps/place"]'
+PLACE_TITLE_SELECTOR = 'h1.DUwDvf'
+
+
+@dataclass
+class WaitStep:
+    """Totals for one kind of wait"""
+    waits: int = 0
+    timeouts: int = 0
+    waited_ms: float = 0
+    budget_ms: float = 0
+
+
+@dataclass
+class WaitStats:
+    """Records every wait of a run against its old fixed budget"""
+    steps: dict[str, WaitStep] = field(default_factory=dict)
+
+    def record(self, step, waited_ms, budget_ms, timed_out):
+        totals = self.steps.setdefault(step, WaitStep())
+        totals.waits += 1
+        totals.timeouts += int(timed_out)
+        totals.waited_ms += waited_ms
+        totals.budget_ms += budget_ms
+
+    def merge(self, other):
+        """Adds the waits recorded by another run, such as a shard's"""
+        for step, theirs in other.steps.items():
+            totals = self.steps.setdefault(step, WaitStep())
+            totals.waits += theirs.waits
+            totals.timeouts += theirs.timeouts
+            totals.waited_ms += theirs.waited_ms
+            totals.budget_ms += theirs.budget_ms
+
+    @property
+    def waited_ms(self):
+        return sum(step.waited_ms for step in self.steps.values())
+
+    @property
+    def budget_ms(self):
+        return sum(step.budget_ms for step in self.steps.values())
+
+    @property
+    def saved_ms(self):
+        """Time saved compared with the fixed sleeps, summed over all pages"""
+        return self.budget_ms - self.waited_ms
+
+    def summary(self):
+        """Returns a one-line report of the time spent and saved"""
+        return (f"Waited {self.waited_ms / 1000:.2f}s instead of "
+                f"{self.budget_ms / 1000:.2f}s "
+                f"(saved {self.saved_ms / 1000:.2f}s)")
+
+
+async def wait_for(page,
+                   expression,
+                   arg=None,
+                   *,
+                   step,
+                   budget_ms,
+                   timeout_ms,
+                   stats=None):
+    """Waits until the JavaScript predicate returns a truthy value or the
+    timeout ceiling is reached. Returns True if the condition held."""
+    start = time.perf_counter()
+    timed_out = False
+    try:
+        await page.wait_for_function(expression, arg=arg, timeout=timeout_ms)
+    except PlaywrightTimeoutError:
+        timed_out = True
+        logging.debug(f"Wait '{step}' timed out after {timeout_ms}ms")
+    if stats is not None:
+        stats.record(step, (time.perf_counter() - start) * 1000, budget_ms,
+                     timed_out)
+    return not timed_out
+
+
+async def wait_for_search_box(page, stats=None, timeout_ms=15000):
+    """Waits for the Maps search box after the initial navigation"""
+    return await wait_for(page,
+                          "() => !!document.querySelector('#searchboxinput')",
+                          step="search_box",
+                          budget_ms=5000,
+                          timeout_ms=timeout_ms,
+                          stats=stats)
+
+
+async def wait_for_search_term(page, search_term, stats=None,
+                               timeout_ms=3000):
+    """Waits until the search box holds the typed search term"""
+    return await wait_for(
+        page,
+        "term => document.querySelector('#searchboxinput')?.value === term",
+        search_term,
+        step="fill",
+        budget_ms=3000,
+        timeout_ms=timeout_ms,
+        stats=stats)
+
+
+async def wait_for_results(page, stats=None, timeout_ms=15000):
+    """Waits for the results feed, or for a single place pane when the
+    search resolves straight to one business"""
+    return await wait_for(
+        page,
+        """([link, title]) => !!document.querySelector(link)
+                              || !!document.querySelector(title)""",
+        [PLACE_LINK_SELECTOR, PLACE_TITLE_SELECTOR],
+        step="results",
+        budget_ms=5000,
+        timeout_ms=timeout_ms,
+        stats=stats)
+
+
+async def wait_for_place(page, stats=None, timeout_ms=10000):
+    """Waits until the place pane shows its title. Every listing is opened
+    with its own navigation, so a rendered title belongs to that listing."""
+    return await wait_for(
+        page,
+        """title => {
+               const heading = document.querySelector(title);
+               return !!heading && heading.innerText.trim().length > 0;
+           }""",
+        PLACE_TITLE_SELECTOR,
+        step="place",
+        budget_ms=3000,
+        timeout_ms=timeout_ms,
+        stats=stats)
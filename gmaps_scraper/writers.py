@@ -0,0 +1,96 @@
+"""Append-only row writers that flush every record as soon as it arrives,
+so a crashed or interrupted scrape keeps everything written so far"""
+import csv
+import json
+import os
+
+STREAM_FORMATS = ("jsonl", "csv")
+
+
+class JsonlWriter:
+    """Appends one JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvWriter(JsonlWriter):
+    """Appends CSV rows, writing the header only to a new file"""
+
+    def __init__(self, path, fieldnames):
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        super().__init__(path)
+        self._writer = csv.DictWriter(self._file,
+                                      fieldnames=fieldnames,
+                                      extrasaction='ignore')
+        if write_header:
+            self._writer.writeheader()
+            self._file.flush()
+
+    def write(self, record):
+        self._writer.writerow(record)
+        self._file.flush()
+        self.rows += 1
+
+
+def open_writer(directory, filename, fieldnames, fmt="jsonl"):
+    """Opens an append-only writer for `directory/filename.<fmt>`"""
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format: {fmt}")
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    return writer_for_path(f"{directory}/{filename}.{fmt}", fieldnames)
+
+
+def writer_for_path(path, fieldnames):
+    """Opens an append-only writer for an existing or new file, picking the
+    format from its extension"""
+    if path.endswith(".csv"):
+        return CsvWriter(path, fieldnames)
+    return JsonlWriter(path)
+
+
+def read_rows(path):
+    """Reads back the records written to a stream file. Empty CSV cells are
+    returned as None."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as file:
+        if path.endswith(".csv"):
+            return [{key: value if value != '' else None
+                     for key, value in row.items()}
+                    for row in csv.DictReader(file)]
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def truncate_rows(path, keep):
+    """Keeps only the first `keep` records of a stream file and returns them,
+    dropping rows written after the last checkpoint of an interrupted job"""
+    rows = read_rows(path)
+    if len(rows) > keep:
+        rows = rows[:keep]
+        fieldnames = None
+        if path.endswith(".csv"):
+            with open(path, encoding='utf-8') as file:
+                fieldnames = next(csv.reader(file))
+        os.remove(path)
+        with writer_for_path(path, fieldnames) as writer:
+            for row in rows:
+                writer.write(row)
+    return rows
@@ -1,257 +1,354 @@
-import streamlit as st
-import pandas as pd
 import asyncio
-import playwright.async_api
-from playwright.async_api import async_playwright
-import os
-import logging
-from dataclasses import dataclass, asdict, field
 import datetime
-import time
+import glob
+import logging
 import os
-import asyncio
-from playwright.async_api import async_playwright
-import streamlit as st
-import pandas as pd
+import pathlib
 import time
-import datetime
-import logging
-from dataclasses import dataclass, asdict, field
-
-# asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-
-# Ensure necessary system packages are installed
-os.system(
-    'apt-get update && apt-get install -y libnss3 libatk1.0-0 libatk-bridge2.0-0 libx11-xcb1 libxcomposite1 libxcursor1 libxdamage1 libxfixes3 libxi6 libxrandr2 libgbm1 libasound2 libpangocairo-1.0-0 libpango-1.0-0 libgdk-pixbuf2.0-0 libgtk-3-0 libdrm2'
-)
-
-# Install Playwright
-os.system('pip install playwright')
-
-# Install Playwright browsers
-os.system('playwright install')
-
-
-# Ensure Playwright browsers are installed
-async def install_playwright_browsers():
-    from playwright.__main__ import main as playwright_main
-    await asyncio.create_task(playwright_main(['install']))
+from dataclasses import asdict
 
+import streamlit as st
 
-# asyncio.run(install_playwright_browsers())
-
-
-# Ensuring Playwright browsers are installed
-async def install_playwright_browsers():
-    from playwright.__main__ import main as playwright_main
-    await asyncio.create_task(playwright_main(['install']))
-
+from gmaps_scraper.batch import QUERY_FORMATS, parse_queries, run_batch
+from gmaps_scraper.bootstrap import install_browsers
+from gmaps_scraper.broker import open_broker, submit_search
+from gmaps_scraper.browser_pool import BrowserPool
+from gmaps_scraper.cache import CACHE_MODES, PlaceCache
+from gmaps_scraper.core import (BUSINESS_FIELD_NAMES, BusinessList,
+                                ScrapeProgress, business_from_record,
+                                scrape_business)
+from gmaps_scraper.dedup import Deduplicator
+from gmaps_scraper.jobs import DONE, FAILED, JobStore, ScrapeJob
+from gmaps_scraper.memory import MemoryBudget
+from gmaps_scraper.rate_limiter import shared_rate_limiter
+from gmaps_scraper.recrawl import Snapshot, diff_json, save_diff, summarize
+from gmaps_scraper.resource_filter import RESOURCE_POLICIES, ResourceStats
+from gmaps_scraper.selector_registry import (SelectorHealthError,
+                                             SelectorRegistry)
+from gmaps_scraper.tiling import TiledDiscoverer, parse_bbox, resolve_area
+from gmaps_scraper.tracing import Tracer
+from gmaps_scraper.waits import WaitStats
+from gmaps_scraper.writers import (STREAM_FORMATS, truncate_rows,
+                                   writer_for_path)
+
+# Rows shown in the results table in memory-bounded mode
+BOUNDED_TABLE_ROWS = 1000
+# Detail pages a job may scrape in parallel
+MAX_CONCURRENCY = 16
+# Tiles an area search searches at once
+TILE_PARALLEL = 2
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-@dataclass
-class Business:
-    """Holds business data"""
-    name: str = None
-    address: str = None
-    website: str = None
-    phone_number: str = None
-    # reviews_count: int = None
-    reviews_average: float = None
-
-    def __eq__(self, other):
-        if not isinstance(other, Business):
-            return NotImplemented
-        return (self.name, self.address, self.website, self.phone_number,
-                self.reviews_average) == \
-               (other.name, other.address, other.website, other.phone_number,
-                 other.reviews_average)
-
-    def __hash__(self):
-        return hash((self.name, self.address, self.website, self.phone_number,
-                     self.reviews_average))
-
-
-@dataclass
-class BusinessList:
-    """Holds list of Business objects, and saves to both Excel and CSV"""
-    business_list: list[Business] = field(default_factory=list)
-    save_at = 'output'
-
-    def dataframe(self):
-        """Transform business_list to pandas DataFrame"""
-        return pd.json_normalize(
-            (asdict(business) for business in self.business_list), sep="_")
-
-    def save_to_excel(self, filename):
-        """Saves pandas DataFrame to Excel (xlsx) file and returns file path"""
-        if not os.path.exists(self.save_at):
-            os.makedirs(self.save_at)
-        file_path = f"{self.save_at}/{filename}.xlsx"
-        try:
-            self.dataframe().to_excel(file_path, index=False)
-            logging.info(f"Saved data to {file_path}")
-            return file_path  # Return the file path after saving
-        except Exception as e:
-            logging.error(f"Failed to save data to Excel: {e}")
-            return None
-
-    def save_to_csv(self, filename):
-        """Saves pandas DataFrame to CSV file"""
-        if not os.path.exists(self.save_at):
-            os.makedirs(self.save_at)
-        file_path = f"{self.save_at}/{filename}.csv"
-        try:
-            self.dataframe().to_csv(file_path, index=False)
-            logging.info(f"Saved data to {file_path}")
-        except Exception as e:
-            logging.error(f"Failed to save data to CSV: {e}")
-
-    def get_row_size(self):
-        """Returns the number of rows in the DataFrame"""
-        return len(self.business_list)
-
-
-async def scrape_business(search_term, total):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+@st.cache_resource
+def ensure_browsers_installed():
+    """Installs the Playwright browsers once per server process instead of on
+    every rerun. Hosts like Streamlit Cloud have no separate setup step, so
+    the app still has to do it itself."""
+    install_browsers()
+
+
+@st.cache_resource
+def get_browser_pool():
+    """Returns the browser pool shared by every session and rerun"""
+    ensure_browsers_installed()
+    # Room for the most detail workers plus an area search's tiles
+    return BrowserPool.in_background(pages_per_browser=MAX_CONCURRENCY +
+                                     TILE_PARALLEL)
+
+
+@st.cache_resource
+def get_broker():
+    """Returns the task broker that worker processes read from"""
+    return open_broker()
+
+
+def area_from_input(area_text):
+    """Returns the area input as a bounding box string, or None when it is
+    empty. Stops the run if the area cannot be found."""
+    if not area_text:
+        return None
+    try:
+        return str(resolve_area(area_text))
+    except Exception as e:
+        st.error(f"Could not find the area {area_text!r}: {e}")
+        st.stop()
+
+
+def show_worker_jobs(broker):
+    """Lists the jobs queued for worker processes with their progress and a
+    download of the rows scraped so far"""
+    for job_id, label, created_at in broker.jobs()[:10]:
+        counts = broker.counts(job_id)
+        started = time.strftime("%Y-%m-%d %H:%M", time.localtime(created_at))
+        st.markdown(f"**{label}** (started {started}): " + ", ".join(
+            f"{count} {status}" for status, count in sorted(counts.items())))
+        records = [record for _, record in broker.results(job_id)]
+        if records:
+            business_list = BusinessList()
+            business_list.extend(
+                business_from_record(record) for record in records)
+            st.download_button(
+                label=f"Download {len(records)} rows",
+                data=business_list.dataframe().to_csv(index=False),
+                file_name=f"job_{job_id}.csv",
+                mime="text/csv",
+                key=f"download_{job_id}")
+
+
+def show_trace(tracer, selectors=None):
+    """Shows where the run's time went and how often each selector hit, with
+    JSON and Prometheus exports"""
+    with st.expander("Trace"):
+        st.markdown("**Phases**")
+        st.dataframe(tracer.span_rows())
+
+        listing = tracer.histograms.get("listing")
+        if listing is not None and listing.count:
+            st.markdown("**Listing latency**")
+            labels = [f"<= {bound} ms" for bound in listing.bounds]
+            labels.append(f"> {listing.bounds[-1]} ms")
+            st.dataframe([{
+                "latency": label,
+                "listings": count
+            } for label, count in zip(labels, listing.counts) if count])
+            p50, p95 = (labels[listing.bounds.index(bound)]
+                        if bound else labels[-1]
+                        for bound in (listing.quantile(0.5),
+                                      listing.quantile(0.95)))
+            st.text(f"p50 {p50}, p95 {p95}")
+
+        misses = tracer.counter_rows("field_misses")
+        if misses:
+            st.markdown("**Fields not found**")
+            st.dataframe(misses)
+
+        if selectors is not None and selectors.rows():
+            st.markdown("**Selectors**")
+            st.dataframe(selectors.rows())
+
+        st.download_button(label="Download Trace (JSON)",
+                           data=tracer.to_json(),
+                           file_name="trace.json",
+                           mime="application/json")
+        st.download_button(label="Download Trace (Prometheus)",
+                           data=tracer.to_prometheus(),
+                           file_name="trace.prom",
+                           mime="text/plain")
+
+
+async def run_job(job,
+                  job_store,
+                  concurrency,
+                  cache_mode,
+                  cache_ttl,
+                  resource_policy,
+                  shards=0,
+                  snapshot=None,
+                  memory=None):
+    """Scrapes a new or resumed job, streaming rows to its results file and
+    to the page, then exports the whole job to Excel"""
+    with st.spinner("Fetching data..."):
+        start_time = time.time()
+        wait_stats = WaitStats()
+        resource_stats = ResourceStats()
+        tracer = Tracer()
+        progress = ScrapeProgress()
+        selectors = SelectorRegistry()
+        pool = get_browser_pool()
+
+        # Rows checkpointed before an interruption are already in the results
+        # file; rows written after the last checkpoint are scraped again
+        business_list = BusinessList(
+            spill_rows=memory.spill_rows if memory is not None else None)
+        business_list.tracer = tracer
+        # Memory-bounded jobs only show their latest rows
+        table_rows = BOUNDED_TABLE_ROWS if memory is not None else None
+        business_list.extend(
+            business_from_record(record)
+            for record in truncate_rows(job.results_path, job.rows))
+        # Places already in the results file count as seen, so a resumed job
+        # does not write them again under a different URL
+        deduplicator = Deduplicator()
+        for business in business_list:
+            deduplicator.add(business)
+            if snapshot is not None and business.place_url:
+                snapshot.listed(business.place_url)
+
+        # Area jobs search their bounding box tile by tile
+        discoverer = None
+        if job.area is not None:
+            discoverer = TiledDiscoverer(job.search_term,
+                                         parse_bbox(job.area),
+                                         parallel=TILE_PARALLEL)
+
+        progress_bar = st.progress(0.0, text="Searching...")
+        table = st.empty()
+        rendered_at = 0
 
         try:
-            await page.goto("https://www.google.com/maps", timeout=60000)
-            await page.wait_for_timeout(5000)
-
-            await page.fill('//input[@id="searchboxinput"]', search_term)
-            await page.wait_for_timeout(3000)
-
-            await page.keyboard.press("Enter")
-            await page.wait_for_timeout(5000)
-
-            await page.hover(
-                '//a[contains(@href, "https://www.google.com/maps/place")]')
-
-            previously_counted = 0
-            listings = []
-
-            while True:
-                await page.mouse.wheel(0, 10000)
-                await page.wait_for_timeout(2000)
+            with PlaceCache(ttl=cache_ttl * 60 * 60) as cache, \
+                    writer_for_path(job.results_path,
+                                    BUSINESS_FIELD_NAMES) as writer:
+                async for business in pool.stream(
+                        scrape_business(job.search_term,
+                                        job.total,
+                                        concurrency,
+                                        wait_stats,
+                                        cache=cache,
+                                        cache_mode=cache_mode,
+                                        pool=pool,
+                                        progress=progress,
+                                        job=job,
+                                        job_store=job_store,
+                                        resource_policy=resource_policy,
+                                        resource_stats=resource_stats,
+                                        deduplicator=deduplicator,
+                                        tracer=tracer,
+                                        rate_limiter=shared_rate_limiter(),
+                                        discoverer=discoverer,
+                                        shards=shards,
+                                        snapshot=snapshot,
+                                        memory=memory,
+                                        selectors=selectors)):
+                    business_list.append(business)
+                    writer.write(asdict(business))
+                    progress_bar.progress(progress.fraction,
+                                          text=f"Scraped {progress.done} of "
+                                          f"{progress.found} listings")
+                    # Re-rendering the whole table is O(rows), so do it at
+                    # most once a second
+                    if time.time() - rendered_at > 1:
+                        table.dataframe(
+                            business_list.dataframe(last=table_rows))
+                        rendered_at = time.time()
+        except SelectorHealthError as e:
+            st.error(f"Stopped: {e}")
+        finally:
+            job.status = DONE if job.finished else FAILED
+            job_store.checkpoint(job)
+
+        progress_bar.progress(1.0,
+                              text=f"Scraped {progress.done} of "
+                              f"{progress.found} listings")
+        elapsed_time = time.time() - start_time
+
+        if job.status == FAILED:
+            st.warning("The job stopped before every listing was scraped. "
+                       "It can be resumed from the list of unfinished jobs.")
+
+        current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        search_for_filename = job.search_term.replace(' ', '_')
+
+        row_size = business_list.get_row_size()
+
+        excel_filename = f"({row_size}_Rows)__{current_datetime}__({search_for_filename})"
+
+        # Build the Excel file in memory, save it and serve the same bytes
+        export_start = time.time()
+        excel_file_path, excel_data = business_list.export_excel(
+            excel_filename)
+        export_time = time.time() - export_start
+
+        if excel_data:
+
+            st.success("Fetched completed!")
+
+            download_container = st.container()
+
+            with download_container:
+                st.markdown(
+                    ""
+                )  # Add some space above the button for better separation
+                st.download_button(label="Download Excel File",
+                                   data=excel_data,
+                                   file_name=f"{excel_filename}.xlsx",
+                                   mime="application/octet-stream")
 
-                current_count = await page.locator(
-                    '//a[contains(@href, "https://www.google.com/maps/place")]'
-                ).count()
-                if current_count >= total:
-
-                    all_listings = await page.locator(
-                        '//a[contains(@href, "https://www.google.com/maps/place")]'
-                    ).all()
-
-                    listings = all_listings[:total]
-
-                    break
-
-                elif current_count == previously_counted:
-
-                    listings = await page.locator(
-                        '//a[contains(@href, "https://www.google.com/maps/place")]'
-                    ).all()
-
-                    break
-
-                else:
-                    previously_counted = current_count
-
-            business_list = BusinessList()
-
-            for listing in listings:
-                try:
-                    await listing.click()
-                    await page.wait_for_timeout(3000)
-
-                    name_css_selector = 'h1.DUwDvf.lfPIob'
-                    address_xpath = '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'
-                    website_xpath = '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'
-                    phone_number_xpath = '//button[contains(@data-item-id, "phone")]//div[contains(@class, "fontBodyMedium")]'
-                    # review_count_xpath = '//button[@jsaction="pane.reviewChart.moreReviews"]//span'
-                    reviews_average_xpath = '//div[@jsaction="pane.reviewChart.moreReviews"]//div[@role="img"]'
-
-                    business = Business()
-
-                    if await page.locator(name_css_selector).count() > 0:
-                        business.name = await page.locator(name_css_selector
-                                                           ).inner_text()
-                    else:
-                        business.name = ""
-
-                    if await page.locator(address_xpath).count() > 0:
-                        address_elements = await page.locator(address_xpath
-                                                              ).all()
-                        if address_elements:
-                            business.address = await address_elements[
-                                0].inner_text()
-                        else:
-                            business.address = ""
-                    else:
-                        business.address = ""
-
-                    if await page.locator(website_xpath).count() > 0:
-                        website_elements = await page.locator(website_xpath
-                                                              ).all()
-                        if website_elements:
-                            business.website = await website_elements[
-                                0].inner_text()
-                        else:
-                            business.website = ""
-                    else:
-                        business.website = ""
-
-                    if await page.locator(phone_number_xpath).count() > 0:
-                        phone_elements = await page.locator(phone_number_xpath
-                                                            ).all()
-                        if phone_elements:
-                            business.phone_number = await phone_elements[
-                                0].inner_text()
-                        else:
-                            business.phone_number = ""
-                    else:
-                        business.phone_number = ""
-
-                    # if await page.locator(review_count_xpath).count() > 0:
-                    #     review_count_text = await page.locator(
-                    #         review_count_xpath).inner_text()
-                    #     business.reviews_count = int(
-                    #         review_count_text.split()[0].replace(',',
-                    #                                              '').strip())
-                    # else:
-                    #     business.reviews_count = None
-
-                    if await page.locator(reviews_average_xpath).count() > 0:
-                        reviews_average_text = await page.locator(
-                            reviews_average_xpath).get_attribute('aria-label')
-                        if reviews_average_text:
-                            business.reviews_average = float(
-                                reviews_average_text.split()[0].replace(
-                                    ',', '.').strip())
-                        else:
-                            business.reviews_average = None
-                    else:
-                        business.reviews_average = None
-
-                    business_list.business_list.append(business)
-                except Exception as e:
-                    logging.error(
-                        f'Error occurred while scraping listing: {e}')
-
-            await browser.close()
-            return business_list
-
-        except Exception as e:
-            logging.error(f'Error occurred during scraping: {e}')
-            await browser.close()
-            return BusinessList()
+        else:
+            st.warning(
+                "No file to download. Please make sure to run the scraper first."
+            )
+
+        st.markdown(f"**File Name:** `{excel_filename}.xlsx`")
+        st.markdown(f"**Rows streamed to:** `{job.results_path}`")
+        table.dataframe(business_list.dataframe(last=table_rows))
+        st.markdown("---")
+        st.text(f"Elapsed Time: {elapsed_time:.2f} seconds")
+        st.text(f"Export Time: {export_time:.2f} seconds")
+        st.text(f"Waits: {wait_stats.summary()}")
+        st.text(f"Duplicates skipped: {deduplicator.duplicates}")
+        st.text(f"Resources: {resource_stats.summary()}")
+        st.text(f"Rate limit: {shared_rate_limiter().summary()}")
+        st.text(f"Selectors: {selectors.summary()}")
+        if memory is not None:
+            st.text(f"Memory: {memory.summary()}")
+        if discoverer is not None:
+            st.text(f"Tiles: {discoverer.tiles_searched} searched, "
+                    f"{discoverer.tiles_split} split")
+        if snapshot is not None:
+            diff = snapshot.diff(business_list)
+            save_diff(diff,
+                      f"{os.path.splitext(job.results_path)[0]}__diff.json")
+            st.text(f"Changes: {snapshot.unchanged} unchanged, "
+                    f"{summarize(diff)}")
+            st.download_button(label="Download Changes (JSON)",
+                               data=diff_json(diff),
+                               file_name=f"{search_for_filename}__diff.json",
+                               mime="application/json")
+        show_trace(tracer, selectors)
+        st.markdown("---")
+
+
+async def run_batch_queries(queries, max_queries, concurrency, cache_mode,
+                            cache_ttl, resource_policy, stream_format):
+    """Runs an uploaded batch of queries on the shared browser pool and
+    offers the combined, deduplicated result for download"""
+    with st.spinner(f"Scraping {len(queries)} queries..."):
+        start_time = time.time()
+        pool = get_browser_pool()
+        current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_dir = f"{BusinessList.save_at}/batch_{current_datetime}"
+
+        with PlaceCache(ttl=cache_ttl * 60 * 60) as cache:
+            results, combined_path = await pool.run(
+                run_batch(queries,
+                          lambda query: scrape_business(
+                              query.query,
+                              query.total,
+                              concurrency,
+                              cache=cache,
+                              cache_mode=cache_mode,
+                              pool=pool,
+                              resource_policy=resource_policy,
+                              rate_limiter=shared_rate_limiter(),
+                              selectors=SelectorRegistry()),
+                          output_dir,
+                          BUSINESS_FIELD_NAMES,
+                          max_queries=max_queries,
+                          stream_format=stream_format))
+        elapsed_time = time.time() - start_time
+
+    st.success(f"Batch finished, files saved in `{output_dir}`")
+    st.dataframe([{
+        "query": result.query.query,
+        "rows": result.rows,
+        "file": result.path,
+        "error": result.error,
+    } for result in results])
+    if combined_path:
+        st.download_button(label="Download Combined File",
+                           # Read only when the button is clicked
+                           data=pathlib.Path(combined_path).read_bytes,
+                           file_name=os.path.basename(combined_path),
+                           mime="application/octet-stream")
+    st.markdown("---")
+    st.text(f"Elapsed Time: {elapsed_time:.2f} seconds")
+    st.text(f"Rate limit: {shared_rate_limiter().summary()}")
+    st.markdown("---")
 
 
 async def main():
@@ -272,57 +369,155 @@ async def main():
 
     total_results = st.number_input("Enter number of results",
                                     min_value=1,
-                                    max_value=1000,
+                                    max_value=10000,
                                     value=30)
 
-    if st.button("Get Data"):
-        if not search_term:
-            st.error("Please enter a search term")
-        else:
-
-            with st.spinner("Fetching data..."):
-                start_time = time.time()
-                business_list = await scrape_business(search_term,
-                                                      total_results)
-                elapsed_time = time.time() - start_time
-
-                current_datetime = datetime.datetime.now().strftime(
-                    "%Y%m%d_%H%M%S")
-                search_for_filename = search_term.replace(' ', '_')
-
-                row_size = business_list.get_row_size()
-
-                excel_filename = f"({row_size}_Rows)__{current_datetime}__({search_for_filename})"
-
-                # Save to Excel and get the file path
-                excel_file_path = business_list.save_to_excel(excel_filename)
-
-                if excel_file_path:
-
-                    st.success("Fetched completed!")
+    concurrency = st.number_input("Number of pages to scrape in parallel",
+                                  min_value=1,
+                                  max_value=MAX_CONCURRENCY,
+                                  value=4)
+
+    shards = st.number_input(
+        "Browser processes",
+        min_value=0,
+        max_value=os.cpu_count(),
+        value=0,
+        help="Scrape listings in this many separate processes, each with "
+        "its own browser and the number of pages above, to use more than "
+        "one CPU core. 0 scrapes in the app's own browser.")
+
+    with st.expander("Area search"):
+        area_text = st.text_input(
+            "City or bounding box",
+            placeholder="e.g. Austin, TX  /  30.1,-97.9,30.5,-97.5",
+            help="One search returns at most about 120 listings. With an "
+            "area, it is split into map tiles that are searched separately, "
+            "and tiles that fill up are split again. A bounding box is "
+            "south,west,north,east in degrees.")
+
+    with st.expander("Large jobs"):
+        memory_bounded = st.checkbox(
+            "Memory-bounded mode",
+            help="Replaces pages regularly and keeps only the latest rows "
+            "in memory, so memory use stays flat on jobs with thousands of "
+            "results. The results table shows the latest "
+            f"{BOUNDED_TABLE_ROWS} rows.")
+        recycle_after = st.number_input("Listings per page before it is "
+                                        "replaced",
+                                        min_value=10,
+                                        max_value=5000,
+                                        value=200)
+        max_rss_mb = st.number_input(
+            "Replace the browsers above this memory use (MB, 0 = never)",
+            min_value=0,
+            max_value=64000,
+            value=0)
+
+    with st.expander("Incremental re-crawl"):
+        previous_files = sorted(
+            (path for pattern in ("*.csv", "*.jsonl", "*.xlsx")
+             for path in glob.glob(f"{BusinessList.save_at}/{pattern}")),
+            key=os.path.getmtime,
+            reverse=True)
+        snapshot_path = st.selectbox(
+            "Previous results",
+            options=[None] + previous_files,
+            format_func=lambda path: "Off"
+            if path is None else os.path.basename(path),
+            help="Only open listings that are new or whose name or rating "
+            "changed; the rest are copied from this file. A diff of added, "
+            "removed and changed places is saved next to the results.")
+
+    with st.expander("Cache settings"):
+        cache_mode = st.selectbox("Cache mode",
+                                  options=list(CACHE_MODES),
+                                  format_func=CACHE_MODES.get)
+        cache_ttl = st.number_input("Cache lifetime (hours)",
+                                    min_value=1,
+                                    max_value=24 * 30,
+                                    value=24)
 
-                    download_container = st.container()
+    resource_profile = st.selectbox(
+        "Block page resources",
+        options=list(RESOURCE_POLICIES),
+        help="The default profile blocks map tiles, images, media and fonts")
 
-                    with download_container:
-                        st.markdown(
-                            ""
-                        )  # Add some space above the button for better separation
-                        st.download_button(label="Download Excel File",
-                                           data=open(excel_file_path,
-                                                     'rb').read(),
-                                           file_name=f"{excel_filename}.xlsx",
-                                           mime="application/octet-stream")
+    stream_format = st.selectbox("Save rows while scraping as",
+                                 options=STREAM_FORMATS,
+                                 format_func=str.upper)
 
-                else:
-                    st.warning(
-                        "No file to download. Please make sure to run the scraper first."
-                    )
+    job_store = JobStore()
+    job = None
 
-                st.markdown(f"**File Name:** `{excel_filename}.xlsx`")
-                st.dataframe(business_list.dataframe())
-                st.markdown("---")
-                st.text(f"Elapsed Time: {elapsed_time:.2f} seconds")
-                st.markdown("---")
+    if st.button("Get Data"):
+        if not search_term:
+            st.error("Please enter a search term")
+        else:
+            area = area_from_input(area_text)
+            current_datetime = datetime.datetime.now().strftime(
+                "%Y%m%d_%H%M%S")
+            search_for_filename = search_term.replace(' ', '_')
+            job = job_store.create(
+                search_term, total_results,
+                f"{BusinessList.save_at}/{current_datetime}__"
+                f"({search_for_filename}).{stream_format}", area)
+
+    unfinished_jobs = job_store.unfinished()
+    if unfinished_jobs and job is None:
+        with st.expander("Resume an unfinished job"):
+            resumable_job = st.selectbox("Unfinished jobs",
+                                         options=unfinished_jobs,
+                                         format_func=ScrapeJob.describe)
+            if st.button("Resume"):
+                job = resumable_job
+
+    with st.expander("Batch mode"):
+        query_file = st.file_uploader(
+            "Query file: one query per line, or CSV / JSONL with a query "
+            "column",
+            type=list(QUERY_FORMATS))
+        max_queries = st.number_input("Queries to scrape at the same time",
+                                      min_value=1,
+                                      max_value=8,
+                                      value=2)
+        run_batch_clicked = st.button("Run batch")
+
+    with st.expander("Worker queue"):
+        st.markdown(
+            "Queue the search for headless workers started with "
+            "`python -m gmaps_scraper worker`; this page does not need to "
+            "stay open while they run.")
+        broker = get_broker()
+        if st.button("Queue search"):
+            if not search_term:
+                st.error("Please enter a search term")
+            else:
+                submit_search(broker, search_term, total_results,
+                              area_from_input(area_text))
+        show_worker_jobs(broker)
+
+    if job is not None:
+        memory = None
+        if memory_bounded:
+            memory = MemoryBudget(recycle_after=recycle_after,
+                                  max_rss_mb=max_rss_mb or None)
+        await run_job(
+            job, job_store, concurrency, cache_mode, cache_ttl,
+            RESOURCE_POLICIES[resource_profile], shards,
+            None if snapshot_path is None else Snapshot.load(snapshot_path),
+            memory)
+    elif run_batch_clicked:
+        if query_file is None:
+            st.error("Please upload a query file")
+        else:
+            queries = parse_queries(
+                query_file.getvalue().decode('utf-8'),
+                os.path.splitext(query_file.name)[1].lstrip('.').lower(),
+                total_results)
+            await run_batch_queries(queries, max_queries, concurrency,
+                                    cache_mode, cache_ttl,
+                                    RESOURCE_POLICIES[resource_profile],
+                                    stream_format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,229 @@
+"""A small stdlib DOM for checking the field selectors without a browser.
+
+Parses HTML with html.parser and evaluates the subset of CSS and XPath that
+fields.FIELD_SPECS uses: tags, classes and attribute tests joined by
+descendant combinators, and //tag steps with @attr, @attr="v",
+contains(@attr, "v") and starts-with(., "v") predicates. Anything else
+raises ValueError, so a selector outside the subset fails its test instead
+of silently missing. innerText is approximated by the element's text with
+whitespace collapsed.
+"""
+import re
+from html.parser import HTMLParser
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr"
+}
+
+
+class Element:
+
+    def __init__(self, tag, attrs, parent=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        # Elements and text, in document order
+        self.children = []
+
+    def elements(self):
+        return [child for child in self.children if isinstance(child, Element)]
+
+    def descendants(self):
+        for child in self.elements():
+            yield child
+            yield from child.descendants()
+
+    def ancestors(self):
+        parent = self.parent
+        while parent is not None:
+            yield parent
+            parent = parent.parent
+
+    @property
+    def text_content(self):
+        return "".join(child if isinstance(child, str) else child.text_content
+                       for child in self.children)
+
+    @property
+    def inner_text(self):
+        return " ".join(self.text_content.split())
+
+
+class _TreeBuilder(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = self.current = Element("#document", {})
+
+    def handle_starttag(self, tag, attrs):
+        element = Element(tag, {name: value or ""
+                                for name, value in attrs}, self.current)
+        self.current.children.append(element)
+        if tag not in VOID_TAGS:
+            self.current = element
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.current = self.current.parent
+
+    def handle_endtag(self, tag):
+        for element in [self.current, *self.current.ancestors()]:
+            if element.tag == tag:
+                self.current = element.parent
+                return
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+
+def parse(html):
+    """Returns the document element of `html`"""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+COMPOUND = re.compile(r'(?:[^\s\[]|\[[^\]]*\])+')
+CSS_PART = re.compile(r'\.([\w-]+)|\[([\w-]+)(?:([\^*]?=)"([^"]*)")?\]')
+
+
+def _css_compound(compound):
+    """Returns a test for one compound selector such as div.a[role="b"]"""
+    match = re.match(r'[a-zA-Z][\w-]*|\*', compound)
+    tag = match.group() if match else None
+    rest = compound[match.end():] if match else compound
+    parts = list(CSS_PART.finditer(rest))
+    if "".join(part.group() for part in parts) != rest:
+        raise ValueError(f"Unsupported CSS selector part: {compound!r}")
+
+    def test(element):
+        if tag not in (None, "*") and element.tag != tag:
+            return False
+        for part in parts:
+            name, attribute, operator, value = part.groups()
+            if name is not None:
+                if name not in element.attrs.get("class", "").split():
+                    return False
+                continue
+            actual = element.attrs.get(attribute)
+            if actual is None:
+                return False
+            if operator == "=" and actual != value:
+                return False
+            if operator == "^=" and not actual.startswith(value):
+                return False
+            if operator == "*=" and value not in actual:
+                return False
+        return True
+
+    return test
+
+
+def query_css(root, selector):
+    """document.querySelector() for descendant combinators only"""
+    tests = [_css_compound(compound) for compound in
+             COMPOUND.findall(selector)]
+    for element in root.descendants():
+        if not tests[-1](element):
+            continue
+        # With only descendant combinators, matching each remaining
+        # compound on the nearest ancestor that passes it is enough
+        remaining = tests[:-1]
+        for ancestor in element.ancestors():
+            if remaining and remaining[-1](ancestor):
+                remaining.pop()
+        if not remaining:
+            return element
+    return None
+
+
+XPATH_STEP = re.compile(r'(//?)([\w-]+|\*)((?:\[[^\]]*\])*)')
+XPATH_PREDICATE = re.compile(
+    r'@([\w-]+)'
+    r'|@([\w-]+)\s*=\s*"([^"]*)"'
+    r'|contains\(@([\w-]+),\s*"([^"]*)"\)'
+    r'|starts-with\((\.|@[\w-]+),\s*"([^"]*)"\)')
+
+
+def _xpath_predicate(predicate):
+    match = XPATH_PREDICATE.fullmatch(predicate.strip())
+    if match is None:
+        raise ValueError(f"Unsupported XPath predicate: [{predicate}]")
+    (exists, equals, equals_value, contains, contains_value, starts,
+     starts_value) = match.groups()
+
+    def test(element):
+        if exists is not None:
+            return exists in element.attrs
+        if equals is not None:
+            return element.attrs.get(equals) == equals_value
+        if contains is not None:
+            return contains_value in element.attrs.get(contains, "")
+        value = (element.text_content if starts == "." else
+                 element.attrs.get(starts[1:], ""))
+        return value.startswith(starts_value)
+
+    return test
+
+
+def query_xpath(root, expression):
+    """The first node of document.evaluate(), for //tag[predicate] steps"""
+    steps = list(XPATH_STEP.finditer(expression))
+    if "".join(step.group() for step in steps) != expression:
+        raise ValueError(f"Unsupported XPath expression: {expression!r}")
+    context = [root]
+    for step in steps:
+        axis, tag, predicates = step.groups()
+        tests = [
+            _xpath_predicate(predicate)
+            for predicate in re.findall(r'\[([^\]]*)\]', predicates)
+        ]
+        found, seen = [], set()
+        for node in context:
+            candidates = (node.descendants()
+                          if axis == "//" else node.elements())
+            for element in candidates:
+                if (id(element) not in seen
+                        and tag in ("*", element.tag)
+                        and all(test(element) for test in tests)):
+                    seen.add(id(element))
+                    found.append(element)
+        context = found
+    # Document order, as FIRST_ORDERED_NODE_TYPE returns
+    order = {id(element): index
+             for index, element in enumerate(root.descendants())}
+    return min(context, key=lambda element: order[id(element)], default=None)
+
+
+def query(root, selector):
+    """Resolves a field selector the way EXTRACT_FIELDS_JS does: XPath when
+    it starts with '/' or '(', CSS otherwise"""
+    if selector.startswith("("):
+        raise ValueError(f"Unsupported XPath expression: {selector!r}")
+    if selector.startswith("/"):
+        return query_xpath(root, selector)
+    return query_css(root, selector)
+
+
+def extract(root, specs, chains=None):
+    """EXTRACT_FIELDS_JS in Python: returns ({field: raw value}, {field:
+    [hit per selector]}), taking each value from the first selector that
+    finds a non-blank one"""
+    values, hits = {}, {}
+    for spec, chain in zip(specs, chains or [spec.selectors
+                                             for spec in specs]):
+        values[spec.name] = None
+        hits[spec.name] = []
+        for selector in chain:
+            element = query(root, selector)
+            value = (None if element is None else
+                     element.attrs.get(spec.attribute)
+                     if spec.kind == "attribute" else element.inner_text)
+            hit = bool(value and value.strip())
+            if hit and values[spec.name] is None:
+                values[spec.name] = value
+            hits[spec.name].append(hit)
+    return values, hits
@@ -0,0 +1,125 @@
+"""SqliteBroker leasing, retries and results, with several workers sharing
+one SQLite file as they do on one machine"""
+import asyncio
+
+import pytest
+
+from gmaps_scraper.broker import (DONE, FAILED, LEASED, LISTING, QUEUED,
+                                  SEARCH, SqliteBroker, collect_results,
+                                  submit_search, submit_urls)
+
+URLS = [
+    f"https://www.google.com/maps/place/Biz+{index}/data=!4m7!3m6"
+    f"!1s0x0:{index:#x}!8m2" for index in range(1, 4)
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "broker.sqlite")
+
+
+@pytest.fixture
+def broker(path):
+    with SqliteBroker(path) as broker:
+        yield broker
+
+
+def test_workers_lease_different_tasks(path, broker):
+    job_id = submit_urls(broker, URLS)
+    with SqliteBroker(path) as other:
+        first = broker.lease("a", (LISTING, ), 60)
+        second = other.lease("b", (LISTING, ), 60)
+        assert first.task_id != second.task_id
+        assert (first.worker, second.worker) == ("a", "b")
+        assert other.complete(second, {"name": "Biz 2"})
+    assert broker.complete(first, {"name": "Biz 1"})
+    assert broker.counts(job_id) == {DONE: 2, QUEUED: 1}
+    assert [record["name"] for _, record in broker.results(job_id)
+            ] == ["Biz 2", "Biz 1"]
+
+
+def test_duplicate_places_are_queued_once(broker):
+    job_id = submit_urls(broker, URLS + URLS[:1])
+    assert broker.counts(job_id) == {QUEUED: 3}
+    assert not broker.submit(job_id, LISTING, {"url": URLS[0]}, "0x0:0x1")
+
+
+def test_expired_lease_passes_to_another_worker(broker):
+    job_id = submit_urls(broker, URLS[:1])
+    # A negative lease has expired as soon as it is granted
+    stale = broker.lease("a", (LISTING, ), -1)
+    task = broker.lease("b", (LISTING, ), 60)
+    assert task.task_id == stale.task_id
+    assert task.attempts == 2
+
+    assert broker.complete(task, {"name": "from b"})
+    # The worker that lost the lease can neither overwrite nor fail it
+    assert not broker.complete(stale, {"name": "from a"})
+    broker.fail(stale, "timed out")
+    assert broker.counts(job_id) == {DONE: 1}
+    assert broker.results(job_id) == [(1, {"name": "from b"})]
+
+
+def test_renew_keeps_the_lease(broker):
+    submit_urls(broker, URLS[:1])
+    task = broker.lease("a", (LISTING, ), -1)
+    broker.renew("a", 60)
+    assert broker.lease("b", (LISTING, ), 60) is None
+    assert broker.complete(task)
+
+
+def test_failed_tasks_retry_up_to_max_attempts(path):
+    with SqliteBroker(path, max_attempts=2) as broker:
+        job_id = submit_urls(broker, URLS[:1])
+        for attempt in (1, 2):
+            task = broker.lease("a", (LISTING, ), 60)
+            assert task.attempts == attempt
+            broker.fail(task, "scrape failed")
+        assert broker.lease("a", (LISTING, ), 60) is None
+        assert broker.counts(job_id) == {FAILED: 1}
+
+
+def test_expired_leases_give_up_after_max_attempts(path):
+    with SqliteBroker(path, max_attempts=2) as broker:
+        job_id = submit_urls(broker, URLS[:1])
+        broker.lease("a", (LISTING, ), -1)
+        broker.lease("b", (LISTING, ), -1)
+        assert broker.lease("c", (LISTING, ), 60) is None
+        assert broker.counts(job_id) == {FAILED: 1}
+
+
+def test_release_requeues_without_using_an_attempt(broker):
+    job_id = submit_urls(broker, URLS[:2])
+    broker.lease("a", (LISTING, ), 60)
+    broker.lease("a", (LISTING, ), 60)
+    broker.release("a")
+    assert broker.counts(job_id) == {QUEUED: 2}
+    task = broker.lease("b", (LISTING, ), 60)
+    assert task.attempts == 1
+    assert broker.counts(job_id) == {QUEUED: 1, LEASED: 1}
+
+
+def test_lease_filters_by_kind(broker):
+    job_id = submit_search(broker, "coffee", 10)
+    assert broker.lease("a", (LISTING, ), 60) is None
+    task = broker.lease("a", (SEARCH, ), 60)
+    assert task.payload == {"search_term": "coffee", "total": 10,
+                            "area": None}
+    assert broker.complete(task)
+    # Searches finish without a result of their own
+    assert broker.results(job_id) == []
+
+
+def test_collect_results_until_job_finishes(broker):
+    job_id = submit_urls(broker, URLS[:2])
+    for name in ("Biz 1", "Biz 2"):
+        broker.complete(broker.lease("a", (LISTING, ), 60), {"name": name})
+
+    async def collect():
+        return [
+            record async for record in collect_results(broker, job_id, 0)
+        ]
+
+    assert [record["name"] for record in asyncio.run(collect())
+            ] == ["Biz 1", "Biz 2"]
@@ -0,0 +1,100 @@
+"""Deduplicator matching rules, without a browser or saved files"""
+from gmaps_scraper.dedup import (Deduplicator, normalize_address,
+                                 normalize_domain, normalize_phone)
+
+
+def place(feature, name="Blue Bottle Coffee", **fields):
+    return dict(
+        name=name,
+        place_url=f"https://www.google.com/maps/place/{name}/data=!4m7!3m6"
+        f"!1s0x0:{feature}!8m2",
+        **fields)
+
+
+def test_normalizers():
+    assert normalize_phone("+1 (510) 653-3394") == "5106533394"
+    assert normalize_phone("12-34") is None
+    assert normalize_domain("https://www.BlueBottle.com/menu") == (
+        "bluebottle.com")
+    assert normalize_domain("https://blue-bottle.wixsite.com/sf") is None
+    assert normalize_address("1 Ferry Street, San Francisco") == (
+        normalize_address("1 ferry st san francisco"))
+
+
+def test_same_place_key_is_a_duplicate():
+    deduplicator = Deduplicator()
+    assert deduplicator.add(place("0x1a", phone_number="510 111 1111")) is None
+    assert deduplicator.add(place("0x1a", name="Renamed")) == 0
+    assert deduplicator.duplicates == 1
+
+
+def test_different_place_keys_are_never_merged():
+    deduplicator = Deduplicator()
+    shared = dict(phone_number="+1 510-653-3394",
+                  address="1 Ferry Building",
+                  website="https://bluebottle.com")
+    assert deduplicator.add(place("0x1a", **shared)) is None
+    assert deduplicator.add(place("0x2b", **shared)) is None
+
+
+def test_fallbacks_link_records_without_place_url():
+    deduplicator = Deduplicator()
+    first = dict(name="Blue Bottle Coffee",
+                 address="1 Ferry Building",
+                 website="https://bluebottle.com")
+    assert deduplicator.add(first) is None
+    # Same site and address, whatever the name
+    assert deduplicator.add(
+        dict(name="BB", address="1 ferry building",
+             website="bluebottle.com/sf")) == 0
+    # A record with a place URL joins the cluster it has no conflict with
+    assert deduplicator.add(place("0x1a", address="1 Ferry Building")) == 0
+
+
+def test_phone_and_address_thresholds():
+    # "Blue Bottle" is 0.76 similar to "Blue Bottle Coffee": enough beside
+    # a shared phone, not beside a shared address alone
+    deduplicator = Deduplicator()
+    deduplicator.add(dict(name="Blue Bottle Coffee", phone_number="5106533394"))
+    assert deduplicator.add(
+        dict(name="Blue Bottle", phone_number="+1 510 653 3394")) == 0
+    assert deduplicator.add(
+        dict(name="Dental Clinic", phone_number="5106533394")) is None
+
+    deduplicator = Deduplicator()
+    deduplicator.add(dict(name="Blue Bottle Coffee", address="1 Ferry Bldg"))
+    assert deduplicator.add(dict(name="Blue Bottle",
+                                 address="1 Ferry Bldg")) is None
+    assert deduplicator.add(
+        dict(name="Blue Bottle Cafe", address="1 Ferry Bldg")) == 0
+
+
+def test_chain_branches_sharing_a_phone_stay_apart():
+    deduplicator = Deduplicator()
+    head_office = "+1 800 782 7282"
+    assert deduplicator.add(
+        dict(name="Starbucks", address="100 Main Street",
+             phone_number=head_office)) is None
+    assert deduplicator.add(
+        dict(name="Starbucks", address="250 Oak Avenue",
+             phone_number=head_office)) is None
+    # The same branch again, or one without an address, still matches
+    assert deduplicator.add(
+        dict(name="Starbucks", address="100 Main St",
+             phone_number=head_office)) == 0
+    assert deduplicator.add(
+        dict(name="Starbucks Coffee", phone_number=head_office)) == 0
+
+
+def test_unique_keeps_first_record_in_order():
+    records = [
+        place("0x1a", name="A"),
+        place("0x2b", name="B"),
+        place("0x1a", name="A again"),
+        dict(name="C", phone_number="5551234567"),
+    ]
+    deduplicator = Deduplicator()
+    assert [record["name"] for record in deduplicator.unique(records)] == [
+        "A", "B", "C"
+    ]
+    assert (deduplicator.records, deduplicator.duplicates) == (4, 1)
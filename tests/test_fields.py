@@ -0,0 +1,225 @@
+"""Field extraction against a saved place page.
+
+tests/fixtures/place.html is a place pane where Google renamed some of the
+classes the primary selectors use, so name, phone and the review fields are
+only found through their fallbacks and the website is missing altogether.
+The field specs are checked against it without a browser, through the
+selector subset in tests/dom.py. The end-to-end test serves it over HTTP
+and scrapes it with core.extract_business in Chromium; it is skipped when
+Playwright or its browser is not installed.
+"""
+import asyncio
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gmaps_scraper.fields import FIELD_SPECS, parse_fields
+from gmaps_scraper.fixture_server import (PHONE_HTML, PLACE_HTML, WEBSITE_HTML,
+                                          generate_businesses)
+from gmaps_scraper.selector_registry import (SelectorHealthError,
+                                             SelectorRegistry)
+from gmaps_scraper.tracing import Tracer
+from gmaps_scraper.waits import WaitStats
+
+from . import dom
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Raw values EXTRACT_FIELDS_JS reads from the fixture
+RAW = {
+    "name": "Blue Bottle Coffee",
+    "address": "1 Ferry Building, San Francisco, CA 94111",
+    "website": None,
+    "phone_number": "+1 510-653-3394",
+    "reviews_count": "(1,234)",
+    "reviews_average": "4.5 stars ",
+}
+
+# Which selector of each field hits on the fixture, in FIELD_SPECS order
+HITS = {
+    "name": [False, True, True],
+    "address": [True, True],
+    "website": [False, False],
+    "phone_number": [False, True],
+    "reviews_count": [False, True],
+    "reviews_average": [False, True],
+}
+
+EXPECTED = {
+    "name": "Blue Bottle Coffee",
+    "address": "1 Ferry Building, San Francisco, CA 94111",
+    "website": "",
+    "phone_number": "+1 510-653-3394",
+    "reviews_count": 1234,
+    "reviews_average": 4.5,
+}
+
+
+def counter(tracer, name, **labels):
+    return tracer.counters.get(name, {}).get(tuple(sorted(labels.items())),
+                                             0)
+
+
+@pytest.fixture(scope="module")
+def saved_page():
+    with open(os.path.join(FIXTURES, "place.html"), encoding="utf-8") as file:
+        return dom.parse(file.read())
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fixture_url():
+    """URL of the saved page on a local HTTP server"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                 functools.partial(FixtureHandler,
+                                                   directory=FIXTURES))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/place.html"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_field_specs_match_saved_page(saved_page):
+    raw, hits = dom.extract(saved_page, FIELD_SPECS)
+    assert hits == HITS
+    assert raw == RAW
+    assert parse_fields(raw, FIELD_SPECS) == EXPECTED
+
+
+def test_primary_selectors_match_fixture_server_page():
+    # The fixture server's place pane uses the markup the primary selectors
+    # expect, so benchmarks measure the primary path
+    business = generate_businesses("coffee", 1)[0]
+    html = PLACE_HTML.format(
+        name=business["name"],
+        rating=business["reviews_average"],
+        reviews=business["reviews_count"],
+        address=business["address"],
+        website=WEBSITE_HTML.format(website=business["website"]),
+        phone=PHONE_HTML.format(digits="5551234567",
+                                phone=business["phone_number"]),
+        photos="",
+        tiles="")
+    raw, hits = dom.extract(dom.parse(html), FIELD_SPECS)
+    assert all(hit[0] for hit in hits.values()), hits
+    values = parse_fields(raw, FIELD_SPECS)
+    assert {name: values[name] for name in business} == business
+
+
+def test_promoted_chains_keep_the_values(saved_page):
+    registry = SelectorRegistry(window=10)
+    chains = [registry.chain(spec) for spec in FIELD_SPECS]
+    for _ in range(10):
+        _, hits = dom.extract(saved_page, FIELD_SPECS, chains)
+        registry.record(FIELD_SPECS, chains, hits)
+    chains = [registry.chain(spec) for spec in FIELD_SPECS]
+    assert chains != [spec.selectors for spec in FIELD_SPECS]
+    raw, hits = dom.extract(saved_page, FIELD_SPECS, chains)
+    assert parse_fields(raw, FIELD_SPECS) == EXPECTED
+    # Promoted fallbacks now hit first
+    assert all(hit[0] for hit in hits.values() if any(hit))
+
+
+async def scrape_fixture(url, registry, tracer, wait_stats):
+    async_playwright = pytest.importorskip(
+        "playwright.async_api").async_playwright
+    from gmaps_scraper.core import extract_business
+    async with async_playwright() as playwright:
+        try:
+            browser = await playwright.chromium.launch(headless=True)
+        except Exception as e:
+            pytest.skip(
+                f"Chromium is not available: {str(e).splitlines()[0]}")
+        try:
+            page = await browser.new_page()
+            return await extract_business(page, url, wait_stats, tracer,
+                                          None, registry)
+        finally:
+            await browser.close()
+
+
+def test_extract_business_uses_fallbacks(fixture_url):
+    registry = SelectorRegistry()
+    tracer = Tracer()
+    wait_stats = WaitStats()
+    business = asyncio.run(
+        scrape_fixture(fixture_url, registry, tracer, wait_stats))
+
+    assert business.place_url == fixture_url
+    assert {name: getattr(business, name) for name in EXPECTED} == EXPECTED
+    assert wait_stats.steps["place"].waits == 1
+    assert wait_stats.steps["place"].timeouts == 0
+
+    for spec in FIELD_SPECS:
+        hits = [
+            registry.stats[spec.name][selector].hits
+            for selector in spec.selectors
+        ]
+        assert hits == [int(hit) for hit in HITS[spec.name]], spec.name
+        assert registry.fields[spec.name].hits == int(any(HITS[spec.name]))
+    assert counter(tracer,
+                   "selector_hits",
+                   field="name",
+                   selector="h1.DUwDvf") == 1
+    assert counter(tracer,
+                   "selector_misses",
+                   field="name",
+                   selector="h1.DUwDvf.lfPIob") == 1
+
+
+def test_parse_fields():
+    tracer = Tracer()
+    assert parse_fields(RAW, FIELD_SPECS, tracer) == EXPECTED
+    for spec in FIELD_SPECS:
+        assert counter(tracer, "field_lookups", field=spec.name) == 1
+    assert counter(tracer, "field_misses", field="website") == 1
+    assert counter(tracer, "field_misses", field="name") == 0
+
+
+def test_parse_fields_defaults_on_parse_errors():
+    tracer = Tracer()
+    raw = dict(RAW, reviews_count="(many)", reviews_average="")
+    values = parse_fields(raw, FIELD_SPECS, tracer)
+    assert values["reviews_count"] is None
+    assert values["reviews_average"] is None
+    assert counter(tracer, "field_parse_errors", field="reviews_count") == 1
+    assert counter(tracer, "field_misses", field="reviews_average") == 1
+
+
+def test_registry_promotes_fallbacks():
+    registry = SelectorRegistry(window=10)
+    chains = [registry.chain(spec) for spec in FIELD_SPECS]
+    for _ in range(10):
+        registry.record(FIELD_SPECS, chains, HITS)
+
+    name, phone = FIELD_SPECS[0], FIELD_SPECS[3]
+    assert registry.chain(name) == ('h1.DUwDvf', 'div[role="main"] h1',
+                                    'h1.DUwDvf.lfPIob')
+    assert registry.chain(phone) == phone.fallbacks + (phone.selector, )
+    assert registry.stats["name"]["h1.DUwDvf"].hits == 10
+    assert registry.stats["name"]["h1.DUwDvf.lfPIob"].hits == 0
+    assert registry.fields["website"].hits == 0
+    assert registry.failure is None
+
+
+def test_registry_fails_fast_without_required_field():
+    registry = SelectorRegistry(window=10)
+    chains = [registry.chain(spec) for spec in FIELD_SPECS]
+    hits = dict(HITS, name=[False, False, False])
+    with pytest.raises(SelectorHealthError):
+        for _ in range(10):
+            registry.record(FIELD_SPECS, chains, hits)
+    with pytest.raises(SelectorHealthError):
+        registry.check()